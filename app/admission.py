@@ -0,0 +1,127 @@
+"""
+Admission control for endpoints that enqueue dispatch work.
+
+Tracks the due-message backlog (pending messages plus unprocessed outbox
+events) and the number of in-process background tasks, and sheds
+non-critical enqueue requests with 429/503 + Retry-After when either is over
+budget, instead of letting work pile up inside the web worker.
+"""
+import functools
+import logging
+import threading
+import time
+from datetime import datetime
+
+from fastapi import BackgroundTasks, HTTPException
+
+from app.config import config
+from app.models import Message, MessageStatus, OutboxEvent
+
+logger = logging.getLogger(__name__)
+
+class AdmissionController:
+    def __init__(self):
+        self.enabled = config.ADMISSION_CONTROL_ENABLED
+        self.max_backlog = config.ADMISSION_MAX_PENDING_BACKLOG
+        self.max_background_tasks = config.ADMISSION_MAX_BACKGROUND_TASKS
+        self.retry_after = config.ADMISSION_RETRY_AFTER_SECONDS
+        self.refresh_seconds = config.ADMISSION_BACKLOG_REFRESH_SECONDS
+        self._lock = threading.Lock()
+        self._background_tasks = 0
+        self._backlog = 0
+        self._backlog_checked_at = 0.0
+        self._rejected = 0
+
+    def add_task(self, background_tasks: BackgroundTasks, func, *args, **kwargs):
+        """Schedule a background task and count it until it finishes"""
+        @functools.wraps(func)
+        def tracked(*task_args, **task_kwargs):
+            try:
+                return func(*task_args, **task_kwargs)
+            finally:
+                with self._lock:
+                    self._background_tasks -= 1
+
+        with self._lock:
+            self._background_tasks += 1
+        background_tasks.add_task(tracked, *args, **kwargs)
+
+    def pending_backlog(self) -> int:
+        """Due pending messages plus undispatched outbox events (refreshed at most every few seconds)"""
+        if time.monotonic() - self._backlog_checked_at < self.refresh_seconds:
+            return self._backlog
+
+        # One caller refreshes; the rest wait for it and reuse its count
+        with self._lock:
+            now = time.monotonic()
+            if now - self._backlog_checked_at < self.refresh_seconds:
+                return self._backlog
+
+            from app.database import SessionLocal
+            db = SessionLocal()
+            try:
+                # Messages merged into another send go out with their primary
+                due = db.query(Message.id).filter(
+                    Message.status == MessageStatus.PENDING,
+                    Message.coalesced_into_id == None,
+                    (Message.scheduled_for == None) | (Message.scheduled_for <= datetime.now())
+                )
+                due_messages = due.count()
+                # An API send has both a pending row and an outbox event; count it once
+                outbox_events = db.query(OutboxEvent).filter(
+                    OutboxEvent.processed_at == None,
+                    OutboxEvent.message_id.not_in(due.scalar_subquery())
+                ).count()
+                self._backlog = due_messages + outbox_events
+            except Exception as e:
+                logger.error(f"Error measuring dispatch backlog: {str(e)}")
+            finally:
+                self._backlog_checked_at = now
+                db.close()
+            return self._backlog
+
+    def check(self):
+        """Raise 429/503 with Retry-After if the caller should back off"""
+        if not self.enabled:
+            return
+
+        if self._background_tasks >= self.max_background_tasks:
+            self._reject()
+            logger.warning(f"Shedding request: {self._background_tasks} background tasks in flight")
+            raise HTTPException(
+                status_code=429,
+                detail="Too many background tasks in flight, please retry later",
+                headers={"Retry-After": str(self.retry_after)}
+            )
+
+        backlog = self.pending_backlog()
+        if backlog >= self.max_backlog:
+            self._reject()
+            logger.warning(f"Shedding request: dispatch backlog is {backlog} messages")
+            raise HTTPException(
+                status_code=503,
+                detail="Message dispatch backlog is full, please retry later",
+                headers={"Retry-After": str(self.retry_after)}
+            )
+
+    def snapshot(self) -> dict:
+        """Current admission state for the metrics endpoint"""
+        return {
+            "enabled": self.enabled,
+            "background_tasks": self._background_tasks,
+            "max_background_tasks": self.max_background_tasks,
+            "pending_backlog": self.pending_backlog(),
+            "max_pending_backlog": self.max_backlog,
+            "rejected_requests": self._rejected
+        }
+
+    def _reject(self):
+        with self._lock:
+            self._rejected += 1
+
+# Create singleton instance
+admission_controller = AdmissionController()
+
+def admission_guard():
+    """FastAPI dependency for non-critical enqueue endpoints"""
+    admission_controller.check()
@@ -1,19 +1,33 @@
 from fastapi import APIRouter, Depends, HTTPException, BackgroundTasks, Request as FastAPIRequest, Query
 from fastapi import Request
 from fastapi.security import HTTPBearer, HTTPAuthorizationCredentials
+from starlette.concurrency import run_in_threadpool
+from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.orm import Session
-from sqlalchemy import func, desc
+from sqlalchemy import func, desc, select
 from typing import List, Optional
 from datetime import datetime
 import json
 from pydantic import BaseModel
 
-from app.database import get_db
-from app.models import Patient, Appointment, Message, MessageTemplate, MessageType, MessageStatus, User
-from app.services.messaging import MessagingService
+from app.database import get_db, get_dispatch_db, get_async_db, get_async_read_db, read_router
+from app.cache import cache_service, cached
+from app.config import config
+from app.admission import admission_controller, admission_guard
+from app.audit_store import audit_store
+from app.pool_metrics import pool_monitor
+from app.pagination import combine_sources, paginate_async, empty_page
+from app.serialization import Expansion, json_response, model_serializer, shape_serializer
+from app.models import Patient, PatientStats, Appointment, Message, MessageTemplate, MessageType, MessageStatus, User, AuditLog, ArchivedMessage, ArchivedAuditLog
+from app.services.messaging import messaging_service
 from app.services.broadcast import broadcast_service
 from app.services.metrics import metrics_service
 from app.services.consent import consent_service
+from app.services.outbox import outbox_service
+from app.services.message_status import message_status_service
+from app.services.patient_stats import patient_stats_service
+from app.services.stat_counters import stat_counter_service
+from app.services.audit import audit_sink
 from app.scheduler import AppointmentScheduler, scheduler
 
 security = HTTPBearer(auto_error=False)
@@ -72,6 +86,49 @@ class AppointmentUpdate(BaseModel):
 # Create router
 router = APIRouter()
 
+# Row serializers for the list endpoints (columns selected as Core rows)
+patient_list_serializer = model_serializer(
+    Patient,
+    ["id", "first_name", "last_name", "phone_number", "email", "consent_sms"],
+    appointment_count=func.coalesce(PatientStats.appointment_count, 0),
+    last_appointment_date=PatientStats.last_appointment_date,
+    last_appointment_status=PatientStats.last_appointment_status,
+    message_count=func.coalesce(PatientStats.message_count, 0),
+    created_at=Patient.created_at
+)
+appointment_list_serializer = model_serializer(
+    Appointment,
+    ["id", "patient_id", "appointment_date", "status", "followup_required",
+     "followup_interval_days", "doctor_name", "appointment_type", "created_at"]
+)
+MESSAGE_LIST_FIELDS = ["id", "patient_id", "message_type", "status", "content", "sent_at", "created_at"]
+AUDIT_LOG_LIST_FIELDS = ["id", "action", "entity_type", "entity_id", "details", "created_at"]
+message_list_serializer = model_serializer(Message, MESSAGE_LIST_FIELDS)
+audit_log_list_serializer = model_serializer(AuditLog, AUDIT_LOG_LIST_FIELDS)
+# Same shapes over the archive tables, for include_archived=true
+archived_message_list_serializer = model_serializer(ArchivedMessage, MESSAGE_LIST_FIELDS)
+archived_audit_log_list_serializer = model_serializer(ArchivedAuditLog, AUDIT_LOG_LIST_FIELDS)
+
+# Related rows that list endpoints can embed with ?expand=
+patient_expansion_serializer = model_serializer(
+    Patient, ["id", "first_name", "last_name", "phone_number", "email"]
+)
+appointment_expansions = {
+    "patient": Expansion(Patient, Appointment.patient_id == Patient.id, patient_expansion_serializer),
+}
+template_expansion_serializer = model_serializer(MessageTemplate, ["id", "name", "message_type"])
+message_expansions = {
+    "patient": Expansion(Patient, Message.patient_id == Patient.id, patient_expansion_serializer),
+    "template": Expansion(MessageTemplate, Message.template_id == MessageTemplate.id, template_expansion_serializer),
+}
+archived_message_expansions = {
+    "patient": Expansion(Patient, ArchivedMessage.patient_id == Patient.id, patient_expansion_serializer),
+    "template": Expansion(MessageTemplate, ArchivedMessage.template_id == MessageTemplate.id, template_expansion_serializer),
+}
+
+FIELDS_DESCRIPTION = "Comma-separated fields to return (default: all)"
+INCLUDE_ARCHIVED_DESCRIPTION = "Also return rows moved to the archive by the retention job (slower)"
+
 # Simple authentication (for demo - use proper JWT in production)
 def verify_token(credentials: HTTPAuthorizationCredentials = Depends(security)):
     """Verify authentication token"""
@@ -292,8 +349,6 @@ def get_users(
             "total_pages": 0
         }
 
-# Initialize messaging service
-messaging_service = MessagingService()
 scheduler = AppointmentScheduler()
 
 # Patient endpoints
@@ -310,29 +365,25 @@ def create_patient(patient: PatientCreate, db: Session = Depends(get_db)):
         raise HTTPException(status_code=400, detail=str(e))
 
 @router.get("/patients/", response_model=dict)
-def get_patients(
+@json_response
+async def get_patients(
     page: int = Query(1, ge=1, description="Page number"),
     page_size: int = Query(50, ge=1, le=1000, description="Items per page"),
     search: Optional[str] = Query(None, description="Search by name or email"),
-    db: Session = Depends(get_db)
+    cursor: Optional[str] = Query(None, description="Keyset pagination: next_cursor from the previous page (empty to start)"),
+    fields: Optional[str] = Query(None, description=FIELDS_DESCRIPTION),
+    db: AsyncSession = Depends(get_async_read_db)
 ):
     """Get patients with appointment and activity information (paginated)"""
     from app.config import config
     
     # Optimize page_size
     page_size = min(page_size, config.MAX_PAGE_SIZE)
-    offset = (page - 1) * page_size
     
-    # Base query with optimized joins to avoid N+1 problem
-    query = db.query(
-        Patient,
-        func.count(Appointment.id).label('appointment_count'),
-        func.max(Appointment.appointment_date).label('last_appointment_date'),
-        func.count(Message.id).label('message_count')
-    ).outerjoin(
-        Appointment, Patient.id == Appointment.patient_id
-    ).outerjoin(
-        Message, Patient.id == Message.patient_id
+    # Single indexed read: counts and last appointment come from the patient_stats read model
+    serializer = shape_serializer(patient_list_serializer, fields, required=("id", "created_at"))
+    query = select(*serializer.columns).outerjoin(
+        PatientStats, PatientStats.patient_id == Patient.id
     )
     
     # Apply search filter if provided
@@ -344,69 +395,28 @@ def get_patients(
             (Patient.email.ilike(search_term))
         )
     
-    # Group by patient to aggregate counts
-    query = query.group_by(Patient.id)
-    
-    # Get total count for pagination
-    total_count = query.count()
-    
-    # Apply pagination
-    patients_data = query.order_by(desc(Patient.created_at)).offset(offset).limit(page_size).all()
-    
-    # Get last appointment status for each patient (optimized)
-    patient_ids = [p[0].id for p in patients_data]
-    last_appointments = {}
-    if patient_ids:
-        last_appts = db.query(
-            Appointment.patient_id,
-            Appointment.status,
-            Appointment.appointment_date
-        ).filter(
-            Appointment.patient_id.in_(patient_ids)
-        ).order_by(
-            desc(Appointment.appointment_date)
-        ).distinct(Appointment.patient_id).all()
-        
-        for appt in last_appts:
-            if appt.patient_id not in last_appointments:
-                last_appointments[appt.patient_id] = {
-                    'status': appt.status,
-                    'date': appt.appointment_date
-                }
-    
-    # Build response
-    result = []
-    for patient, appointment_count, last_appointment_date, message_count in patients_data:
-        last_appt_info = last_appointments.get(patient.id, {})
-        result.append({
-            "id": patient.id,
-            "first_name": patient.first_name,
-            "last_name": patient.last_name,
-            "phone_number": patient.phone_number,
-            "email": patient.email,
-            "consent_sms": patient.consent_sms,
-            "appointment_count": appointment_count or 0,
-            "last_appointment_date": last_appointment_date.isoformat() if last_appointment_date else None,
-            "last_appointment_status": last_appt_info.get('status'),
-            "message_count": message_count or 0,
-            "created_at": patient.created_at.isoformat() if patient.created_at else None,
-        })
-    
-    return {
-        "items": result,
-        "total": total_count,
-        "page": page,
-        "page_size": page_size,
-        "total_pages": (total_count + page_size - 1) // page_size
-    }
+    # Newest first by (created_at, id); keyset mode when a cursor is given
+    return await paginate_async(
+        db, query, Patient.created_at, Patient.id, page, page_size, cursor,
+        serialize=serializer,
+        cursor_key=lambda row: (row.created_at, row.id)
+    )
 
 @router.get("/patients/{patient_id}", response_model=PatientResponse)
-def get_patient(patient_id: int, db: Session = Depends(get_db)):
+@cached("patient:{patient_id}", ttl=config.CACHE_TTL_PATIENT)
+async def get_patient(patient_id: int, db: AsyncSession = Depends(get_async_db)):
     """Get a patient by ID"""
-    patient = db.query(Patient).filter(Patient.id == patient_id).first()
+    patient = await db.get(Patient, patient_id)
     if not patient:
         raise HTTPException(status_code=404, detail="Patient not found")
-    return patient
+    return {
+        "id": patient.id,
+        "first_name": patient.first_name,
+        "last_name": patient.last_name,
+        "phone_number": patient.phone_number,
+        "email": patient.email,
+        "consent_sms": patient.consent_sms
+    }
 
 # Appointment endpoints
 @router.post("/appointments/", response_model=dict)
@@ -422,89 +432,132 @@ async def create_appointment(
         # Get patient_email from query parameters
         patient_email = request.query_params.get("patient_email")
         
-        # Extract appointment data
-        patient_id = appointment_data.get("patient_id")
-        appointment_date_str = appointment_data.get("appointment_date")
-        followup_required = appointment_data.get("followup_required", True)
-        followup_interval_days = appointment_data.get("followup_interval_days", 180)
-        doctor_name = appointment_data.get("doctor_name")
-        appointment_type = appointment_data.get("appointment_type") or appointment_data.get("serviceType") or appointment_data.get("service_type")
-        
-        # Validate required fields
-        if not appointment_date_str:
-            raise HTTPException(status_code=400, detail="appointment_date is required")
-        
-        # Parse appointment date
-        if isinstance(appointment_date_str, str):
+        # The ORM work is blocking; keep it off the event loop
+        return await run_in_threadpool(_create_appointment, db, appointment_data, patient_email)
+    except HTTPException:
+        raise
+    except Exception as e:
+        raise HTTPException(status_code=400, detail=f"Failed to create appointment: {str(e)}")
+
+def _create_appointment(db: Session, appointment_data: dict, patient_email: Optional[str]) -> dict:
+    """Find or create the patient, then create the appointment and its reminders"""
+    # Extract appointment data
+    patient_id = appointment_data.get("patient_id")
+    appointment_date_str = appointment_data.get("appointment_date")
+    followup_required = appointment_data.get("followup_required", True)
+    followup_interval_days = appointment_data.get("followup_interval_days", 180)
+    doctor_name = appointment_data.get("doctor_name")
+    appointment_type = appointment_data.get("appointment_type") or appointment_data.get("serviceType") or appointment_data.get("service_type")
+    
+    # Validate required fields
+    if not appointment_date_str:
+        raise HTTPException(status_code=400, detail="appointment_date is required")
+    
+    # Parse appointment date
+    if isinstance(appointment_date_str, str):
+        try:
+            # Handle ISO format with or without timezone
+            if appointment_date_str.endswith('Z'):
+                appointment_date_str = appointment_date_str.replace('Z', '+00:00')
+            appointment_date = datetime.fromisoformat(appointment_date_str)
+        except ValueError:
             try:
-                # Handle ISO format with or without timezone
-                if appointment_date_str.endswith('Z'):
-                    appointment_date_str = appointment_date_str.replace('Z', '+00:00')
-                appointment_date = datetime.fromisoformat(appointment_date_str)
-            except ValueError:
-                try:
-                    # Try alternative parsing
-                    from dateutil import parser
-                    appointment_date = parser.parse(appointment_date_str)
-                except ImportError:
-                    raise HTTPException(status_code=400, detail="Invalid appointment_date format. Please use ISO format (YYYY-MM-DDTHH:MM:SS)")
-        elif isinstance(appointment_date_str, datetime):
-            appointment_date = appointment_date_str
-        else:
-            raise HTTPException(status_code=400, detail="Invalid appointment_date format")
-        
-        # Get phone number from appointment form (priority)
-        phone_number_from_form = appointment_data.get("phone_number")
-        import logging
-        logger = logging.getLogger(__name__)
-        if phone_number_from_form:
-            logger.info(f"Appointment booking: Phone number from form: {phone_number_from_form}")
-        
-        # Get patient - either by ID or email
-        patient = None
-        if patient_id:
-            patient = db.query(Patient).filter(Patient.id == patient_id).first()
-        elif patient_email:
-            patient = db.query(Patient).filter(Patient.email == patient_email).first()
-        
-        # If patient exists, update phone number if provided in form
-        if patient and phone_number_from_form:
-            if patient.phone_number != phone_number_from_form:
-                logger.info(f"Updating existing patient {patient.id} phone from {patient.phone_number} to {phone_number_from_form}")
-                patient.phone_number = phone_number_from_form
+                # Try alternative parsing
+                from dateutil import parser
+                appointment_date = parser.parse(appointment_date_str)
+            except ImportError:
+                raise HTTPException(status_code=400, detail="Invalid appointment_date format. Please use ISO format (YYYY-MM-DDTHH:MM:SS)")
+    elif isinstance(appointment_date_str, datetime):
+        appointment_date = appointment_date_str
+    else:
+        raise HTTPException(status_code=400, detail="Invalid appointment_date format")
+    
+    # Get phone number from appointment form (priority)
+    phone_number_from_form = appointment_data.get("phone_number")
+    import logging
+    logger = logging.getLogger(__name__)
+    if phone_number_from_form:
+        logger.info(f"Appointment booking: Phone number from form: {phone_number_from_form}")
+    
+    # Get patient - either by ID or email
+    patient = None
+    if patient_id:
+        patient = db.query(Patient).filter(Patient.id == patient_id).first()
+    elif patient_email:
+        patient = db.query(Patient).filter(Patient.email == patient_email).first()
+    
+    # If patient exists, update phone number if provided in form
+    if patient and phone_number_from_form:
+        if patient.phone_number != phone_number_from_form:
+            logger.info(f"Updating existing patient {patient.id} phone from {patient.phone_number} to {phone_number_from_form}")
+            patient.phone_number = phone_number_from_form
+            db.commit()
+            db.refresh(patient)
+            logger.info(f"Patient {patient.id} phone updated successfully to {patient.phone_number}")
+    
+    # If patient not found, try to create one from user account
+    if not patient and patient_email:
+        # Find user by email
+        user = db.query(User).filter(User.email == patient_email, User.role == "patient").first()
+        if user:
+            # Create patient profile from user data
+            name_parts = user.name.split(" ", 1) if user.name else ["", ""]
+            # Get phone number from appointment data (from booking form) - PRIORITY
+            phone_number = phone_number_from_form
+            if not phone_number:
+                # Try to get from user record
+                phone_number = user.phone_number
+            if not phone_number:
+                # Last resort: generate from email (but log warning)
+                logger.warning(f"Patient {patient_email} has no phone number. Generating placeholder.")
+                phone_number = f"+1{patient_email.replace('@', '').replace('.', '')[:15]}"
+            
+            # Ensure phone number is unique
+            existing_phone = db.query(Patient).filter(Patient.phone_number == phone_number).first()
+            if existing_phone:
+                # If phone exists, use a variation
+                phone_number = f"{phone_number}1"
+            
+            try:
+                # Log phone number being used
+                import logging
+                logger = logging.getLogger(__name__)
+                logger.info(f"Creating patient for {patient_email} with phone number: {phone_number}")
+                
+                patient = Patient(
+                    first_name=name_parts[0] or patient_email.split("@")[0],
+                    last_name=name_parts[1] if len(name_parts) > 1 else "",
+                    email=patient_email,
+                    phone_number=phone_number,
+                    consent_sms=True,
+                    consent_date=datetime.now(),
+                    consent_source="web_form"
+                )
+                db.add(patient)
                 db.commit()
                 db.refresh(patient)
-                logger.info(f"Patient {patient.id} phone updated successfully to {patient.phone_number}")
-        
-        # If patient not found, try to create one from user account
-        if not patient and patient_email:
-            # Find user by email
-            user = db.query(User).filter(User.email == patient_email, User.role == "patient").first()
-            if user:
-                # Create patient profile from user data
-                name_parts = user.name.split(" ", 1) if user.name else ["", ""]
-                # Get phone number from appointment data (from booking form) - PRIORITY
-                phone_number = phone_number_from_form
-                if not phone_number:
-                    # Try to get from user record
-                    phone_number = user.phone_number
-                if not phone_number:
-                    # Last resort: generate from email (but log warning)
-                    logger.warning(f"Patient {patient_email} has no phone number. Generating placeholder.")
-                    phone_number = f"+1{patient_email.replace('@', '').replace('.', '')[:15]}"
-                
-                # Ensure phone number is unique
-                existing_phone = db.query(Patient).filter(Patient.phone_number == phone_number).first()
-                if existing_phone:
-                    # If phone exists, use a variation
-                    phone_number = f"{phone_number}1"
+                logger.info(f"Patient created successfully: ID={patient.id}, Phone={patient.phone_number}")
+            except Exception as e:
+                # If patient creation fails (e.g., duplicate phone), try to find existing patient
+                import logging
+                logger = logging.getLogger(__name__)
+                logger.warning(f"Failed to create patient with phone {phone_number}: {str(e)}")
                 
-                try:
-                    # Log phone number being used
-                    import logging
-                    logger = logging.getLogger(__name__)
-                    logger.info(f"Creating patient for {patient_email} with phone number: {phone_number}")
-                    
+                # Try to find existing patient by email
+                existing_patient = db.query(Patient).filter(Patient.email == patient_email).first()
+                if existing_patient:
+                    logger.info(f"Found existing patient {existing_patient.id} for {patient_email}")
+                    patient = existing_patient
+                    # Update phone number if provided in appointment
+                    if phone_number and phone_number != existing_patient.phone_number:
+                        existing_patient.phone_number = phone_number
+                        db.commit()
+                        logger.info(f"Updated patient {existing_patient.id} phone to {phone_number}")
+                else:
+                    # Last resort: generate random phone
+                    import random
+                    phone_number = f"+1{random.randint(1000000000, 9999999999)}"
+                    logger.warning(f"Creating patient with generated phone: {phone_number}")
                     patient = Patient(
                         first_name=name_parts[0] or patient_email.split("@")[0],
                         last_name=name_parts[1] if len(name_parts) > 1 else "",
@@ -517,85 +570,50 @@ async def create_appointment(
                     db.add(patient)
                     db.commit()
                     db.refresh(patient)
-                    logger.info(f"Patient created successfully: ID={patient.id}, Phone={patient.phone_number}")
-                except Exception as e:
-                    # If patient creation fails (e.g., duplicate phone), try to find existing patient
-                    import logging
-                    logger = logging.getLogger(__name__)
-                    logger.warning(f"Failed to create patient with phone {phone_number}: {str(e)}")
-                    
-                    # Try to find existing patient by email
-                    existing_patient = db.query(Patient).filter(Patient.email == patient_email).first()
-                    if existing_patient:
-                        logger.info(f"Found existing patient {existing_patient.id} for {patient_email}")
-                        patient = existing_patient
-                        # Update phone number if provided in appointment
-                        if phone_number and phone_number != existing_patient.phone_number:
-                            existing_patient.phone_number = phone_number
-                            db.commit()
-                            logger.info(f"Updated patient {existing_patient.id} phone to {phone_number}")
-                    else:
-                        # Last resort: generate random phone
-                        import random
-                        phone_number = f"+1{random.randint(1000000000, 9999999999)}"
-                        logger.warning(f"Creating patient with generated phone: {phone_number}")
-                        patient = Patient(
-                            first_name=name_parts[0] or patient_email.split("@")[0],
-                            last_name=name_parts[1] if len(name_parts) > 1 else "",
-                            email=patient_email,
-                            phone_number=phone_number,
-                            consent_sms=True,
-                            consent_date=datetime.now(),
-                            consent_source="web_form"
-                        )
-                        db.add(patient)
-                        db.commit()
-                        db.refresh(patient)
-        
-        if not patient:
-            raise HTTPException(status_code=404, detail="Patient not found. Please ensure you have a patient profile or contact the clinic.")
-        
-        # Final verification: Log patient details being used
-        logger.info(f"Creating appointment for patient ID {patient.id}: {patient.first_name} {patient.last_name}, Phone: {patient.phone_number}, Email: {patient.email}")
-        
-        # Create appointment
-        db_appointment = Appointment(
-            patient_id=patient.id,
-            appointment_date=appointment_date,
-            status="scheduled",
-            followup_required=followup_required,
-            followup_interval_days=followup_interval_days,
-            doctor_name=doctor_name,
-            appointment_type=appointment_type
-        )
-        
-        db.add(db_appointment)
-        db.commit()
-        db.refresh(db_appointment)
-        
-        # Create staged reminders for the appointment
-        scheduler.create_appointment_reminders(db_appointment, db)
-        
-        # Log final patient phone number for verification
-        db.refresh(patient)
-        logger.info(f"Appointment {db_appointment.id} created. Patient {patient.id} final phone number: {patient.phone_number}")
-        
-        # Return appointment as dictionary for proper serialization
-        return {
-            "id": db_appointment.id,
-            "patient_id": db_appointment.patient_id,
-            "appointment_date": db_appointment.appointment_date.isoformat() if db_appointment.appointment_date else None,
-            "status": db_appointment.status,
-            "followup_required": db_appointment.followup_required,
-            "followup_interval_days": db_appointment.followup_interval_days,
-            "doctor_name": db_appointment.doctor_name,
-            "appointment_type": db_appointment.appointment_type,
-            "created_at": db_appointment.created_at.isoformat() if db_appointment.created_at else None,
-        }
-    except HTTPException:
-        raise
-    except Exception as e:
-        raise HTTPException(status_code=400, detail=f"Failed to create appointment: {str(e)}")
+    
+    if not patient:
+        raise HTTPException(status_code=404, detail="Patient not found. Please ensure you have a patient profile or contact the clinic.")
+    
+    # Final verification: Log patient details being used
+    logger.info(f"Creating appointment for patient ID {patient.id}: {patient.first_name} {patient.last_name}, Phone: {patient.phone_number}, Email: {patient.email}")
+    
+    # Create appointment
+    db_appointment = Appointment(
+        patient_id=patient.id,
+        appointment_date=appointment_date,
+        status="scheduled",
+        followup_required=followup_required,
+        followup_interval_days=followup_interval_days,
+        doctor_name=doctor_name,
+        appointment_type=appointment_type
+    )
+    
+    db.add(db_appointment)
+    db.commit()
+    db.refresh(db_appointment)
+    
+    # Create staged reminders for the appointment
+    scheduler.create_appointment_reminders(db_appointment, db)
+    
+    # Log final patient phone number for verification
+    db.refresh(patient)
+    logger.info(f"Appointment {db_appointment.id} created. Patient {patient.id} final phone number: {patient.phone_number}")
+    
+    # Phone number, appointments and reminders may all have changed
+    cache_service.clear_patient_cache(patient.id)
+    
+    # Return appointment as dictionary for proper serialization
+    return {
+        "id": db_appointment.id,
+        "patient_id": db_appointment.patient_id,
+        "appointment_date": db_appointment.appointment_date.isoformat() if db_appointment.appointment_date else None,
+        "status": db_appointment.status,
+        "followup_required": db_appointment.followup_required,
+        "followup_interval_days": db_appointment.followup_interval_days,
+        "doctor_name": db_appointment.doctor_name,
+        "appointment_type": db_appointment.appointment_type,
+        "created_at": db_appointment.created_at.isoformat() if db_appointment.created_at else None,
+    }
 
 @router.put("/appointments/{appointment_id}", response_model=dict)
 def update_appointment(
@@ -616,17 +634,23 @@ def update_appointment(
     # If appointment date changed, delete existing reminders and create new ones
     if appointment.appointment_date and appointment.appointment_date != db_appointment.appointment_date:
         # Delete existing reminders
-        db.query(Message).filter(
+        deleted_reminders = db.query(Message).filter(
             Message.appointment_id == appointment_id,
             Message.message_type == MessageType.APPOINTMENT_REMINDER,
             Message.status == MessageStatus.PENDING
         ).delete()
         
+        # Bulk deletes bypass the flush hooks that maintain patient_stats and the counters
+        if deleted_reminders:
+            patient_stats_service.refresh_patients(db, [db_appointment.patient_id])
+            stat_counter_service.record_deleted_messages(db, MessageStatus.PENDING, deleted_reminders)
+        
         # Create new reminders
         scheduler.create_appointment_reminders(db_appointment, db)
     
     db.commit()
     db.refresh(db_appointment)
+    cache_service.clear_patient_cache(db_appointment.patient_id)
     # Return appointment as dictionary for proper serialization
     return {
         "id": db_appointment.id,
@@ -641,7 +665,13 @@ def update_appointment(
     }
 
 @router.get("/appointments/", response_model=dict)
-def get_appointments(
+@json_response
+@cached(
+    "patient_appointments:{patient_id}",
+    ttl=config.CACHE_TTL_PATIENT_APPOINTMENTS,
+    condition=lambda params: params["patient_id"] is not None
+)
+async def get_appointments(
     patient_id: Optional[int] = None, 
     patient_email: Optional[str] = None,
     page: int = Query(1, ge=1, description="Page number"),
@@ -649,33 +679,33 @@ def get_appointments(
     status: Optional[str] = Query(None, description="Filter by status"),
     start_date: Optional[str] = Query(None, description="Filter by start date (ISO format)"),
     end_date: Optional[str] = Query(None, description="Filter by end date (ISO format)"),
-    db: Session = Depends(get_db)
+    cursor: Optional[str] = Query(None, description="Keyset pagination: next_cursor from the previous page (empty to start)"),
+    fields: Optional[str] = Query(None, description=FIELDS_DESCRIPTION),
+    expand: Optional[str] = Query(None, description="Embed related data: patient"),
+    db: AsyncSession = Depends(get_async_read_db)
 ):
     """Get appointments with pagination and filtering"""
     from app.config import config
     
     # Optimize page_size
     page_size = min(page_size, config.MAX_PAGE_SIZE)
-    offset = (page - 1) * page_size
     
-    query = db.query(Appointment)
+    serializer = shape_serializer(
+        appointment_list_serializer, fields, expand, appointment_expansions,
+        required=("id", "appointment_date")
+    )
+    query = serializer.apply_joins(select(*serializer.columns))
     
     # Apply filters
     if patient_id:
         query = query.filter(Appointment.patient_id == patient_id)
     elif patient_email:
         # Find patient by email and filter appointments
-        patient = db.query(Patient).filter(Patient.email == patient_email).first()
-        if patient:
-            query = query.filter(Appointment.patient_id == patient.id)
+        email_patient_id = await db.scalar(select(Patient.id).where(Patient.email == patient_email).limit(1))
+        if email_patient_id:
+            query = query.filter(Appointment.patient_id == email_patient_id)
         else:
-            return {
-                "items": [],
-                "total": 0,
-                "page": page,
-                "page_size": page_size,
-                "total_pages": 0
-            }
+            return empty_page(page, page_size, cursor)
     
     if status:
         query = query.filter(Appointment.status == status)
@@ -694,41 +724,17 @@ def get_appointments(
         except ValueError:
             pass
     
-    # Get total count
-    total_count = query.count()
-    
-    # Apply pagination and ordering
-    appointments = query.order_by(desc(Appointment.appointment_date)).offset(offset).limit(page_size).all()
-    
-    # Convert SQLAlchemy models to dictionaries for serialization
-    appointments_list = [
-        {
-            "id": apt.id,
-            "patient_id": apt.patient_id,
-            "appointment_date": apt.appointment_date.isoformat() if apt.appointment_date else None,
-            "status": apt.status,
-            "followup_required": apt.followup_required,
-            "followup_interval_days": apt.followup_interval_days,
-            "doctor_name": apt.doctor_name,
-            "appointment_type": apt.appointment_type,
-            "created_at": apt.created_at.isoformat() if apt.created_at else None,
-        }
-        for apt in appointments
-    ]
-    
-    return {
-        "items": appointments_list,
-        "total": total_count,
-        "page": page,
-        "page_size": page_size,
-        "total_pages": (total_count + page_size - 1) // page_size
-    }
+    # Latest first by (appointment_date, id); keyset mode when a cursor is given
+    return await paginate_async(
+        db, query, Appointment.appointment_date, Appointment.id, page, page_size, cursor,
+        serialize=serializer,
+        cursor_key=lambda apt: (apt.appointment_date, apt.id)
+    )
 
 @router.put("/appointments/{appointment_id}/status", response_model=dict)
 def update_appointment_status(
     appointment_id: int, 
     status_data: dict, 
-    background_tasks: BackgroundTasks,
     db: Session = Depends(get_db)
 ):
     """Update appointment status and trigger post-visit message if completed"""
@@ -737,7 +743,7 @@ def update_appointment_status(
         raise HTTPException(status_code=404, detail="Appointment not found")
     
     appointment.status = status_data.get("status")
-    db.commit()
+    post_visit_queued = False
     
     # If appointment is completed, send post-visit message
     if appointment.status == "completed":
@@ -765,15 +771,15 @@ def update_appointment_status(
                 scheduled_for=datetime.now()
             )
             db.add(message)
-            db.commit()
-            db.refresh(message)
             
-            # Process message in background
-            background_tasks.add_task(
-                messaging_service.process_message,
-                message.id,
-                context
-            )
+            # Dispatch through the outbox, committed atomically with the status change
+            outbox_service.enqueue(db, message, context)
+            post_visit_queued = True
+    
+    db.commit()
+    if post_visit_queued:
+        outbox_service.notify()
+    cache_service.clear_patient_cache(appointment.patient_id)
     
     # Return appointment as dictionary for proper serialization
     return {
@@ -797,14 +803,16 @@ def create_template(template_data: dict, db: Session = Depends(get_db)):
         db.add(template)
         db.commit()
         db.refresh(template)
+        cache_service.invalidate("templates")
         return {"success": True, "template_id": template.id}
     except Exception as e:
         raise HTTPException(status_code=400, detail=str(e))
 
 @router.get("/templates/", response_model=List[dict])
-def get_templates(db: Session = Depends(get_db)):
+@cached("templates", ttl=config.CACHE_TTL_TEMPLATES)
+async def get_templates(db: AsyncSession = Depends(get_async_read_db)):
     """Get all message templates"""
-    templates = db.query(MessageTemplate).all()
+    templates = (await db.execute(select(MessageTemplate))).scalars().all()
     return [
         {
             "id": t.id,
@@ -819,7 +827,7 @@ def get_templates(db: Session = Depends(get_db)):
     ]
 
 # Broadcast endpoints
-@router.post("/broadcasts/", response_model=dict)
+@router.post("/broadcasts/", response_model=dict, dependencies=[Depends(admission_guard)])
 def create_broadcast(broadcast_data: dict, background_tasks: BackgroundTasks, db: Session = Depends(get_db)):
     """Create a new broadcast campaign"""
     try:
@@ -837,27 +845,41 @@ def create_broadcast(broadcast_data: dict, background_tasks: BackgroundTasks, db
         
         if not broadcast:
             raise HTTPException(status_code=400, detail="Failed to create broadcast")
+        cache_service.invalidate("broadcasts")
         
         # Process broadcast in background
-        background_tasks.add_task(broadcast_service.process_broadcast, broadcast.id, db)
+        # On its own dispatch session (the request's session is closed by then)
+        admission_controller.add_task(background_tasks, broadcast_service.process_broadcast, broadcast.id)
         
         return {"success": True, "broadcast_id": broadcast.id}
     except Exception as e:
         raise HTTPException(status_code=400, detail=str(e))
 
 @router.get("/broadcasts/", response_model=List[dict])
-def get_broadcasts(db: Session = Depends(get_db)):
+@cached("broadcasts", ttl=config.CACHE_TTL_BROADCASTS)
+async def get_broadcasts(db: AsyncSession = Depends(get_async_read_db)):
     """Get all broadcasts"""
     from app.models import Broadcast, MessageTemplate
-    broadcasts = db.query(Broadcast).all()
+    broadcasts = (await db.execute(select(Broadcast))).scalars().all()
+    
+    async def load_template_names(ids):
+        result = await db.execute(select(MessageTemplate.id, MessageTemplate.name).where(MessageTemplate.id.in_(ids)))
+        return dict(result.all())
+    
+    # Template names for the whole list from cache, one query for the misses
+    template_names = await cache_service.ahydrate(
+        "template_name",
+        [b.template_id for b in broadcasts],
+        load_template_names,
+        ttl=config.CACHE_TTL_TEMPLATES
+    )
     result = []
     for b in broadcasts:
-        template = db.query(MessageTemplate).filter(MessageTemplate.id == b.template_id).first() if b.template_id else None
         result.append({
             "id": b.id,
             "name": b.name,
             "template_id": b.template_id,
-            "template_name": template.name if template else None,
+            "template_name": template_names.get(b.template_id),
             "filter_criteria": b.filter_criteria,
             "scheduled_at": b.scheduled_at.isoformat() if b.scheduled_at else None,
             "status": b.status,
@@ -869,9 +891,9 @@ def get_broadcasts(db: Session = Depends(get_db)):
     return result
 
 @router.get("/broadcasts/{broadcast_id}", response_model=dict)
-def get_broadcast(broadcast_id: int, db: Session = Depends(get_db)):
+async def get_broadcast(broadcast_id: int, db: AsyncSession = Depends(get_async_db)):
     """Get broadcast details"""
-    stats = metrics_service.get_broadcast_stats(db, broadcast_id)
+    stats = await db.run_sync(metrics_service.get_broadcast_stats, broadcast_id)
     if not stats:
         raise HTTPException(status_code=404, detail="Broadcast not found")
     return stats
@@ -880,11 +902,14 @@ def get_broadcast(broadcast_id: int, db: Session = Depends(get_db)):
 @router.post("/webhooks/twilio")
 async def twilio_webhook(request: Request, db: Session = Depends(get_db)):
     """Handle Twilio webhook for delivery status and replies"""
-    from fastapi import Form
-    
     # Twilio sends form-encoded data, so we need to handle it properly
     form_data = await request.form()
     
+    # Status updates and consent changes also invalidate the cache and write
+    # audit events (synchronously for durable actions); keep them off the event loop
+    return await run_in_threadpool(_handle_twilio_webhook, db, dict(form_data))
+
+def _handle_twilio_webhook(db: Session, form_data: dict) -> dict:
     # Extract data from webhook
     message_sid = form_data.get("MessageSid") or form_data.get("SmsSid")
     message_status = form_data.get("MessageStatus") or form_data.get("SmsStatus")
@@ -894,18 +919,23 @@ async def twilio_webhook(request: Request, db: Session = Depends(get_db)):
         body = body.strip().upper()
     
     # Update message status if we have the SID
+    # Single conditional UPDATE per callback; coalesced messages share the SID
     if message_sid:
-        message = db.query(Message).filter(Message.provider_message_id == message_sid).first()
-        if message:
-            if message_status == "delivered":
-                message.status = MessageStatus.DELIVERED
-                message.delivered_at = datetime.now()
-            elif message_status in ["failed", "undelivered"]:
-                message.status = MessageStatus.FAILED
-                error_msg = form_data.get("ErrorMessage", "Unknown error")
-                message.error_message = error_msg
-            
-            db.commit()
+        updated = 0
+        if message_status == "delivered":
+            updated = message_status_service.apply_callback(
+                db, message_sid, MessageStatus.DELIVERED,
+                delivered_at=datetime.now()
+            )
+        elif message_status in ["failed", "undelivered"]:
+            error_msg = form_data.get("ErrorMessage", "Unknown error")
+            updated = message_status_service.apply_callback(
+                db, message_sid, MessageStatus.FAILED,
+                error_message=error_msg
+            )
+        if updated is None:
+            # Arrived before the send recorded the SID: kept for replay, but ask the provider to retry too
+            raise HTTPException(status_code=503, detail=f"Unknown message SID {message_sid}; retry later")
     
     # Handle opt-out/opt-in keywords (for incoming SMS replies)
     if from_number and body:
@@ -919,34 +949,71 @@ async def twilio_webhook(request: Request, db: Session = Depends(get_db)):
     return {"success": True}
 
 # Metrics endpoints
+# Dashboard metrics are aggregates over many rows; they are served from cache
+# and only expire by TTL
 @router.get("/metrics/messages", response_model=dict)
-def get_message_metrics(
+@cached("metrics:messages", ttl=config.CACHE_TTL_METRICS)
+async def get_message_metrics(
     start_date: Optional[str] = None,
     end_date: Optional[str] = None,
-    db: Session = Depends(get_db)
+    include_archived: bool = Query(False, description=INCLUDE_ARCHIVED_DESCRIPTION),
+    db: AsyncSession = Depends(get_async_read_db)
 ):
     """Get message metrics for a date range"""
     start_dt = datetime.fromisoformat(start_date) if start_date else None
     end_dt = datetime.fromisoformat(end_date) if end_date else None
-    return metrics_service.get_message_metrics(db, start_dt, end_dt)
+    return await db.run_sync(metrics_service.get_message_metrics, start_dt, end_dt, include_archived)
 
 @router.get("/metrics/opt-out-rate", response_model=dict)
-def get_opt_out_rate(db: Session = Depends(get_db)):
+@cached("metrics:opt_out_rate", ttl=config.CACHE_TTL_METRICS)
+async def get_opt_out_rate(db: AsyncSession = Depends(get_async_read_db)):
     """Get current opt-out rate"""
-    rate = metrics_service.get_opt_out_rate(db)
+    rate = await db.run_sync(metrics_service.get_opt_out_rate)
     return {"opt_out_rate": rate}
 
 @router.get("/metrics/recall-effectiveness", response_model=dict)
-def get_recall_effectiveness(
+@cached("metrics:recall_effectiveness", ttl=config.CACHE_TTL_METRICS)
+async def get_recall_effectiveness(
     days_window: Optional[int] = 30,
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_async_read_db)
 ):
     """Get recall reminder effectiveness metrics"""
-    return metrics_service.get_recall_effectiveness(db, days_window)
+    return await db.run_sync(metrics_service.get_recall_effectiveness, days_window)
+
+@router.get("/metrics/admission", response_model=dict)
+def get_admission_metrics():
+    """Get dispatch backlog and load-shedding state"""
+    return admission_controller.snapshot()
+
+@router.get("/dashboard/summary", response_model=dict)
+@cached("dashboard:summary", ttl=config.CACHE_TTL_DASHBOARD)
+async def get_dashboard_summary(db: AsyncSession = Depends(get_async_read_db)):
+    """Get dashboard tile values (patients, today's/upcoming appointments, message statuses)"""
+    return await db.run_sync(stat_counter_service.summary)
+
+@router.get("/metrics/db-pool", response_model=dict)
+def get_db_pool_metrics():
+    """Get connection-pool checkout waits, timeouts and in-use/overflow gauges per engine"""
+    return pool_monitor.snapshot()
+
+@router.get("/metrics/audit", response_model=dict)
+def get_audit_metrics():
+    """Get audit writer queue depth and write/flush counters"""
+    return audit_sink.snapshot()
+
+@router.get("/metrics/replicas", response_model=dict)
+def get_replica_metrics():
+    """Get read-replica health, lag and read routing counts"""
+    return read_router.snapshot()
+
+@router.get("/metrics/cache", response_model=dict)
+def get_cache_metrics():
+    """Get hit/miss counters per cache tier"""
+    return cache_service.stats()
 
 # Message endpoints
-@router.post("/messages/send", response_model=dict)
-def send_message(message_data: MessageSend, background_tasks: BackgroundTasks, db: Session = Depends(get_db)):
+@router.post("/messages/send", response_model=dict, dependencies=[Depends(admission_guard)])
+def send_message(message_data: MessageSend, db: Session = Depends(get_db)):
     """Send a message to a patient"""
     try:
         # Get patient and template
@@ -997,15 +1064,12 @@ def send_message(message_data: MessageSend, background_tasks: BackgroundTasks, d
             scheduled_for=datetime.now()
         )
         db.add(message)
-        db.commit()
-        db.refresh(message)
         
-        # Process in background
-        background_tasks.add_task(
-            messaging_service.process_message,
-            message.id,
-            context
-        )
+        # Dispatch through the outbox, committed atomically with the message
+        outbox_service.enqueue(db, message, context)
+        db.commit()
+        outbox_service.notify()
+        cache_service.invalidate(f"patient_messages:{patient.id}")
         
         return {"success": True, "message_id": message.id}
     except HTTPException:
@@ -1014,126 +1078,127 @@ def send_message(message_data: MessageSend, background_tasks: BackgroundTasks, d
         raise HTTPException(status_code=400, detail=str(e))
 
 @router.get("/messages/", response_model=dict)
-def get_messages(
+@json_response
+@cached(
+    "patient_messages:{patient_id}",
+    ttl=config.CACHE_TTL_PATIENT_MESSAGES,
+    condition=lambda params: params["patient_id"] is not None
+)
+async def get_messages(
     patient_id: Optional[int] = None, 
     patient_email: Optional[str] = None,
     page: int = Query(1, ge=1, description="Page number"),
     page_size: int = Query(50, ge=1, le=1000, description="Items per page"),
     status: Optional[str] = Query(None, description="Filter by status"),
     message_type: Optional[str] = Query(None, description="Filter by message type"),
-    db: Session = Depends(get_db)
+    cursor: Optional[str] = Query(None, description="Keyset pagination: next_cursor from the previous page (empty to start)"),
+    fields: Optional[str] = Query(None, description=FIELDS_DESCRIPTION),
+    expand: Optional[str] = Query(None, description="Embed related data: patient, template"),
+    include_archived: bool = Query(False, description=INCLUDE_ARCHIVED_DESCRIPTION),
+    db: AsyncSession = Depends(get_async_read_db)
 ):
     """Get messages with pagination and filtering"""
     from app.config import config
     
     # Optimize page_size
     page_size = min(page_size, config.MAX_PAGE_SIZE)
-    offset = (page - 1) * page_size
-    
-    query = db.query(Message)
     
-    # Apply filters
-    if patient_id:
-        query = query.filter(Message.patient_id == patient_id)
-    elif patient_email:
+    if patient_email and not patient_id:
         # Find patient by email and filter messages
-        patient = db.query(Patient).filter(Patient.email == patient_email).first()
-        if patient:
-            query = query.filter(Message.patient_id == patient.id)
-        else:
-            return {
-                "items": [],
-                "total": 0,
-                "page": page,
-                "page_size": page_size,
-                "total_pages": 0
-            }
+        email_patient_id = await db.scalar(select(Patient.id).where(Patient.email == patient_email).limit(1))
+        if not email_patient_id:
+            return empty_page(page, page_size, cursor)
     
-    if status:
-        query = query.filter(Message.status == status)
-    
-    if message_type:
-        query = query.filter(Message.message_type == message_type)
-    
-    # Get total count
-    total_count = query.count()
+    sources = [(Message, message_list_serializer, message_expansions)]
+    if include_archived:
+        sources.append((ArchivedMessage, archived_message_list_serializer, archived_message_expansions))
     
-    # Apply pagination and ordering
-    messages = query.order_by(desc(Message.created_at)).offset(offset).limit(page_size).all()
+    queries = []
+    for model, base_serializer, expansions in sources:
+        serializer = shape_serializer(
+            base_serializer, fields, expand, expansions,
+            required=("id", "created_at")
+        )
+        query = serializer.apply_joins(select(*serializer.columns))
+        
+        # Apply filters
+        if patient_id:
+            query = query.filter(model.patient_id == patient_id)
+        elif patient_email:
+            query = query.filter(model.patient_id == email_patient_id)
+        
+        if status:
+            query = query.filter(model.status == status)
+        
+        if message_type:
+            query = query.filter(model.message_type == message_type)
+        queries.append(query)
     
-    return {
-        "items": [
-            {
-                "id": m.id,
-                "patient_id": m.patient_id,
-                "message_type": m.message_type.value if hasattr(m.message_type, 'value') else str(m.message_type),
-                "status": m.status.value if hasattr(m.status, 'value') else str(m.status),
-                "content": m.content,
-                "sent_at": m.sent_at.isoformat() if m.sent_at else None,
-                "created_at": m.created_at.isoformat() if m.created_at else None
-            }
-            for m in messages
-        ],
-        "total": total_count,
-        "page": page,
-        "page_size": page_size,
-        "total_pages": (total_count + page_size - 1) // page_size
-    }
+    # Newest first by (created_at, id); keyset mode when a cursor is given.
+    # The sources share one column layout, so either serializer reads the rows
+    query, sort_column, id_column = combine_sources(queries)
+    return await paginate_async(
+        db, query, sort_column, id_column, page, page_size, cursor,
+        serialize=serializer,
+        cursor_key=lambda m: (m.created_at, m.id)
+    )
 
 # Audit logs endpoint
 @router.get("/audit-logs/", response_model=dict)
-def get_audit_logs(
+@json_response
+async def get_audit_logs(
     page: int = Query(1, ge=1, description="Page number"),
     page_size: int = Query(100, ge=1, le=1000, description="Items per page"),
     action: Optional[str] = Query(None, description="Filter by action"),
     entity_type: Optional[str] = Query(None, description="Filter by entity type"),
-    db: Session = Depends(get_db)
+    cursor: Optional[str] = Query(None, description="Keyset pagination: next_cursor from the previous page (empty to start)"),
+    fields: Optional[str] = Query(None, description=FIELDS_DESCRIPTION),
+    include_archived: bool = Query(False, description=INCLUDE_ARCHIVED_DESCRIPTION),
+    db: AsyncSession = Depends(get_async_read_db)
 ):
     """Get audit logs with pagination"""
-    from app.models import AuditLog
     from app.config import config
     
     # Optimize page_size
     page_size = min(page_size, config.MAX_PAGE_SIZE)
-    offset = (page - 1) * page_size
-    
-    query = db.query(AuditLog)
-    
-    # Apply filters
-    if action:
-        query = query.filter(AuditLog.action == action)
-    if entity_type:
-        query = query.filter(AuditLog.entity_type == entity_type)
-    
-    # Get total count
-    total_count = query.count()
+
+    if config.AUDIT_BACKEND == "jsonl":
+        # Served from the segment store; it has no archive, so include_archived changes nothing
+        serializer = shape_serializer(audit_log_list_serializer, fields, required=("id", "created_at"))
+        return await run_in_threadpool(
+            audit_store.page, action, entity_type, page, page_size, cursor, serializer.keys
+        )
+
+    sources = [(AuditLog, audit_log_list_serializer)]
+    if include_archived:
+        sources.append((ArchivedAuditLog, archived_audit_log_list_serializer))
     
-    # Apply pagination and ordering
-    logs = query.order_by(desc(AuditLog.created_at)).offset(offset).limit(page_size).all()
+    queries = []
+    for model, base_serializer in sources:
+        serializer = shape_serializer(base_serializer, fields, required=("id", "created_at"))
+        query = select(*serializer.columns)
+        
+        # Apply filters
+        if action:
+            query = query.filter(model.action == action)
+        if entity_type:
+            query = query.filter(model.entity_type == entity_type)
+        queries.append(query)
     
-    return {
-        "items": [
-            {
-                "id": log.id,
-                "action": log.action,
-                "entity_type": log.entity_type,
-                "entity_id": log.entity_id,
-                "details": log.details,
-                "created_at": log.created_at.isoformat() if log.created_at else None
-            }
-            for log in logs
-        ],
-        "total": total_count,
-        "page": page,
-        "page_size": page_size,
-        "total_pages": (total_count + page_size - 1) // page_size
-    }
+    # Newest first by (created_at, id); keyset mode when a cursor is given.
+    # The sources share one column layout, so either serializer reads the rows
+    query, sort_column, id_column = combine_sources(queries)
+    return await paginate_async(
+        db, query, sort_column, id_column, page, page_size, cursor,
+        serialize=serializer,
+        cursor_key=lambda log: (log.created_at, log.id)
+    )
 
 # Manual message processing endpoint (for testing/admin)
 @router.post("/messages/process-pending")
 def process_pending_messages(
     force_immediate: bool = Query(False, description="Process all pending messages immediately, ignoring scheduled_for dates"),
-    db: Session = Depends(get_db)
+    db: Session = Depends(get_dispatch_db)
 ):
     """Manually trigger processing of pending messages
     
@@ -0,0 +1,468 @@
+"""
+Append-only JSONL audit log store (AUDIT_BACKEND=jsonl).
+
+Audit events are appended as JSON lines to the active segment file in
+AUDIT_LOG_DIR instead of being inserted into audit_logs, so audit volume
+(message sends, delivery webhooks) never reaches the OLTP database. Once the
+active segment grows past AUDIT_SEGMENT_MAX_BYTES or gets older than
+AUDIT_SEGMENT_MAX_AGE_HOURS it is sealed: compressed with one of the
+compressors from app/serialization.py, after which the raw file is removed.
+
+Every segment has a small sidecar index (<segment>.idx.json) with its id
+range, time range and event counts per (action, entity_type). Queries use
+the indexes to skip segments that can't match, to compute totals without
+reading events and to step over whole segments for offset pages. The
+indexes are cached in memory: the directory is only listed again when the
+token in .generation changes (a segment was created, sealed or purged, by
+any process), and otherwise only the active segment's index is re-read, when
+the segment has grown past the size it records. Only the
+segments holding the requested page are read, through mmap; sealed segments
+are decompressed straight from the mapping, and the last few are kept
+decompressed in memory for the following pages.
+
+Appends hold an exclusive flock on AUDIT_LOG_DIR/.lock, so worker processes
+can share one directory. Ids are assigned under the lock in append order,
+and results are newest first by id (which can differ slightly from
+created_at order across workers). If a process dies between appending and
+updating the index, the next append re-indexes the unindexed tail and drops
+a torn last line.
+"""
+import json
+import logging
+import mmap
+import os
+import threading
+import time
+from collections import OrderedDict
+from contextlib import contextmanager
+from datetime import datetime
+from typing import Dict, Iterator, List, Optional, Tuple
+
+from app.config import config
+from app.pagination import decode_cursor, page_from_rows
+from app.serialization import ORJSON_AVAILABLE, available_compressors
+
+logger = logging.getLogger(__name__)
+
+# Optional cross-process locking (not available on Windows)
+try:
+    import fcntl
+    FCNTL_AVAILABLE = True
+except ImportError:
+    FCNTL_AVAILABLE = False
+
+if ORJSON_AVAILABLE:
+    import orjson
+
+SEGMENT_PREFIX = "segment-"
+INDEX_SUFFIX = ".idx.json"
+RAW_SUFFIX = ".jsonl"
+COUNT_KEY_SEPARATOR = "\t"  # counts are keyed "<action>\t<entity_type>"
+GENERATION_FILE = ".generation"  # Replaced whenever the set of segments changes
+
+def _dumps(value) -> str:
+    # Compact and ASCII-only, so the query prefilter can match encoded fields byte for byte
+    return json.dumps(value, separators=(",", ":"))
+
+def _loads(line: bytes) -> dict:
+    return orjson.loads(line) if ORJSON_AVAILABLE else json.loads(line)
+
+def _copy_index(index: dict) -> dict:
+    return {**index, "counts": dict(index["counts"])}
+
+def _lines_reversed(buffer, size: int) -> Iterator[bytes]:
+    """Lines of buffer[:size], last first"""
+    end = size
+    while end > 0:
+        start = buffer.rfind(b"\n", 0, end - 1) + 1
+        line = buffer[start:end]
+        if line.strip():
+            yield line
+        end = start
+
+class JsonlAuditStore:
+    def __init__(
+        self,
+        directory: str,
+        max_segment_bytes: int,
+        max_segment_age_seconds: int,
+        compression: str = "auto",
+        fsync: bool = False
+    ):
+        self.directory = directory
+        self.max_segment_bytes = max_segment_bytes
+        self.max_segment_age_seconds = max_segment_age_seconds
+        self.fsync = fsync
+
+        compressors = available_compressors()
+        if compression == "none":
+            self.compressor = None
+        elif compression == "auto":
+            self.compressor = next(iter(compressors.values()))
+        elif compression in compressors:
+            self.compressor = compressors[compression]
+        else:
+            logger.warning(f"Audit segment compression '{compression}' not available, using zlib")
+            self.compressor = compressors["zlib"]
+        self._compressors = compressors
+
+        self._lock = threading.Lock()  # Appends within this process; flock covers other processes
+        self._segment_cache: "OrderedDict[str, bytes]" = OrderedDict()  # Decompressed sealed segments
+        self._segment_cache_size = 4
+        self._cache_lock = threading.Lock()
+
+        # Cached segment indexes, oldest first (see _load_indexes)
+        self._indexes: List[dict] = []
+        self._generation = None  # GENERATION_FILE token when _indexes was listed
+        self._index_lock = threading.Lock()
+
+    # Writing
+
+    def append(self, events: List[dict]) -> int:
+        """Append audit events (action, entity_type, entity_id, details, created_at)"""
+        if not events:
+            return 0
+        with self._lock, self._directory_lock():
+            index = self._writable_index()
+            lines = []
+            for event in events:
+                created_at = event.get("created_at") or datetime.now()
+                record = {
+                    "id": index["last_id"] + 1,
+                    "action": event["action"],
+                    "entity_type": event.get("entity_type"),
+                    "entity_id": event.get("entity_id"),
+                    "details": event.get("details"),
+                    "created_at": created_at.isoformat() if isinstance(created_at, datetime) else created_at
+                }
+                lines.append((_dumps(record) + "\n").encode())
+                self._index_record(index, record)
+
+            data = b"".join(lines)
+            with open(self._path(index["segment"]), "ab") as f:
+                f.write(data)
+                f.flush()
+                if self.fsync:
+                    os.fsync(f.fileno())
+            index["bytes"] += len(data)
+            self._write_index(index)
+        return len(events)
+
+    def _writable_index(self) -> dict:
+        """Index of the active segment, sealing it first if it is full or too old"""
+        if not os.path.exists(self._path(GENERATION_FILE)):
+            # Directory written before the index cache existed
+            self._bump_generation()
+        indexes = self._load_indexes()
+        # Copied: the cached index is shared with concurrent readers
+        latest = _copy_index(indexes[-1]) if indexes else None
+        if latest is not None and not latest["sealed"]:
+            self._recover(latest)
+            if not self._should_seal(latest):
+                return latest
+            self._seal(latest)
+
+        last_id = latest["last_id"] if latest else 0
+        index = {
+            "segment": f"{SEGMENT_PREFIX}{last_id + 1:012d}{RAW_SUFFIX}",
+            "first_id": last_id + 1,
+            "last_id": last_id,
+            "count": 0,
+            "bytes": 0,
+            "min_created_at": None,
+            "max_created_at": None,
+            "opened_at": time.time(),
+            "sealed": False,
+            "compression": None,
+            "counts": {}
+        }
+        open(self._path(index["segment"]), "ab").close()
+        self._write_index(index)
+        self._bump_generation()
+        return index
+
+    def _should_seal(self, index: dict) -> bool:
+        if index["bytes"] >= self.max_segment_bytes:
+            return True
+        return index["count"] > 0 and time.time() - index["opened_at"] >= self.max_segment_age_seconds
+
+    def _index_record(self, index: dict, record: dict):
+        index["last_id"] = record["id"]
+        index["count"] += 1
+        created_at = record["created_at"]
+        if created_at:
+            if index["min_created_at"] is None or created_at < index["min_created_at"]:
+                index["min_created_at"] = created_at
+            if index["max_created_at"] is None or created_at > index["max_created_at"]:
+                index["max_created_at"] = created_at
+        key = f"{record['action']}{COUNT_KEY_SEPARATOR}{record['entity_type'] or ''}"
+        index["counts"][key] = index["counts"].get(key, 0) + 1
+
+    def _recover(self, index: dict):
+        """Index lines appended after the last index update; drop a torn last line"""
+        path = self._path(index["segment"])
+        size = os.path.getsize(path) if os.path.exists(path) else 0
+        if size == index["bytes"]:
+            return
+        if size < index["bytes"]:
+            logger.error(f"Audit segment {index['segment']} is shorter than its index; re-indexing it")
+            index.update({"last_id": index["first_id"] - 1, "count": 0, "bytes": 0, "counts": {},
+                          "min_created_at": None, "max_created_at": None})
+        with open(path, "rb") as f:
+            f.seek(index["bytes"])
+            tail = f.read()
+        complete = tail[:tail.rfind(b"\n") + 1]
+        for line in complete.splitlines():
+            if line.strip():
+                self._index_record(index, _loads(line))
+        index["bytes"] += len(complete)
+        if len(complete) < len(tail):
+            with open(path, "r+b") as f:
+                f.truncate(index["bytes"])
+            logger.warning(f"Dropped a partial audit line at the end of {index['segment']}")
+        self._write_index(index)
+
+    def _seal(self, index: dict):
+        """Compress the active segment; the index is updated before the raw file goes"""
+        raw_name = index["segment"]
+        with open(self._path(raw_name), "rb") as f:
+            data = f.read()
+        if self.compressor is not None:
+            sealed_name = f"{raw_name}.{self.compressor.name}"
+            tmp_path = self._path(sealed_name + ".tmp")
+            with open(tmp_path, "wb") as f:
+                f.write(self.compressor.compress(data))
+                f.flush()
+                os.fsync(f.fileno())
+            os.replace(tmp_path, self._path(sealed_name))
+            index.update({"segment": sealed_name, "compression": self.compressor.name})
+        index["sealed"] = True
+        index["compressed_bytes"] = os.path.getsize(self._path(index["segment"]))
+        self._write_index(index)
+        self._bump_generation()
+        if index["segment"] != raw_name:
+            os.remove(self._path(raw_name))
+        logger.info(f"Sealed audit segment {index['segment']} ({index['count']} events)")
+
+    @contextmanager
+    def _directory_lock(self):
+        os.makedirs(self.directory, exist_ok=True)
+        if not FCNTL_AVAILABLE:
+            yield
+            return
+        with open(self._path(".lock"), "a") as lock_file:
+            fcntl.flock(lock_file, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+    # Indexes
+
+    def _path(self, name: str) -> str:
+        return os.path.join(self.directory, name)
+
+    def _index_path(self, segment: str) -> str:
+        return self._path(segment.split(".", 1)[0] + INDEX_SUFFIX)
+
+    def _write_index(self, index: dict):
+        path = self._index_path(index["segment"])
+        with open(path + ".tmp", "w") as f:
+            f.write(_dumps(index))
+        os.replace(path + ".tmp", path)
+        # Keep the cached active index current without re-reading it
+        with self._index_lock:
+            if not index["sealed"] and self._indexes and self._indexes[-1]["segment"] == index["segment"]:
+                self._indexes[-1] = _copy_index(index)
+
+    def _bump_generation(self):
+        """Tell every process that segments were created, sealed or deleted"""
+        path = self._path(GENERATION_FILE)
+        with open(path + ".tmp", "w") as f:
+            f.write(f"{os.getpid()}-{time.time_ns()}")
+        os.replace(path + ".tmp", path)
+
+    def _read_generation(self) -> Optional[str]:
+        try:
+            with open(self._path(GENERATION_FILE)) as f:
+                return f.read()
+        except FileNotFoundError:
+            return None
+
+    def _load_indexes(self) -> List[dict]:
+        """Every segment's index, oldest first (cached; don't modify the returned dicts)"""
+        with self._index_lock:
+            generation = self._read_generation()
+            if generation is None or generation != self._generation:
+                self._indexes = self._read_indexes()
+                self._generation = generation
+            elif self._indexes and not self._indexes[-1]["sealed"]:
+                # Segments are appended in place and the index follows, so a
+                # larger file means another process appended since
+                active = self._indexes[-1]
+                try:
+                    if os.path.getsize(self._path(active["segment"])) != active["bytes"]:
+                        with open(self._index_path(active["segment"])) as f:
+                            self._indexes[-1] = json.load(f)
+                except FileNotFoundError:
+                    # Sealed or purged before the generation was bumped; list again next time
+                    self._indexes = self._read_indexes()
+                    self._generation = None
+            return list(self._indexes)
+
+    def _read_indexes(self) -> List[dict]:
+        if not os.path.isdir(self.directory):
+            return []
+        indexes = []
+        for name in sorted(os.listdir(self.directory)):
+            if name.startswith(SEGMENT_PREFIX) and name.endswith(INDEX_SUFFIX):
+                with open(self._path(name)) as f:
+                    indexes.append(json.load(f))
+        return indexes
+
+    @staticmethod
+    def _matching_count(index: dict, action: Optional[str], entity_type: Optional[str]) -> int:
+        total = 0
+        for key, count in index["counts"].items():
+            key_action, key_entity_type = key.split(COUNT_KEY_SEPARATOR, 1)
+            if (action is None or key_action == action) and (entity_type is None or key_entity_type == entity_type):
+                total += count
+        return total
+
+    # Reading
+
+    def query(
+        self,
+        action: Optional[str] = None,
+        entity_type: Optional[str] = None,
+        limit: int = 100,
+        offset: int = 0,
+        before_id: Optional[int] = None
+    ) -> Tuple[List[dict], int]:
+        """Matching events newest first (offset, or ids below before_id), plus the total matching"""
+        indexes = self._load_indexes()
+        counts = [self._matching_count(index, action, entity_type) for index in indexes]
+        total = sum(counts)
+
+        needles = [_dumps({name: value})[1:-1].encode() for name, value in
+                   (("action", action), ("entity_type", entity_type)) if value is not None]
+        rows = []
+        skip = offset
+        for index, count in zip(reversed(indexes), reversed(counts)):
+            if count == 0 or (before_id is not None and index["first_id"] >= before_id):
+                continue
+            if skip >= count:
+                skip -= count
+                continue
+            for line in self._read_lines(index):
+                if any(needle not in line for needle in needles):
+                    continue
+                record = _loads(line)
+                if before_id is not None and record["id"] >= before_id:
+                    continue
+                if (action is not None and record["action"] != action) or \
+                        (entity_type is not None and record["entity_type"] != entity_type):
+                    continue
+                if skip:
+                    skip -= 1
+                    continue
+                rows.append(record)
+                if len(rows) >= limit:
+                    return rows, total
+        return rows, total
+
+    def page(
+        self,
+        action: Optional[str],
+        entity_type: Optional[str],
+        page: int,
+        page_size: int,
+        cursor: Optional[str],
+        keys
+    ) -> dict:
+        """A /audit-logs/ response page (same shape as the database backend)"""
+        def serialize(record: dict) -> dict:
+            return {key: record.get(key) for key in keys}
+
+        def cursor_key(record: dict) -> Tuple[str, int]:
+            return record["created_at"], record["id"]
+
+        if cursor is not None:
+            before_id = decode_cursor(cursor)[1] if cursor else None
+            rows, _ = self.query(action, entity_type, limit=page_size + 1, before_id=before_id)
+            return page_from_rows(rows, page, page_size, cursor, serialize, cursor_key)
+        rows, total = self.query(action, entity_type, limit=page_size, offset=(page - 1) * page_size)
+        return page_from_rows(rows, page, page_size, cursor, serialize, cursor_key, total)
+
+    def _read_lines(self, index: dict) -> Iterator[bytes]:
+        """A segment's lines, newest first"""
+        path = self._path(index["segment"])
+        if not index["compression"] and not os.path.exists(path):
+            # Sealed by another writer since the indexes were loaded
+            with open(self._index_path(index["segment"])) as f:
+                index = json.load(f)
+            path = self._path(index["segment"])
+        if index["compression"]:
+            data = self._decompressed(path, index["compression"])
+            yield from _lines_reversed(data, len(data))
+            return
+        # Raw segment: map it, reading only what the index covers
+        if not index["bytes"]:
+            return
+        with open(path, "rb") as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mapped:
+            yield from _lines_reversed(mapped, min(index["bytes"], len(mapped)))
+
+    def _decompressed(self, path: str, compression: str) -> bytes:
+        with self._cache_lock:
+            if path in self._segment_cache:
+                self._segment_cache.move_to_end(path)
+                return self._segment_cache[path]
+        with open(path, "rb") as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mapped:
+            data = self._compressors[compression].decompress(mapped)
+        with self._cache_lock:
+            self._segment_cache[path] = data
+            while len(self._segment_cache) > self._segment_cache_size:
+                self._segment_cache.popitem(last=False)
+        return data
+
+    # Retention and stats
+
+    def purge(self, before: datetime) -> int:
+        """Delete sealed segments whose newest event is older than `before`"""
+        purged = 0
+        cutoff = before.isoformat()
+        with self._lock, self._directory_lock():
+            for index in self._load_indexes():
+                if not index["sealed"] or not index["max_created_at"] or index["max_created_at"] >= cutoff:
+                    continue
+                os.remove(self._path(index["segment"]))
+                os.remove(self._index_path(index["segment"]))
+                with self._cache_lock:
+                    self._segment_cache.pop(self._path(index["segment"]), None)
+                purged += index["count"]
+                logger.info(f"Deleted audit segment {index['segment']} ({index['count']} events)")
+            if purged:
+                self._bump_generation()
+        return purged
+
+    def snapshot(self) -> dict:
+        indexes = self._load_indexes()
+        return {
+            "directory": os.path.abspath(self.directory),
+            "segments": len(indexes),
+            "sealed_segments": sum(1 for index in indexes if index["sealed"]),
+            "events": sum(index["count"] for index in indexes),
+            "raw_bytes": sum(index["bytes"] for index in indexes),
+            "stored_bytes": sum(index.get("compressed_bytes", index["bytes"]) for index in indexes),
+            "compression": self.compressor.name if self.compressor else None,
+            "cross_process_lock": FCNTL_AVAILABLE,
+        }
+
+# Create singleton instance
+audit_store = JsonlAuditStore(
+    config.AUDIT_LOG_DIR,
+    config.AUDIT_SEGMENT_MAX_BYTES,
+    config.AUDIT_SEGMENT_MAX_AGE_HOURS * 3600,
+    config.AUDIT_SEGMENT_COMPRESSION,
+    config.AUDIT_SEGMENT_FSYNC
+)
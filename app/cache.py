@@ -1,10 +1,39 @@
 """
 Redis caching layer for improved performance and scalability
+
+Two tiers:
+- L1: a small in-process LRU with a short TTL, so hot keys skip the Redis
+  round trip and decoding
+- L2: a pluggable backend - Redis, shared by every worker, or an in-process
+  TTL/LRU store (CACHE_BACKEND=memory, for single-node deployments and
+  tests). In "auto" mode the memory backend stands in while Redis is down
+  and Redis is re-promoted as soon as it answers again.
+
+Invalidation is versioned: cached responses live under a namespace (e.g.
+"patient:42") whose version counter is part of every key, so dropping a
+namespace is a single INCR. Old entries are never read again and simply
+expire. Bumps and deletes are broadcast over Redis pub/sub so every process
+drops its L1 copy and cached version.
+get_or_set() adds single-flight loading: one caller recomputes a missing
+key while concurrent callers wait for it, or get the last (stale) value if
+there is one. aget_or_set() is the same for coroutines: backend calls run in
+the threadpool so a slow Redis never blocks the event loop.
 """
+import asyncio
+import fnmatch
+import functools
+import inspect
 import json
 import logging
-from typing import Optional, Any
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from typing import Any, Awaitable, Callable, Dict, Iterator, List, Optional, Tuple
+from starlette.concurrency import run_in_threadpool
+
 from app.config import config
+from app.serialization import create_cache_serializer
 
 logger = logging.getLogger(__name__)
 
@@ -14,107 +43,765 @@ try:
     REDIS_AVAILABLE = True
 except ImportError:
     REDIS_AVAILABLE = False
-    logger.warning("redis not installed. Caching disabled. Install with: pip install redis")
+    logger.warning("redis not installed. Using the in-memory cache backend. Install with: pip install redis")
+
+class LocalCache:
+    """Thread-safe in-process LRU with per-entry TTL and a stale grace period"""
+    
+    def __init__(self, max_entries: int, ttl: int, stale_seconds: int):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.stale_seconds = stale_seconds
+        self._entries: "OrderedDict[str, tuple]" = OrderedDict()
+        self._lock = threading.Lock()
+    
+    def get(self, key: str, allow_stale: bool = False) -> Optional[Any]:
+        """Return a fresh value (or a stale one if allow_stale), else None"""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            value, expires_at = entry
+            now = time.monotonic()
+            if now < expires_at:
+                self._entries.move_to_end(key)
+                return value
+            if now >= expires_at + self.stale_seconds:
+                del self._entries[key]
+                return None
+            return value if allow_stale else None
+    
+    def set(self, key: str, value: Any, ttl: Optional[int] = None):
+        ttl = min(ttl, self.ttl) if ttl else self.ttl
+        with self._lock:
+            self._entries[key] = (value, time.monotonic() + ttl)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+    
+    def delete(self, key: str):
+        with self._lock:
+            self._entries.pop(key, None)
+    
+    def delete_pattern(self, pattern: str):
+        with self._lock:
+            for key in [k for k in self._entries if fnmatch.fnmatchcase(k, pattern)]:
+                del self._entries[key]
+    
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+    
+    def __len__(self):
+        return len(self._entries)
+
+class CacheBackend:
+    """Storage interface behind CacheService (values are encoded bytes)"""
+    
+    name = "base"
+    
+    def ping(self):
+        raise NotImplementedError
+    
+    def get(self, key: str) -> Tuple[Optional[bytes], Optional[int]]:
+        """Return (value, seconds to live) or (None, None)"""
+        raise NotImplementedError
+    
+    def get_many(self, keys: List[str]) -> List[Tuple[Optional[bytes], Optional[int]]]:
+        """get() for several keys in one round trip"""
+        raise NotImplementedError
+    
+    def setex(self, key: str, ttl: int, value: bytes):
+        raise NotImplementedError
+    
+    def setex_many(self, items: List[Tuple[str, int, bytes]]):
+        """setex() for several (key, ttl, value) items in one round trip"""
+        raise NotImplementedError
+    
+    def delete(self, *keys: str) -> int:
+        raise NotImplementedError
+    
+    def get_counters(self, *keys: str) -> List[int]:
+        raise NotImplementedError
+    
+    def incr_counters(self, *keys: str) -> List[int]:
+        raise NotImplementedError
+    
+    def scan(self, pattern: str, count: int) -> Iterator[str]:
+        raise NotImplementedError
+    
+    def flush(self):
+        raise NotImplementedError
+    
+    def publish(self, channel: str, message: str):
+        """Broadcast to other processes (no-op for process-local backends)"""
+    
+    def subscribe(self, channel: str, handler: Callable):
+        """Receive broadcasts from other processes (no-op for process-local backends)"""
+    
+    def close(self):
+        """Release connections and listener threads"""
+
+class RedisBackend(CacheBackend):
+    name = "redis"
+    
+    def __init__(self, url: str):
+        self.client = redis.from_url(
+            url,
+            decode_responses=False,
+            socket_connect_timeout=5,
+            socket_timeout=5,
+            retry_on_timeout=True
+        )
+        self._pubsub_thread = None
+    
+    def ping(self):
+        self.client.ping()
+    
+    def get(self, key):
+        # Value and remaining TTL in one round trip
+        value, ttl = self.client.pipeline().get(key).ttl(key).execute()
+        return value, (ttl if ttl and ttl > 0 else None)
+    
+    def get_many(self, keys):
+        # One MGET plus the TTLs, pipelined into a single round trip
+        pipeline = self.client.pipeline(transaction=False)
+        pipeline.mget(keys)
+        for key in keys:
+            pipeline.ttl(key)
+        values, *ttls = pipeline.execute()
+        return [(value, (ttl if ttl and ttl > 0 else None)) for value, ttl in zip(values, ttls)]
+    
+    def setex(self, key, ttl, value):
+        self.client.setex(key, ttl, value)
+    
+    def setex_many(self, items):
+        pipeline = self.client.pipeline(transaction=False)
+        for key, ttl, value in items:
+            pipeline.setex(key, ttl, value)
+        pipeline.execute()
+    
+    def delete(self, *keys):
+        return self.client.delete(*keys) if keys else 0
+    
+    def get_counters(self, *keys):
+        return [int(v or 0) for v in self.client.mget(keys)]
+    
+    def incr_counters(self, *keys):
+        pipeline = self.client.pipeline(transaction=False)
+        for key in keys:
+            pipeline.incr(key)
+        return pipeline.execute()
+    
+    def scan(self, pattern, count):
+        return self.client.scan_iter(match=pattern, count=count)
+    
+    def flush(self):
+        self.client.flushdb()
+    
+    def publish(self, channel, message):
+        self.client.publish(channel, message)
+    
+    def subscribe(self, channel, handler):
+        pubsub = self.client.pubsub(ignore_subscribe_messages=True)
+        pubsub.subscribe(**{channel: handler})
+        self._pubsub_thread = pubsub.run_in_thread(sleep_time=1, daemon=True)
+    
+    def close(self):
+        if self._pubsub_thread:
+            self._pubsub_thread.stop()
+            self._pubsub_thread = None
+        self.client.close()
+
+class MemoryBackend(CacheBackend):
+    """Process-local backend with the same TTL and LRU eviction semantics"""
+    
+    name = "memory"
+    
+    def __init__(self, max_entries: int):
+        self.max_entries = max_entries
+        self._entries: "OrderedDict[str, tuple]" = OrderedDict()
+        self._counters: Dict[str, int] = {}
+        self._lock = threading.Lock()
+    
+    def ping(self):
+        pass
+    
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None, None
+            value, expires_at = entry
+            remaining = expires_at - time.monotonic()
+            if remaining <= 0:
+                del self._entries[key]
+                return None, None
+            self._entries.move_to_end(key)
+            return value, max(int(remaining), 1)
+    
+    def get_many(self, keys):
+        return [self.get(key) for key in keys]
+    
+    def setex(self, key, ttl, value):
+        with self._lock:
+            self._entries[key] = (value, time.monotonic() + ttl)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+    
+    def setex_many(self, items):
+        for key, ttl, value in items:
+            self.setex(key, ttl, value)
+    
+    def delete(self, *keys):
+        with self._lock:
+            return sum(1 for key in keys if self._entries.pop(key, None) is not None)
+    
+    def get_counters(self, *keys):
+        with self._lock:
+            return [self._counters.get(key, 0) for key in keys]
+    
+    def incr_counters(self, *keys):
+        with self._lock:
+            for key in keys:
+                self._counters[key] = self._counters.get(key, 0) + 1
+            return [self._counters[key] for key in keys]
+    
+    def scan(self, pattern, count):
+        with self._lock:
+            keys = [k for k in self._entries if fnmatch.fnmatchcase(k, pattern)]
+        return iter(keys)
+    
+    def flush(self):
+        with self._lock:
+            self._entries.clear()
+            self._counters.clear()
 
 class CacheService:
-    """Redis-based caching service"""
+    """Two-tier cache with a Redis or in-memory backend"""
     
     def __init__(self):
-        self.client = None
-        self.enabled = config.ENABLE_CACHING and REDIS_AVAILABLE
+        self.enabled = config.ENABLE_CACHING
+        self.mode = config.CACHE_BACKEND
+        self.local = LocalCache(config.CACHE_L1_MAX_ENTRIES, config.CACHE_L1_TTL, config.CACHE_STALE_SECONDS)
+        self.channel = config.CACHE_INVALIDATION_CHANNEL
+        self.serializer = create_cache_serializer()
+        self.origin = uuid.uuid4().hex
+        self.backend: Optional[CacheBackend] = None
+        self._fallback = MemoryBackend(config.CACHE_MEMORY_MAX_ENTRIES)
+        self._backend_lock = threading.Lock()
+        self._reconnect_thread = None
+        self._versions: Dict[str, tuple] = {}
+        self._versions_lock = threading.Lock()
+        self._flights: Dict[str, threading.Event] = {}
+        self._flights_lock = threading.Lock()
+        # Async single-flight, keyed by (event loop, key); only touched from the loop's thread
+        self._async_flights: Dict[Tuple[asyncio.AbstractEventLoop, str], asyncio.Future] = {}
+        self._stats_lock = threading.Lock()
+        self._stats = {
+            "l1": {"hits": 0, "misses": 0},
+            "l2": {"hits": 0, "misses": 0},
+            "single_flight": {"loads": 0, "waits": 0, "stale_served": 0},
+            "backend": {"fallbacks": 0, "promotions": 0}
+        }
         
         if self.enabled:
+            if self.mode == "memory" or (self.mode == "auto" and not REDIS_AVAILABLE):
+                self.backend = self._fallback
+                logger.info("In-memory cache initialized")
+            elif self._promote() is False:
+                if self.mode == "redis":
+                    logger.warning("Redis unavailable and CACHE_BACKEND=redis. Caching disabled.")
+                    self.enabled = False
+                else:
+                    self._demote("Redis unavailable at startup")
+    
+    def _promote(self) -> bool:
+        """Switch to Redis if it answers; returns False if it doesn't"""
+        try:
+            backend = RedisBackend(config.REDIS_URL)
+            backend.ping()
+            # Entries written while this process was on the fallback may not
+            # have reached Redis - start a new epoch so nothing older is read
+            if self.backend is self._fallback:
+                backend.incr_counters("cache_epoch")
+            backend.subscribe(self.channel, self._on_invalidation)
+        except Exception as e:
+            logger.warning(f"Failed to connect to Redis: {str(e)}")
+            return False
+        
+        with self._backend_lock:
+            was_fallback = self.backend is self._fallback
+            self.backend = backend
+        self._reset_local()
+        if was_fallback:
+            self._fallback.flush()
+            self._count("backend", "promotions")
+            self._publish(clear=True)
+            logger.info("Redis is back, cache re-promoted to Redis")
+        else:
+            logger.info("Redis cache initialized successfully")
+        return True
+    
+    def _demote(self, reason: str):
+        """Fall back to the in-memory backend and keep retrying Redis"""
+        with self._backend_lock:
+            if self.mode != "auto" or self.backend is self._fallback:
+                return
+            previous, self.backend = self.backend, self._fallback
+            self._count("backend", "fallbacks")
+        logger.warning(f"{reason}. Using the in-memory cache backend until Redis recovers.")
+        self._reset_local()
+        if previous:
             try:
-                self.client = redis.from_url(
-                    config.REDIS_URL,
-                    decode_responses=True,
-                    socket_connect_timeout=5,
-                    socket_timeout=5,
-                    retry_on_timeout=True
-                )
-                # Test connection
-                self.client.ping()
-                logger.info("Redis cache initialized successfully")
-            except Exception as e:
-                logger.warning(f"Failed to connect to Redis: {str(e)}. Caching disabled.")
-                self.enabled = False
-                self.client = None
+                previous.close()
+            except Exception:
+                pass
+        
+        if not self._reconnect_thread or not self._reconnect_thread.is_alive():
+            self._reconnect_thread = threading.Thread(target=self._reconnect_loop, daemon=True)
+            self._reconnect_thread.start()
+    
+    def _reconnect_loop(self):
+        while self.backend is self._fallback:
+            time.sleep(config.CACHE_REDIS_RETRY_SECONDS)
+            self._promote()
+    
+    def _backend_error(self, operation: str, error: Exception):
+        logger.error(f"Cache {operation} error: {str(error)}")
+        if REDIS_AVAILABLE and isinstance(error, (redis.ConnectionError, redis.TimeoutError)):
+            self._demote(f"Lost connection to Redis ({str(error)})")
+    
+    def _reset_local(self):
+        self.local.clear()
+        with self._versions_lock:
+            self._versions.clear()
+    
+    def _on_invalidation(self, message):
+        try:
+            event = json.loads(message["data"])
+            if event.get("origin") == self.origin:
+                return
+            if event.get("clear"):
+                self._reset_local()
+            for key in event.get("keys", []):
+                self.local.delete(key)
+            for pattern in event.get("patterns", []):
+                self.local.delete_pattern(pattern)
+            for namespace in event.get("namespaces", []):
+                self._forget_namespace(namespace)
+        except Exception as e:
+            logger.error(f"Cache invalidation message error: {str(e)}")
+    
+    def _publish(self, **event):
+        try:
+            self.backend.publish(self.channel, json.dumps({"origin": self.origin, **event}))
+        except Exception as e:
+            logger.error(f"Cache invalidation publish error: {str(e)}")
+    
+    def _count(self, tier: str, outcome: str):
+        with self._stats_lock:
+            self._stats[tier][outcome] += 1
+    
+    def _forget_namespace(self, namespace: str):
+        with self._versions_lock:
+            self._versions.pop(namespace, None)
+        self.local.delete_pattern(f"{namespace}:*")
+    
+    def namespace_version(self, namespace: str) -> str:
+        """Current epoch/version of a namespace (cached locally for up to CACHE_L1_TTL)"""
+        now = time.monotonic()
+        with self._versions_lock:
+            cached_version = self._versions.get(namespace)
+        if cached_version and now - cached_version[1] < config.CACHE_L1_TTL:
+            return cached_version[0]
+        
+        epoch, version = self.backend.get_counters("cache_epoch", f"cache_ns:{namespace}")
+        version = f"e{epoch}v{version}"
+        with self._versions_lock:
+            self._versions[namespace] = (version, now)
+        return version
+    
+    def namespaced_key(self, namespace: str, suffix: str = "") -> Optional[str]:
+        """Build the key for an entry in a namespace, or None if the backend is unreachable"""
+        if not self.enabled:
+            return None
+        try:
+            return f"{namespace}:{self.namespace_version(namespace)}:{suffix}"
+        except Exception as e:
+            self._backend_error("namespace version", e)
+            return None
     
     def get(self, key: str) -> Optional[Any]:
         """Get value from cache"""
-        if not self.enabled or not self.client:
+        if not self.enabled:
             return None
         
+        value = self.local.get(key)
+        if value is not None:
+            self._count("l1", "hits")
+            return value
+        self._count("l1", "misses")
+        
         try:
-            value = self.client.get(key)
-            if value:
-                return json.loads(value)
+            raw, remaining = self.backend.get(key)
+            if raw:
+                self._count("l2", "hits")
+                value = self.serializer.loads(raw)
+                # Don't keep it locally longer than the backend will
+                self.local.set(key, value, remaining)
+                return value
+            self._count("l2", "misses")
             return None
         except Exception as e:
-            logger.error(f"Cache get error: {str(e)}")
+            self._backend_error("get", e)
             return None
     
     def set(self, key: str, value: Any, ttl: Optional[int] = None) -> bool:
         """Set value in cache with optional TTL"""
-        if not self.enabled or not self.client:
+        if not self.enabled:
             return False
         
         try:
             ttl = ttl or config.REDIS_CACHE_TTL
-            serialized = json.dumps(value)
-            self.client.setex(key, ttl, serialized)
+            serialized = self.serializer.dumps(value)
+            self.backend.setex(key, ttl, serialized)
+            self.local.set(key, value, ttl)
             return True
         except Exception as e:
-            logger.error(f"Cache set error: {str(e)}")
+            self._backend_error("set", e)
             return False
     
+    def get_many(self, keys: List[str]) -> Dict[str, Any]:
+        """Get several values; L1 first, then one backend round trip for the rest
+        
+        Returns only the keys that were found.
+        """
+        if not self.enabled or not keys:
+            return {}
+        
+        found = {}
+        remote_keys = []
+        for key in dict.fromkeys(keys):
+            value = self.local.get(key)
+            if value is not None:
+                found[key] = value
+            else:
+                remote_keys.append(key)
+        with self._stats_lock:
+            self._stats["l1"]["hits"] += len(found)
+            self._stats["l1"]["misses"] += len(remote_keys)
+        if not remote_keys:
+            return found
+        
+        try:
+            hits = 0
+            for key, (raw, remaining) in zip(remote_keys, self.backend.get_many(remote_keys)):
+                if raw:
+                    value = self.serializer.loads(raw)
+                    self.local.set(key, value, remaining)
+                    found[key] = value
+                    hits += 1
+            with self._stats_lock:
+                self._stats["l2"]["hits"] += hits
+                self._stats["l2"]["misses"] += len(remote_keys) - hits
+        except Exception as e:
+            self._backend_error("get many", e)
+        return found
+    
+    def set_many(self, values: Dict[str, Any], ttl: Optional[int] = None) -> bool:
+        """Set several values with one backend round trip"""
+        if not self.enabled or not values:
+            return False
+        
+        try:
+            ttl = ttl or config.REDIS_CACHE_TTL
+            self.backend.setex_many([(key, ttl, self.serializer.dumps(value)) for key, value in values.items()])
+            for key, value in values.items():
+                self.local.set(key, value, ttl)
+            return True
+        except Exception as e:
+            self._backend_error("set many", e)
+            return False
+    
+    def hydrate(self, prefix: str, ids: List[Any], loader: Callable[[List[Any]], Dict[Any, Any]], ttl: Optional[int] = None) -> Dict[Any, Any]:
+        """Resolve per-entity values for a page of ids from cache, loading only the misses
+        
+        Keys are "{prefix}:{id}"; loader(missing_ids) returns {id: value} for
+        the ids it found (one query for the whole batch).
+        """
+        ids = list(dict.fromkeys(i for i in ids if i is not None))
+        if not ids:
+            return {}
+        
+        keys = {i: f"{prefix}:{i}" for i in ids}
+        cached_values = self.get_many(list(keys.values()))
+        result = {i: cached_values[key] for i, key in keys.items() if key in cached_values}
+        
+        missing = [i for i in ids if i not in result]
+        if missing:
+            loaded = loader(missing)
+            self.set_many({keys[i]: value for i, value in loaded.items()}, ttl)
+            result.update(loaded)
+        return result
+    
+    async def ahydrate(self, prefix: str, ids: List[Any], loader: Callable[[List[Any]], Awaitable[Dict[Any, Any]]], ttl: Optional[int] = None) -> Dict[Any, Any]:
+        """hydrate() with an async loader (for handlers on an async session)"""
+        ids = list(dict.fromkeys(i for i in ids if i is not None))
+        if not ids:
+            return {}
+        
+        keys = {i: f"{prefix}:{i}" for i in ids}
+        cached_values = await run_in_threadpool(self.get_many, list(keys.values()))
+        result = {i: cached_values[key] for i, key in keys.items() if key in cached_values}
+        
+        missing = [i for i in ids if i not in result]
+        if missing:
+            loaded = await loader(missing)
+            await run_in_threadpool(self.set_many, {keys[i]: value for i, value in loaded.items()}, ttl)
+            result.update(loaded)
+        return result
+    
+    def get_or_set(self, key: str, loader: Callable[[], Any], ttl: Optional[int] = None) -> Any:
+        """Return the cached value, computing it with loader() on a miss
+        
+        Only one caller per key runs loader() at a time; the others get the
+        stale L1 value if one is still within the grace period, otherwise
+        they wait for the loader (up to CACHE_SINGLE_FLIGHT_TIMEOUT).
+        """
+        if not self.enabled:
+            return loader()
+        value = self.get(key)
+        if value is not None:
+            return value
+        
+        with self._flights_lock:
+            flight = self._flights.get(key)
+            leader = flight is None
+            if leader:
+                flight = self._flights[key] = threading.Event()
+        
+        if not leader:
+            stale = self.local.get(key, allow_stale=True)
+            if stale is not None:
+                self._count("single_flight", "stale_served")
+                return stale
+            self._count("single_flight", "waits")
+            if flight.wait(config.CACHE_SINGLE_FLIGHT_TIMEOUT):
+                value = self.local.get(key)
+                if value is not None:
+                    return value
+            # Leader failed or timed out - compute without caching
+            return loader()
+        
+        try:
+            self._count("single_flight", "loads")
+            value = loader()
+            self.set(key, value, ttl)
+            return value
+        finally:
+            with self._flights_lock:
+                self._flights.pop(key, None)
+            flight.set()
+    
+    async def aget_or_set(self, key: str, loader: Callable[[], Awaitable[Any]], ttl: Optional[int] = None) -> Any:
+        """get_or_set() for async loaders
+        
+        Backend reads and writes run in the threadpool. Concurrent misses on
+        the same key in this event loop await the first caller's load (or
+        get the stale L1 value) instead of each running loader().
+        """
+        if not self.enabled:
+            return await loader()
+        value = self.local.get(key)
+        if value is None:
+            value = await run_in_threadpool(self.get, key)
+        if value is not None:
+            return value
+        
+        flight_key = (asyncio.get_running_loop(), key)
+        flight = self._async_flights.get(flight_key)
+        if flight is not None:
+            stale = self.local.get(key, allow_stale=True)
+            if stale is not None:
+                self._count("single_flight", "stale_served")
+                return stale
+            self._count("single_flight", "waits")
+            try:
+                value = await asyncio.wait_for(asyncio.shield(flight), config.CACHE_SINGLE_FLIGHT_TIMEOUT)
+            except asyncio.TimeoutError:
+                value = None
+            if value is not None:
+                return value
+            # Leader failed or timed out - compute without caching
+            return await loader()
+        
+        flight = self._async_flights[flight_key] = asyncio.get_running_loop().create_future()
+        value = None
+        try:
+            self._count("single_flight", "loads")
+            value = await loader()
+            await run_in_threadpool(self.set, key, value, ttl)
+            return value
+        finally:
+            self._async_flights.pop(flight_key, None)
+            flight.set_result(value)
+    
     def delete(self, key: str) -> bool:
         """Delete key from cache"""
-        if not self.enabled or not self.client:
+        if not self.enabled:
             return False
         
+        self.local.delete(key)
         try:
-            self.client.delete(key)
+            self.backend.delete(key)
+            self._publish(keys=[key])
             return True
         except Exception as e:
-            logger.error(f"Cache delete error: {str(e)}")
+            self._backend_error("delete", e)
             return False
     
-    def delete_pattern(self, pattern: str) -> int:
-        """Delete all keys matching pattern"""
-        if not self.enabled or not self.client:
+    def delete_many(self, keys: List[str]) -> int:
+        """Delete several keys with one backend round trip"""
+        if not self.enabled or not keys:
             return 0
         
+        for key in keys:
+            self.local.delete(key)
         try:
-            keys = self.client.keys(pattern)
-            if keys:
-                return self.client.delete(*keys)
+            deleted = self.backend.delete(*keys)
+            self._publish(keys=list(keys))
+            return deleted
+        except Exception as e:
+            self._backend_error("delete many", e)
+            return 0
+    
+    def delete_pattern(self, pattern: str, batch_size: int = 500) -> int:
+        """Delete all keys matching pattern
+        
+        Walks the keyspace with SCAN in batches instead of KEYS, so Redis is
+        never blocked. Still O(keyspace) overall - prefer invalidate() for
+        anything on a request path.
+        """
+        if not self.enabled:
             return 0
+        
+        self.local.delete_pattern(pattern)
+        try:
+            self._publish(patterns=[pattern])
+            deleted = 0
+            batch = []
+            for key in self.backend.scan(pattern, batch_size):
+                batch.append(key)
+                if len(batch) >= batch_size:
+                    deleted += self.backend.delete(*batch)
+                    batch = []
+            if batch:
+                deleted += self.backend.delete(*batch)
+            return deleted
         except Exception as e:
-            logger.error(f"Cache delete pattern error: {str(e)}")
+            self._backend_error("delete pattern", e)
             return 0
     
     def clear_patient_cache(self, patient_id: int):
         """Clear all cache entries for a patient"""
-        patterns = [
-            f"patient:{patient_id}:*",
-            f"patient_appointments:{patient_id}:*",
-            f"patient_messages:{patient_id}:*"
-        ]
-        for pattern in patterns:
-            self.delete_pattern(pattern)
+        self.invalidate(
+            f"patient:{patient_id}",
+            f"patient_appointments:{patient_id}",
+            f"patient_messages:{patient_id}"
+        )
+    
+    def invalidate(self, *namespaces: str):
+        """Drop every cached entry in the given namespaces (one INCR each)"""
+        if not self.enabled or not namespaces:
+            return
+        
+        for namespace in namespaces:
+            self._forget_namespace(namespace)
+        try:
+            self.backend.incr_counters(*[f"cache_ns:{namespace}" for namespace in namespaces])
+            self._publish(namespaces=list(namespaces))
+        except Exception as e:
+            self._backend_error("invalidate", e)
     
     def clear_all_cache(self):
         """Clear all cache (use with caution)"""
-        if not self.enabled or not self.client:
+        if not self.enabled:
             return
         
+        self._reset_local()
         try:
-            self.client.flushdb()
+            self.backend.flush()
+            self._publish(clear=True)
             logger.info("Cache cleared")
         except Exception as e:
-            logger.error(f"Cache clear error: {str(e)}")
+            self._backend_error("clear", e)
+    
+    def stats(self) -> dict:
+        """Hit/miss counters per tier for the metrics endpoint"""
+        with self._stats_lock:
+            stats = {tier: dict(counters) for tier, counters in self._stats.items()}
+        for tier in ("l1", "l2"):
+            lookups = stats[tier]["hits"] + stats[tier]["misses"]
+            stats[tier]["hit_rate"] = (stats[tier]["hits"] / lookups * 100.0) if lookups else 0.0
+        stats["l1"]["entries"] = len(self.local)
+        stats["backend"]["name"] = self.backend.name if self.backend else None
+        stats["backend"]["mode"] = self.mode
+        stats["serializer"] = self.serializer.describe()
+        stats["enabled"] = self.enabled
+        return stats
 
 # Create singleton instance
 cache_service = CacheService()
 
+# Handler arguments that never take part in a cache key
+_UNCACHEABLE_ARGS = {"db", "request", "background_tasks"}
+
+def cached(prefix: str, ttl: Optional[int] = None, condition: Optional[Callable[[dict], bool]] = None):
+    """Cache a route handler's JSON response
+    
+    The prefix formatted with the handler's arguments (e.g.
+    "patient:{patient_id}") is the namespace, and the remaining query
+    arguments form the rest of the key, so CacheService.invalidate(namespace)
+    / clear_patient_cache() drop every variant. `condition` receives the
+    arguments and can skip caching for calls that shouldn't be cached. Sync handlers load through the
+    single-flight get_or_set(), async handlers through aget_or_set(). A
+    pass-through when caching is disabled.
+    """
+    def decorator(func):
+        signature = inspect.signature(func)
+        
+        def build_key(args, kwargs) -> Optional[str]:
+            bound = signature.bind_partial(*args, **kwargs)
+            bound.apply_defaults()
+            params = {k: v for k, v in bound.arguments.items() if k not in _UNCACHEABLE_ARGS}
+            if condition and not condition(params):
+                return None
+            namespace = prefix.format(**params)
+            rest = "&".join(f"{k}={v}" for k, v in sorted(params.items()) if f"{{{k}}}" not in prefix)
+            return cache_service.namespaced_key(namespace, rest)
+        
+        if inspect.iscoroutinefunction(func):
+            @functools.wraps(func)
+            async def async_wrapper(*args, **kwargs):
+                if not cache_service.enabled:
+                    return await func(*args, **kwargs)
+                # The namespace version may need a backend round trip
+                key = await run_in_threadpool(build_key, args, kwargs)
+                if key is None:
+                    return await func(*args, **kwargs)
+                return await cache_service.aget_or_set(key, lambda: func(*args, **kwargs), ttl)
+            return async_wrapper
+        
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            if not cache_service.enabled:
+                return func(*args, **kwargs)
+            key = build_key(args, kwargs)
+            if key is None:
+                return func(*args, **kwargs)
+            return cache_service.get_or_set(key, lambda: func(*args, **kwargs), ttl)
+        return wrapper
+    
+    return decorator
@@ -13,10 +13,38 @@ class Config:
     # For development, SQLite is fine:
     DATABASE_URL = os.getenv("DATABASE_URL", "sqlite:///./dental_messaging.db")
     
-    # Database Pool Settings (for PostgreSQL)
+    # Database Pool Settings (for PostgreSQL; SQLite uses the SQLITE_* settings below)
     DB_POOL_SIZE = int(os.getenv("DB_POOL_SIZE", "20"))
     DB_MAX_OVERFLOW = int(os.getenv("DB_MAX_OVERFLOW", "40"))
     DB_POOL_RECYCLE = int(os.getenv("DB_POOL_RECYCLE", "3600"))
+    DB_POOL_TIMEOUT = float(os.getenv("DB_POOL_TIMEOUT", "30"))  # seconds to wait for a free connection
+    DB_POOL_PRE_PING = os.getenv("DB_POOL_PRE_PING", "true").lower() == "true"
+    
+    # SQLite tuning. Connections come from a small bounded pool, so these
+    # pragmas run once per connection; dispatch (scheduler jobs, outbox relay,
+    # sends) writes through its own single connection
+    SQLITE_POOL_SIZE = int(os.getenv("SQLITE_POOL_SIZE", "5"))
+    SQLITE_BUSY_TIMEOUT_MS = int(os.getenv("SQLITE_BUSY_TIMEOUT_MS", "5000"))  # wait this long for the write lock
+    SQLITE_SYNCHRONOUS = os.getenv("SQLITE_SYNCHRONOUS", "NORMAL").upper()  # NORMAL is durable across app crashes in WAL mode
+    SQLITE_CACHE_SIZE_KB = int(os.getenv("SQLITE_CACHE_SIZE_KB", "64000"))  # page cache per connection
+    SQLITE_MMAP_SIZE = int(os.getenv("SQLITE_MMAP_SIZE", str(256 * 1024 * 1024)))  # bytes of the file read via mmap (0 disables)
+    SQLITE_MAINTENANCE_INTERVAL_MINUTES = int(os.getenv("SQLITE_MAINTENANCE_INTERVAL_MINUTES", "15"))  # WAL checkpoint + PRAGMA optimize (0 disables)
+    
+    # Async engine for the read endpoints (aiosqlite / asyncpg). Derived from
+    # DATABASE_URL unless set; without the driver installed, async endpoints
+    # run their queries on the threadpool with a regular session instead
+    ASYNC_DATABASE_URL = os.getenv("ASYNC_DATABASE_URL", "")
+    ENABLE_ASYNC_DB = os.getenv("ENABLE_ASYNC_DB", "true").lower() == "true"
+    
+    # Read replicas of DATABASE_URL (comma-separated) for list/metric endpoints
+    DATABASE_READ_URLS = [
+        u.strip() for u in os.getenv(
+            "DATABASE_READ_URLS", os.getenv("DATABASE_READ_URL", "")
+        ).split(",") if u.strip()
+    ]
+    DB_REPLICA_MAX_LAG_SECONDS = float(os.getenv("DB_REPLICA_MAX_LAG_SECONDS", "5"))  # Skip replicas further behind
+    DB_REPLICA_CHECK_INTERVAL = int(os.getenv("DB_REPLICA_CHECK_INTERVAL", "10"))  # seconds between lag checks
+    DB_READ_YOUR_WRITES_SECONDS = int(os.getenv("DB_READ_YOUR_WRITES_SECONDS", "10"))  # Reads stay on the primary after a write
     
     # Twilio SMS/WhatsApp Configuration
     TWILIO_ACCOUNT_SID = os.getenv("TWILIO_ACCOUNT_SID", "")
@@ -24,6 +52,11 @@ class Config:
     TWILIO_PHONE_NUMBER = os.getenv("TWILIO_PHONE_NUMBER", "")
     TWILIO_WHATSAPP_NUMBER = os.getenv("TWILIO_WHATSAPP_NUMBER", "")  # WhatsApp-enabled number (format: whatsapp:+1234567890)
     
+    # Twilio HTTP connection pool (one keep-alive pool shared by the whole process)
+    TWILIO_HTTP_POOL_SIZE = int(os.getenv("TWILIO_HTTP_POOL_SIZE", "20"))
+    TWILIO_HTTP_TIMEOUT = float(os.getenv("TWILIO_HTTP_TIMEOUT", "10"))  # seconds
+    TWILIO_HTTP_MAX_RETRIES = int(os.getenv("TWILIO_HTTP_MAX_RETRIES", "2"))  # connection-level retries
+
     # Message Channel Configuration
     MESSAGE_CHANNEL = os.getenv("MESSAGE_CHANNEL", "sms").lower()  # "sms" or "whatsapp" or "both"
     
@@ -44,6 +77,62 @@ class Config:
     REMINDER_DAYS_BEFORE = int(os.getenv("REMINDER_DAYS_BEFORE", "3"))  # Send first reminder 3 days before
     REMINDER_DAY_BEFORE = 1  # Send reminder 1 day before
     REMINDER_HOURS_BEFORE = int(os.getenv("REMINDER_HOURS_BEFORE", "3"))  # Send final reminder 3 hours before
+
+    # Message coalescing (merge due messages to the same patient into one send)
+    MESSAGE_COALESCING_ENABLED = os.getenv("MESSAGE_COALESCING_ENABLED", "false").lower() == "true"
+    MESSAGE_COALESCE_WINDOW_MINUTES = int(os.getenv("MESSAGE_COALESCE_WINDOW_MINUTES", "15"))
+    MESSAGE_COALESCE_MAX_LENGTH = int(os.getenv("MESSAGE_COALESCE_MAX_LENGTH", "1600"))  # Twilio body limit
+    MESSAGE_COALESCE_TYPES = [
+        t.strip() for t in os.getenv(
+            "MESSAGE_COALESCE_TYPES", "appointment_reminder,post_visit,recall,broadcast"
+        ).split(",") if t.strip()
+    ]
+
+    # Messages left in "sending" this long (worker died mid-send) are retried
+    MESSAGE_CLAIM_TIMEOUT_MINUTES = int(os.getenv("MESSAGE_CLAIM_TIMEOUT_MINUTES", "10"))
+    
+    # Transactional outbox relay (API handlers only commit; the relay dispatches)
+    OUTBOX_RELAY_INTERVAL_SECONDS = int(os.getenv("OUTBOX_RELAY_INTERVAL_SECONDS", "5"))
+    OUTBOX_RELAY_BATCH_SIZE = int(os.getenv("OUTBOX_RELAY_BATCH_SIZE", "100"))
+    OUTBOX_MAX_ATTEMPTS = int(os.getenv("OUTBOX_MAX_ATTEMPTS", "5"))
+    OUTBOX_RETENTION_HOURS = int(os.getenv("OUTBOX_RETENTION_HOURS", "24"))  # Keep processed events this long
+    # Status callbacks for an unknown SID are kept this long for the SENT transition to pick up
+    PENDING_CALLBACK_RETENTION_HOURS = int(os.getenv("PENDING_CALLBACK_RETENTION_HOURS", "24"))
+    
+    # Retention: final messages and audit logs older than this move to the
+    # *_archive tables in batches (0 keeps them in the hot tables), and
+    # archived rows older than ARCHIVE_RETENTION_MONTHS are deleted (0 keeps them)
+    MESSAGE_RETENTION_MONTHS = int(os.getenv("MESSAGE_RETENTION_MONTHS", "6"))
+    AUDIT_LOG_RETENTION_MONTHS = int(os.getenv("AUDIT_LOG_RETENTION_MONTHS", "12"))
+    ARCHIVE_RETENTION_MONTHS = int(os.getenv("ARCHIVE_RETENTION_MONTHS", "0"))
+    RETENTION_BATCH_SIZE = int(os.getenv("RETENTION_BATCH_SIZE", "1000"))  # rows moved per transaction
+    
+    # Audit log writer: events are buffered in memory and bulk-inserted every
+    # AUDIT_FLUSH_INTERVAL_SECONDS or AUDIT_BATCH_SIZE events. Actions listed in
+    # AUDIT_DURABLE_ACTIONS (e.g. "opt_out,opt_in") are written before returning
+    AUDIT_BUFFER_ENABLED = os.getenv("AUDIT_BUFFER_ENABLED", "true").lower() == "true"
+    AUDIT_QUEUE_SIZE = int(os.getenv("AUDIT_QUEUE_SIZE", "10000"))  # Events held in memory; when full, writes are synchronous
+    AUDIT_BATCH_SIZE = int(os.getenv("AUDIT_BATCH_SIZE", "200"))
+    AUDIT_FLUSH_INTERVAL_SECONDS = float(os.getenv("AUDIT_FLUSH_INTERVAL_SECONDS", "2"))
+    AUDIT_DURABLE_ACTIONS = {a.strip() for a in os.getenv("AUDIT_DURABLE_ACTIONS", "").split(",") if a.strip()}
+    
+    # Audit log backend: "database" (the audit_logs table) or "jsonl" (rotated,
+    # compressed append-only segment files in AUDIT_LOG_DIR; see app/audit_store.py)
+    AUDIT_BACKEND = os.getenv("AUDIT_BACKEND", "database").lower()
+    AUDIT_LOG_DIR = os.getenv("AUDIT_LOG_DIR", "./audit_logs")
+    AUDIT_SEGMENT_MAX_BYTES = int(os.getenv("AUDIT_SEGMENT_MAX_BYTES", str(16 * 1024 * 1024)))  # Seal the active segment at this size
+    AUDIT_SEGMENT_MAX_AGE_HOURS = int(os.getenv("AUDIT_SEGMENT_MAX_AGE_HOURS", "24"))  # ... or age
+    AUDIT_SEGMENT_COMPRESSION = os.getenv("AUDIT_SEGMENT_COMPRESSION", "auto").lower()  # auto, zstd, lz4, zlib, none
+    AUDIT_SEGMENT_FSYNC = os.getenv("AUDIT_SEGMENT_FSYNC", "false").lower() == "true"  # fsync every append
+    # Audit message sends and delivery webhooks too (high volume; on by default with the jsonl backend)
+    AUDIT_MESSAGE_EVENTS = os.getenv("AUDIT_MESSAGE_EVENTS", "true" if AUDIT_BACKEND == "jsonl" else "false").lower() == "true"
+    
+    # Admission control: shed non-critical enqueue requests when dispatch falls behind
+    ADMISSION_CONTROL_ENABLED = os.getenv("ADMISSION_CONTROL_ENABLED", "true").lower() == "true"
+    ADMISSION_MAX_PENDING_BACKLOG = int(os.getenv("ADMISSION_MAX_PENDING_BACKLOG", "5000"))  # Due messages + outbox events
+    ADMISSION_MAX_BACKGROUND_TASKS = int(os.getenv("ADMISSION_MAX_BACKGROUND_TASKS", "50"))  # Per worker process
+    ADMISSION_RETRY_AFTER_SECONDS = int(os.getenv("ADMISSION_RETRY_AFTER_SECONDS", "30"))
+    ADMISSION_BACKLOG_REFRESH_SECONDS = int(os.getenv("ADMISSION_BACKLOG_REFRESH_SECONDS", "5"))
     
     # Pagination settings
     DEFAULT_PAGE_SIZE = int(os.getenv("DEFAULT_PAGE_SIZE", "50"))
@@ -55,7 +144,49 @@ class Config:
     
     # Performance settings
     ENABLE_CACHING = os.getenv("ENABLE_CACHING", "true").lower() == "true"
-    QUERY_TIMEOUT = int(os.getenv("QUERY_TIMEOUT", "30"))  # seconds
+    QUERY_TIMEOUT = int(os.getenv("QUERY_TIMEOUT", "30"))  # seconds per statement, enforced on every connection (0 disables)
+    
+    # Per-request query accounting (X-DB-* response headers) and N+1 warnings
+    QUERY_TRACKING_ENABLED = os.getenv("QUERY_TRACKING_ENABLED", "true").lower() == "true"
+    QUERY_NPLUS1_THRESHOLD = int(os.getenv("QUERY_NPLUS1_THRESHOLD", "5"))  # Same statement this many times in one request
+    QUERY_COUNT_WARNING = int(os.getenv("QUERY_COUNT_WARNING", "50"))  # Warn above this many queries per request
+    
+    # Slow-query log: statements slower than this are logged with their origin (0 disables)
+    SLOW_QUERY_MS = float(os.getenv("SLOW_QUERY_MS", "500"))
+    # Attach the query plan to slow SELECTs: "off", "plan" (EXPLAIN / EXPLAIN QUERY PLAN) or
+    # "analyze" (EXPLAIN ANALYZE where supported - runs the query a second time)
+    SLOW_QUERY_EXPLAIN = os.getenv("SLOW_QUERY_EXPLAIN", "off").lower()
+    SLOW_QUERY_EXPLAIN_INTERVAL = int(os.getenv("SLOW_QUERY_EXPLAIN_INTERVAL", "300"))  # seconds between plans per statement
+    
+    # Cache backend: "auto" (Redis, in-memory fallback while it is down), "redis" or "memory"
+    CACHE_BACKEND = os.getenv("CACHE_BACKEND", "auto").lower()
+    CACHE_MEMORY_MAX_ENTRIES = int(os.getenv("CACHE_MEMORY_MAX_ENTRIES", "10000"))
+    CACHE_REDIS_RETRY_SECONDS = int(os.getenv("CACHE_REDIS_RETRY_SECONDS", "30"))
+    
+    # Cache payload encoding: codec "auto" (orjson > msgpack > json) or one of them,
+    # compression "auto" (zstd > lz4 > zlib), one of them, or "none"
+    CACHE_CODEC = os.getenv("CACHE_CODEC", "auto").lower()
+    CACHE_COMPRESSION = os.getenv("CACHE_COMPRESSION", "auto").lower()
+    CACHE_COMPRESSION_MIN_BYTES = int(os.getenv("CACHE_COMPRESSION_MIN_BYTES", "4096"))
+    
+    # In-process (L1) cache in front of the backend
+    CACHE_L1_MAX_ENTRIES = int(os.getenv("CACHE_L1_MAX_ENTRIES", "1000"))
+    CACHE_L1_TTL = int(os.getenv("CACHE_L1_TTL", "10"))  # seconds
+    CACHE_STALE_SECONDS = int(os.getenv("CACHE_STALE_SECONDS", "30"))  # stale grace while a key is recomputed
+    CACHE_SINGLE_FLIGHT_TIMEOUT = float(os.getenv("CACHE_SINGLE_FLIGHT_TIMEOUT", "10"))  # seconds
+    CACHE_INVALIDATION_CHANNEL = os.getenv("CACHE_INVALIDATION_CHANNEL", "cache:invalidate")
+    
+    # Response cache TTLs per route (seconds)
+    CACHE_TTL_TEMPLATES = int(os.getenv("CACHE_TTL_TEMPLATES", "300"))
+    CACHE_TTL_BROADCASTS = int(os.getenv("CACHE_TTL_BROADCASTS", "30"))
+    CACHE_TTL_METRICS = int(os.getenv("CACHE_TTL_METRICS", "60"))
+    CACHE_TTL_PATIENT = int(os.getenv("CACHE_TTL_PATIENT", "300"))
+    CACHE_TTL_PATIENT_APPOINTMENTS = int(os.getenv("CACHE_TTL_PATIENT_APPOINTMENTS", "60"))
+    CACHE_TTL_PATIENT_MESSAGES = int(os.getenv("CACHE_TTL_PATIENT_MESSAGES", "30"))
+    CACHE_TTL_DASHBOARD = int(os.getenv("CACHE_TTL_DASHBOARD", "10"))
+    
+    # Dashboard summary: days after today counted as "upcoming" appointments
+    DASHBOARD_UPCOMING_DAYS = int(os.getenv("DASHBOARD_UPCOMING_DAYS", "7"))
 
 # Create config instance
 config = Config()
\ No newline at end of file
@@ -1,34 +1,155 @@
 from sqlalchemy import create_engine, event
 from sqlalchemy.orm import sessionmaker, scoped_session
-from sqlalchemy.pool import QueuePool, NullPool
+from sqlalchemy.pool import AsyncAdaptedQueuePool, QueuePool, NullPool
+from fastapi import Request
+from starlette.concurrency import run_in_threadpool
 from app.models import Base
 from app.config import config
+from app.replicas import Replica, ReplicaRouter, prefers_primary
+from app.pool_metrics import pool_monitor
+from typing import Optional
+import importlib.util
 import logging
+import time
 
 logger = logging.getLogger(__name__)
 
+# Optional async support (SQLAlchemy's asyncio extension needs greenlet)
+try:
+    from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker, create_async_engine
+    SQLALCHEMY_ASYNC_AVAILABLE = True
+except ImportError:
+    SQLALCHEMY_ASYNC_AVAILABLE = False
+
+def set_sqlite_journal_mode(dbapi_conn, connection_record):
+    """Enable WAL mode: readers don't block the writer or each other
+    
+    journal_mode=WAL is stored in the database file, so it only needs
+    setting on an engine's first connection.
+    """
+    cursor = dbapi_conn.cursor()
+    cursor.execute("PRAGMA journal_mode=WAL")
+    cursor.close()
+
+def set_sqlite_pragma(dbapi_conn, connection_record):
+    """Set SQLite pragmas for better performance (once per pooled connection)"""
+    cursor = dbapi_conn.cursor()
+    # Wait for the write lock instead of failing with "database is locked"
+    cursor.execute(f"PRAGMA busy_timeout={config.SQLITE_BUSY_TIMEOUT_MS}")
+    # In WAL mode NORMAL only syncs at checkpoints; commits survive an app crash
+    cursor.execute(f"PRAGMA synchronous={config.SQLITE_SYNCHRONOUS}")
+    # Increase cache size
+    cursor.execute(f"PRAGMA cache_size=-{config.SQLITE_CACHE_SIZE_KB}")
+    # Read the file through mmap instead of read() calls
+    cursor.execute(f"PRAGMA mmap_size={config.SQLITE_MMAP_SIZE}")
+    # Sorts and temp indexes in memory
+    cursor.execute("PRAGMA temp_store=MEMORY")
+    # Enable foreign keys
+    cursor.execute("PRAGMA foreign_keys=ON")
+    cursor.close()
+
+def is_sqlite_memory(url: str) -> bool:
+    """In-memory SQLite URL (each connection would get its own empty database)"""
+    return url.split("://", 1)[-1] in ("", "/:memory:") or "mode=memory" in url
+
+def sqlite_pool_args(
+    url: str, name: str, pool_size: Optional[int], base=QueuePool, pool_timeout: Optional[float] = config.DB_POOL_TIMEOUT
+) -> dict:
+    """A bounded pool for file databases; in-memory databases keep NullPool
+    
+    pool_timeout=None waits for a connection indefinitely.
+    """
+    if is_sqlite_memory(url):
+        return {"poolclass": pool_monitor.pool_class(name, NullPool)}
+    return {
+        "poolclass": pool_monitor.pool_class(name, base),
+        "pool_size": pool_size or config.SQLITE_POOL_SIZE,
+        "max_overflow": 0,  # SQLite has one writer; more connections only add lock contention
+        "pool_timeout": pool_timeout
+    }
+
+# Statement timeouts (QUERY_TIMEOUT) for every connection of every session
+# Server-side setting per dialect, in milliseconds
+STATEMENT_TIMEOUT_SQL = {
+    "postgresql": "SET statement_timeout = {ms}",
+    "mysql": "SET SESSION max_execution_time = {ms}",
+}
+
+def set_sqlite_statement_deadline(dbapi_conn, connection_record):
+    """SQLite has no statement timeout: interrupt statements past their deadline"""
+    if not hasattr(dbapi_conn, "set_progress_handler"):
+        return  # aiosqlite runs the connection in its own thread
+    info = connection_record.info
+    
+    def past_deadline():
+        deadline = info.get("statement_deadline")
+        return 1 if deadline and time.monotonic() > deadline else 0
+    
+    # Called every 10k VM instructions; a non-zero return aborts with "interrupted"
+    dbapi_conn.set_progress_handler(past_deadline, 10000)
+
+def start_sqlite_statement_deadline(conn, cursor, statement, parameters, context, executemany):
+    # Stays set while the rows are fetched; the next statement or checkin replaces it
+    conn.info["statement_deadline"] = time.monotonic() + config.QUERY_TIMEOUT
+
+def clear_sqlite_statement_deadline(dbapi_conn, connection_record):
+    connection_record.info.pop("statement_deadline", None)
+
+def apply_statement_timeout(db_engine):
+    """Enforce QUERY_TIMEOUT on an engine's connections (no-op when it is 0)"""
+    if not config.QUERY_TIMEOUT:
+        return
+    if db_engine.dialect.name == "sqlite":
+        event.listen(db_engine, "connect", set_sqlite_statement_deadline)
+        event.listen(db_engine, "before_cursor_execute", start_sqlite_statement_deadline)
+        event.listen(db_engine, "checkin", clear_sqlite_statement_deadline)
+    elif db_engine.dialect.name in STATEMENT_TIMEOUT_SQL:
+        statement = STATEMENT_TIMEOUT_SQL[db_engine.dialect.name].format(ms=config.QUERY_TIMEOUT * 1000)
+        
+        def set_statement_timeout(dbapi_conn, connection_record):
+            cursor = dbapi_conn.cursor()
+            cursor.execute(statement)
+            cursor.close()
+            # Commit so the pool's reset-on-return rollback doesn't undo the SET
+            dbapi_conn.commit()
+        
+        event.listen(db_engine, "connect", set_statement_timeout)
+
 # Database connection pool configuration for scalability
-# For PostgreSQL (production): Use connection pooling
-# For SQLite (development): Use NullPool (no pooling needed)
-if config.DATABASE_URL.startswith("sqlite"):
-    # SQLite: No connection pooling needed
-    engine = create_engine(
-        config.DATABASE_URL,
-        connect_args={"check_same_thread": False},
-        poolclass=NullPool,
-        echo=False
-    )
-else:
+# For PostgreSQL (production): Use connection pooling (DB_POOL_* settings)
+# For SQLite: A small bounded pool (SQLITE_POOL_SIZE), so pragmas run once per connection
+# Every pool is instrumented; see app/pool_metrics.py and /metrics/db-pool
+def create_db_engine(
+    url: str, name: str = "primary", pool_size: Optional[int] = None, pool_timeout: Optional[float] = config.DB_POOL_TIMEOUT
+):
+    """Engine for the primary or a read replica"""
+    if url.startswith("sqlite"):
+        db_engine = create_engine(
+            url,
+            connect_args={"check_same_thread": False},
+            echo=False,
+            **sqlite_pool_args(url, name, pool_size, pool_timeout=pool_timeout)
+        )
+        event.listen(db_engine, "first_connect", set_sqlite_journal_mode)
+        event.listen(db_engine, "connect", set_sqlite_pragma)
+        apply_statement_timeout(db_engine)
+        return pool_monitor.attach(db_engine)
+    
     # PostgreSQL/MySQL: Use connection pooling for scalability
-    engine = create_engine(
-        config.DATABASE_URL,
-        poolclass=QueuePool,
-        pool_size=20,  # Number of connections to maintain
-        max_overflow=40,  # Additional connections beyond pool_size
-        pool_pre_ping=True,  # Verify connections before using
-        pool_recycle=3600,  # Recycle connections after 1 hour
+    db_engine = pool_monitor.attach(create_engine(
+        url,
+        poolclass=pool_monitor.pool_class(name, QueuePool),
+        pool_size=config.DB_POOL_SIZE,  # Number of connections to maintain
+        max_overflow=config.DB_MAX_OVERFLOW,  # Additional connections beyond pool_size
+        pool_timeout=config.DB_POOL_TIMEOUT,  # Seconds to wait for a connection before failing
+        pool_pre_ping=config.DB_POOL_PRE_PING,  # Verify connections before using
+        pool_recycle=config.DB_POOL_RECYCLE,  # Recycle connections after this many seconds
         echo=False
-    )
+    ))
+    apply_statement_timeout(db_engine)
+    return db_engine
+
+engine = create_db_engine(config.DATABASE_URL)
 
 # Create session factory with scoped session for thread safety
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
@@ -36,6 +157,24 @@ SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
 # Scoped session for thread-safe operations
 SessionScoped = scoped_session(SessionLocal)
 
+# Dispatch (scheduler jobs, outbox relay, message sends, broadcast runs and
+# the manual drain endpoint) writes through a single SQLite connection of its
+# own: dispatch writers take turns on it rather than racing each other for
+# the database write lock, and request handlers never wait behind a dispatch
+# batch for a pooled connection. API writes still use the primary pool and
+# wait on busy_timeout. Dispatch waits for the connection without a timeout,
+# so a long broadcast delays the relay instead of failing it. The connection
+# is held for one transaction at a time: dispatch code commits before provider
+# calls and sleeps, and must never open a second dispatch session in a thread
+# that already holds one.
+# Other databases handle concurrent writers; dispatch shares the primary there.
+if engine.dialect.name == "sqlite" and not is_sqlite_memory(config.DATABASE_URL):
+    dispatch_engine = create_db_engine(config.DATABASE_URL, "dispatch", pool_size=1, pool_timeout=None)
+else:
+    dispatch_engine = engine
+
+DispatchSessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=dispatch_engine)
+
 # Dependency to get DB session
 def get_db():
     """Get database session with automatic cleanup"""
@@ -45,22 +184,180 @@ def get_db():
     finally:
         db.close()
 
+def get_dispatch_db():
+    """Session on the dispatch engine, for endpoints that run dispatch work inline"""
+    db = DispatchSessionLocal()
+    try:
+        yield db
+    finally:
+        db.close()
+
 # Create tables
 def create_tables():
     """Create all database tables"""
     Base.metadata.create_all(bind=engine)
     logger.info("Database tables created/verified")
 
-# Add connection pool event listeners for monitoring
-@event.listens_for(engine, "connect")
-def set_sqlite_pragma(dbapi_conn, connection_record):
-    """Set SQLite pragmas for better performance"""
-    if config.DATABASE_URL.startswith("sqlite"):
-        cursor = dbapi_conn.cursor()
-        # Enable WAL mode for better concurrency
-        cursor.execute("PRAGMA journal_mode=WAL")
-        # Increase cache size
-        cursor.execute("PRAGMA cache_size=-64000")  # 64MB cache
-        # Enable foreign keys
-        cursor.execute("PRAGMA foreign_keys=ON")
-        cursor.close()
\ No newline at end of file
+def sqlite_maintenance(checkpoint: str = "PASSIVE"):
+    """Checkpoint the WAL into the database file and refresh planner statistics
+    
+    PASSIVE never blocks readers or writers; TRUNCATE (used at shutdown)
+    waits for them and resets the WAL file to zero bytes. No-op for other
+    databases.
+    """
+    if engine.dialect.name != "sqlite":
+        return
+    with dispatch_engine.connect() as conn:
+        busy, wal_pages, checkpointed = conn.exec_driver_sql(f"PRAGMA wal_checkpoint({checkpoint})").one()
+        conn.exec_driver_sql("PRAGMA optimize")
+    logger.info(f"SQLite maintenance: checkpointed {checkpointed}/{wal_pages} WAL pages" + (" (busy)" if busy else ""))
+
+# Async engine for read endpoints
+# Async driver per dialect: (module to look for, SQLAlchemy driver name)
+ASYNC_DRIVERS = {
+    "sqlite": ("aiosqlite", "sqlite+aiosqlite"),
+    "postgresql": ("asyncpg", "postgresql+asyncpg"),
+}
+
+def async_database_url(url: str) -> Optional[str]:
+    """The async-driver form of a sync database URL (None if the driver isn't installed)"""
+    scheme, _, rest = url.partition("://")
+    dialect = scheme.split("+", 1)[0]
+    if dialect == "postgres":
+        dialect = "postgresql"
+    driver = ASYNC_DRIVERS.get(dialect)
+    if not driver or importlib.util.find_spec(driver[0]) is None:
+        return None
+    return f"{driver[1]}://{rest}"
+
+ASYNC_DATABASE_URL = None
+if config.ENABLE_ASYNC_DB and SQLALCHEMY_ASYNC_AVAILABLE:
+    ASYNC_DATABASE_URL = config.ASYNC_DATABASE_URL or async_database_url(config.DATABASE_URL)
+
+def create_async_db_engine(url: str, name: str = "async-primary"):
+    """Async engine for an async-driver URL (see async_database_url)"""
+    if url.startswith("sqlite"):
+        db_engine = create_async_engine(url, echo=False, **sqlite_pool_args(url, name, None, AsyncAdaptedQueuePool))
+        # Same per-connection pragmas as the sync engine
+        event.listen(db_engine.sync_engine, "first_connect", set_sqlite_journal_mode)
+        event.listen(db_engine.sync_engine, "connect", set_sqlite_pragma)
+    else:
+        db_engine = create_async_engine(
+            url,
+            poolclass=pool_monitor.pool_class(name, AsyncAdaptedQueuePool),
+            pool_size=config.DB_POOL_SIZE,
+            max_overflow=config.DB_MAX_OVERFLOW,
+            pool_timeout=config.DB_POOL_TIMEOUT,
+            pool_pre_ping=config.DB_POOL_PRE_PING,
+            pool_recycle=config.DB_POOL_RECYCLE,
+            echo=False
+        )
+    pool_monitor.attach(db_engine.sync_engine)
+    apply_statement_timeout(db_engine.sync_engine)
+    return db_engine
+
+def create_async_session_factory(db_engine):
+    # Results are buffered and objects stay usable after commit, as handlers return them
+    return async_sessionmaker(db_engine, expire_on_commit=False, autoflush=False)
+
+async_engine = None
+AsyncSessionLocal = None
+if ASYNC_DATABASE_URL:
+    async_engine = create_async_db_engine(ASYNC_DATABASE_URL)
+    AsyncSessionLocal = create_async_session_factory(async_engine)
+    logger.info(f"Async database engine enabled ({async_engine.dialect.driver})")
+else:
+    logger.info("No async database driver available; async endpoints use the threadpool")
+
+class ThreadpoolSession:
+    """Awaitable facade over a sync Session, used when no async driver is installed
+    
+    Implements the part of AsyncSession the endpoints use. Every call runs on
+    the threadpool, so the event loop never blocks on the database, and
+    execute() results are buffered like AsyncSession's.
+    """
+    
+    def __init__(self, session):
+        self.sync_session = session
+    
+    async def execute(self, statement, params=None):
+        def run():
+            return self.sync_session.execute(statement, params).freeze()
+        return (await run_in_threadpool(run))()
+    
+    async def scalar(self, statement, params=None):
+        return await run_in_threadpool(self.sync_session.scalar, statement, params)
+    
+    async def get(self, entity, ident):
+        return await run_in_threadpool(self.sync_session.get, entity, ident)
+    
+    async def run_sync(self, fn, *args, **kwargs):
+        return await run_in_threadpool(fn, self.sync_session, *args, **kwargs)
+    
+    async def commit(self):
+        await run_in_threadpool(self.sync_session.commit)
+    
+    async def rollback(self):
+        await run_in_threadpool(self.sync_session.rollback)
+    
+    async def close(self):
+        await run_in_threadpool(self.sync_session.close)
+
+def _open_async_session(replica: Optional[Replica] = None):
+    if replica is None:
+        return AsyncSessionLocal() if AsyncSessionLocal else ThreadpoolSession(SessionLocal())
+    if replica.async_session_factory:
+        return replica.async_session_factory()
+    return ThreadpoolSession(replica.session_factory())
+
+async def get_async_db():
+    """Get an async database session with automatic cleanup
+    
+    An AsyncSession when an async driver is available, otherwise a
+    ThreadpoolSession; both support execute/scalar/get/run_sync/commit.
+    """
+    db = _open_async_session()
+    try:
+        yield db
+    finally:
+        await db.close()
+
+# Read replicas (see app/replicas.py)
+def _create_replica(url: str, name: str) -> Replica:
+    replica_engine = create_db_engine(url, name)
+    async_url = async_database_url(url) if ASYNC_DATABASE_URL else None
+    if not async_url:
+        return Replica(replica_engine)
+    replica_async_engine = create_async_db_engine(async_url, f"async-{name}")
+    return Replica(replica_engine, replica_async_engine, create_async_session_factory(replica_async_engine))
+
+read_router = ReplicaRouter(
+    [_create_replica(url, f"replica-{i}") for i, url in enumerate(config.DATABASE_READ_URLS, 1)],
+    config.DB_REPLICA_MAX_LAG_SECONDS,
+    config.DB_REPLICA_CHECK_INTERVAL
+)
+
+def get_read_db(request: Request):
+    """Session for read-only endpoints: a healthy replica, else the primary"""
+    replica = read_router.route(prefers_primary(request))
+    db = replica.session_factory() if replica else SessionLocal()
+    try:
+        yield db
+    finally:
+        db.close()
+
+async def get_async_read_db(request: Request):
+    """Async session for read-only endpoints: a healthy replica, else the primary"""
+    db = _open_async_session(read_router.route(prefers_primary(request)))
+    try:
+        yield db
+    finally:
+        await db.close()
+
+async def dispose_async_engine():
+    """Close the async engines' pooled connections (application shutdown)"""
+    if async_engine is not None:
+        await async_engine.dispose()
+    for replica in read_router.replicas:
+        if replica.async_engine is not None:
+            await replica.async_engine.dispose()
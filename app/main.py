@@ -5,10 +5,15 @@ import uvicorn
 import logging
 import time
 
-from app.database import engine, Base, get_db, create_tables
+from app.database import engine, Base, get_db, create_tables, dispose_async_engine, read_router, sqlite_maintenance
+from app.replicas import READ_PRIMARY_COOKIE
+from app.query_metrics import start_tracking, stop_tracking
 from app.api import router
 from app.scheduler import AppointmentScheduler
 from app.templates.default_templates import create_default_templates
+from app.services.patient_stats import patient_stats_service
+from app.services.stat_counters import stat_counter_service
+from app.services.audit import audit_sink
 from app.config import config
 
 # Set up logging
@@ -44,6 +49,45 @@ async def add_process_time_header(request: Request, call_next):
     response.headers["X-Process-Time"] = str(process_time)
     return response
 
+# Per-request query counts, DB time and N+1 detection (see app/query_metrics.py)
+if config.QUERY_TRACKING_ENABLED:
+    @app.middleware("http")
+    async def track_queries(request: Request, call_next):
+        """Add X-DB-* headers and log requests with repeated or excessive queries"""
+        stats, token = start_tracking(f"{request.method} {request.url.path}")
+        try:
+            response = await call_next(request)
+        finally:
+            stop_tracking(token)
+        response.headers["X-DB-Query-Count"] = str(stats.count)
+        response.headers["X-DB-Time-Ms"] = f"{stats.total_ms:.1f}"
+        response.headers["X-DB-Repeated-Queries"] = str(stats.max_repeats)
+        
+        fields = {"path": request.url.path, "db_queries": stats.count, "db_time_ms": round(stats.total_ms, 1)}
+        for shape, n in stats.repeated(config.QUERY_NPLUS1_THRESHOLD):
+            logger.warning(f"Possible N+1 on {request.method} {request.url.path}: {n}x {shape[:300]}", extra=fields)
+        if stats.count > config.QUERY_COUNT_WARNING:
+            logger.warning(
+                f"{request.method} {request.url.path} ran {stats.count} queries ({stats.total_ms:.1f} ms)",
+                extra=fields
+            )
+        return response
+
+# Read-your-writes: after a client writes, its reads skip the replicas for a while
+@app.middleware("http")
+async def pin_reads_after_write(request: Request, call_next):
+    """Route a client's reads to the primary for DB_READ_YOUR_WRITES_SECONDS after a write"""
+    response = await call_next(request)
+    if read_router.enabled and request.method not in ("GET", "HEAD", "OPTIONS") and response.status_code < 400:
+        response.set_cookie(
+            READ_PRIMARY_COOKIE,
+            str(int(time.time()) + config.DB_READ_YOUR_WRITES_SECONDS),
+            max_age=config.DB_READ_YOUR_WRITES_SECONDS,
+            httponly=True,
+            samesite="lax"
+        )
+    return response
+
 # Add rate limiting middleware (if enabled)
 if config.RATE_LIMIT_ENABLED:
     try:
@@ -97,15 +141,34 @@ async def startup_event():
     # Start the scheduler
     scheduler.start()
     
+    # Start measuring replica lag (no-op without DATABASE_READ_URLS)
+    read_router.start()
+    
+    # Start the buffered audit log writer
+    audit_sink.start()
+    
     # Create default templates
     db = next(get_db())
     create_default_templates(db)
     logger.info("Default templates created")
+    
+    # Build the read models for databases that predate them
+    patient_stats_service.ensure_built(db)
+    stat_counter_service.ensure_built(db)
 
 @app.on_event("shutdown")
 async def shutdown_event():
     """Cleanup on application shutdown"""
     scheduler.shutdown()
+    read_router.stop()
+    # Write audit events still buffered in memory
+    audit_sink.stop()
+    try:
+        # Fold the WAL back into the database file and save planner statistics
+        sqlite_maintenance(checkpoint="TRUNCATE")
+    except Exception as e:
+        logger.warning(f"SQLite maintenance at shutdown failed: {str(e)}")
+    await dispose_async_engine()
 
 @app.get("/")
 async def root():
@@ -1,4 +1,4 @@
-from sqlalchemy import Column, Integer, String, Boolean, DateTime, ForeignKey, Text, Enum
+from sqlalchemy import Column, Integer, String, Boolean, DateTime, ForeignKey, Text, Enum, Index
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.orm import relationship
 import enum
@@ -9,6 +9,7 @@ Base = declarative_base()
 # Simple enums
 class MessageStatus(str, enum.Enum):
     PENDING = "pending"
+    SENDING = "sending"  # Claimed by a dispatcher, provider call in flight
     SENT = "sent"
     DELIVERED = "delivered"
     FAILED = "failed"
@@ -38,10 +39,25 @@ class Patient(Base):
     consent_source = Column(String(50))  # web_form, paper, phone, etc.
     created_at = Column(DateTime, default=datetime.now, index=True)  # Indexed for sorting
     
+    __table_args__ = (
+        Index("ix_patients_created_at_id", "created_at", "id"),  # Keyset pagination
+    )
+    
     # Relationships
     appointments = relationship("Appointment", back_populates="patient")
     messages = relationship("Message", back_populates="patient")
 
+# Per-patient read model for the patient list (see app/services/patient_stats.py)
+class PatientStats(Base):
+    __tablename__ = "patient_stats"
+    
+    patient_id = Column(Integer, ForeignKey("patients.id"), primary_key=True)
+    appointment_count = Column(Integer, nullable=False, default=0)
+    message_count = Column(Integer, nullable=False, default=0)
+    last_appointment_date = Column(DateTime)
+    last_appointment_status = Column(String(20))
+    updated_at = Column(DateTime, default=datetime.now, onupdate=datetime.now)
+
 class Appointment(Base):
     __tablename__ = "appointments"
     
@@ -55,6 +71,12 @@ class Appointment(Base):
     appointment_type = Column(String(100), nullable=True)  # Type of appointment (e.g., "Cleaning", "Checkup", "Root Canal")
     created_at = Column(DateTime, default=datetime.now)
     
+    __table_args__ = (
+        # Keyset pagination, overall and per patient
+        Index("ix_appointments_date_id", "appointment_date", "id"),
+        Index("ix_appointments_patient_date_id", "patient_id", "appointment_date", "id"),
+    )
+    
     # Relationships
     patient = relationship("Patient", back_populates="appointments")
     reminders = relationship("Message", back_populates="appointment")
@@ -71,20 +93,56 @@ class Message(Base):
     reminder_stage = Column(Enum(ReminderStage), nullable=True)  # Only for appointment reminders
     content = Column(Text, nullable=False)
     status = Column(Enum(MessageStatus), default=MessageStatus.PENDING)
-    provider_message_id = Column(String(100))  # Twilio message ID
+    provider_message_id = Column(String(100), index=True)  # Twilio message ID (status callbacks look it up)
     scheduled_for = Column(DateTime)
     sent_at = Column(DateTime)
     delivered_at = Column(DateTime)
     error_message = Column(Text)  # Error details if failed
     retry_count = Column(Integer, default=0)  # Number of retry attempts
+    claimed_at = Column(DateTime)  # When a dispatcher moved it to SENDING
+    coalesced_into_id = Column(Integer, ForeignKey("messages.id"), nullable=True, index=True)  # Set when merged into another message's send
     created_at = Column(DateTime, default=datetime.now)
     
+    __table_args__ = (
+        Index("ix_messages_status_scheduled_for", "status", "scheduled_for"),  # Due-message lookups
+        # Keyset pagination, overall and per patient
+        Index("ix_messages_created_at_id", "created_at", "id"),
+        Index("ix_messages_patient_created_at_id", "patient_id", "created_at", "id"),
+        # Never reuse the id of an archived row: (created_at, id) must stay unique across messages_archive
+        {"sqlite_autoincrement": True},
+    )
+    
     # Relationships
     patient = relationship("Patient", back_populates="messages")
     appointment = relationship("Appointment", back_populates="reminders")
     template = relationship("MessageTemplate", back_populates="messages")
     broadcast = relationship("Broadcast", back_populates="messages")
 
+class OutboxEvent(Base):
+    __tablename__ = "message_outbox"
+    
+    id = Column(Integer, primary_key=True, index=True)  # Relay order
+    message_id = Column(Integer, ForeignKey("messages.id"), nullable=False, index=True)
+    event_type = Column(String(50), nullable=False, default="dispatch")
+    payload = Column(Text)  # JSON string (template context for the dispatcher)
+    attempts = Column(Integer, default=0)  # Relay attempts so far
+    last_error = Column(Text)
+    created_at = Column(DateTime, default=datetime.now)
+    processed_at = Column(DateTime, nullable=True, index=True)  # NULL until the relay has dispatched it
+    
+    # Relationships
+    message = relationship("Message")
+
+class PendingStatusCallback(Base):
+    """Provider status callback that arrived before the SENT transition stored its SID"""
+    __tablename__ = "pending_status_callbacks"
+    
+    id = Column(Integer, primary_key=True, index=True)
+    provider_message_id = Column(String(100), nullable=False, index=True)
+    status = Column(Enum(MessageStatus), nullable=False)  # DELIVERED or FAILED
+    error_message = Column(Text)
+    received_at = Column(DateTime, default=datetime.now, index=True)
+
 class MessageTemplate(Base):
     __tablename__ = "message_templates"
     
@@ -127,6 +185,61 @@ class AuditLog(Base):
     entity_id = Column(Integer)
     details = Column(Text)  # JSON string for additional details
     created_at = Column(DateTime, default=datetime.now)
+    
+    __table_args__ = (
+        Index("ix_audit_logs_created_at_id", "created_at", "id"),  # Keyset pagination
+        {"sqlite_autoincrement": True},  # See Message
+    )
+
+# Cold storage for messages and audit logs past their retention window (see
+# app/services/retention.py). Same columns as the hot tables plus archived_at,
+# without foreign keys, so archived rows never block deletes upstream. The
+# primary key includes created_at because PostgreSQL partitions these tables
+# by month on it; SQLite ignores the partitioning.
+class ArchivedMessage(Base):
+    __tablename__ = "messages_archive"
+    
+    id = Column(Integer, primary_key=True, autoincrement=False)
+    patient_id = Column(Integer, nullable=False)
+    appointment_id = Column(Integer)
+    template_id = Column(Integer)
+    broadcast_id = Column(Integer)
+    message_type = Column(Enum(MessageType), nullable=False)
+    reminder_stage = Column(Enum(ReminderStage))
+    content = Column(Text, nullable=False)
+    status = Column(Enum(MessageStatus))
+    provider_message_id = Column(String(100))
+    scheduled_for = Column(DateTime)
+    sent_at = Column(DateTime)
+    delivered_at = Column(DateTime)
+    error_message = Column(Text)
+    retry_count = Column(Integer)
+    claimed_at = Column(DateTime)
+    coalesced_into_id = Column(Integer)
+    created_at = Column(DateTime, primary_key=True)
+    archived_at = Column(DateTime, default=datetime.now)
+    
+    __table_args__ = (
+        Index("ix_messages_archive_created_at_id", "created_at", "id"),
+        Index("ix_messages_archive_patient_created_at_id", "patient_id", "created_at", "id"),
+        {"postgresql_partition_by": "RANGE (created_at)"},
+    )
+
+class ArchivedAuditLog(Base):
+    __tablename__ = "audit_logs_archive"
+    
+    id = Column(Integer, primary_key=True, autoincrement=False)
+    action = Column(String(50), nullable=False)
+    entity_type = Column(String(50))
+    entity_id = Column(Integer)
+    details = Column(Text)
+    created_at = Column(DateTime, primary_key=True)
+    archived_at = Column(DateTime, default=datetime.now)
+    
+    __table_args__ = (
+        Index("ix_audit_logs_archive_created_at_id", "created_at", "id"),
+        {"postgresql_partition_by": "RANGE (created_at)"},
+    )
 
 class User(Base):
     __tablename__ = "users"
@@ -147,4 +260,12 @@ class User(Base):
     shift_timing = Column(String(50))  # For staff
     admin_code = Column(String(50))  # For admin
     designation = Column(String(100))  # For admin
-    access_level = Column(String(50))  # For admin
\ No newline at end of file
+    access_level = Column(String(50))  # For admin
+
+# Named counters for the dashboard summary (see app/services/stat_counters.py)
+class StatCounter(Base):
+    __tablename__ = "stat_counters"
+    
+    name = Column(String(100), primary_key=True)  # e.g. patients.total, messages.status.sent, appointments.date.2025-01-31
+    value = Column(Integer, nullable=False, default=0)
+    updated_at = Column(DateTime, default=datetime.now, onupdate=datetime.now)
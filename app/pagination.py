@@ -0,0 +1,147 @@
+"""
+Pagination helpers for list endpoints.
+
+Two modes share one response builder:
+- offset mode (page/page_size + total), kept for compatibility
+- keyset mode, selected by passing a cursor (an empty cursor starts at the
+  first page). Rows are filtered with (sort, id) < (cursor sort, cursor id)
+  against a composite index, so deep pages cost the same as page 1 and no
+  COUNT is run.
+
+paginate() takes a legacy Query on a sync session; paginate_async() takes
+a select() statement and an async session. combine_sources() lets either
+page over several tables with the same columns at once (e.g. a hot table
+and its archive).
+"""
+import base64
+import json
+from datetime import datetime
+from typing import Any, Callable, List, Optional, Tuple
+
+from fastapi import HTTPException
+from sqlalchemy import and_, func, or_, select, union_all
+
+def encode_cursor(sort_value: Any, row_id: int) -> str:
+    """Build an opaque cursor from the last row's (sort value, id)"""
+    if isinstance(sort_value, datetime):
+        sort_value = {"dt": sort_value.isoformat()}
+    raw = json.dumps([sort_value, row_id], separators=(",", ":")).encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip("=")
+
+def decode_cursor(cursor: str) -> Tuple[Any, int]:
+    """Parse a cursor produced by encode_cursor"""
+    try:
+        raw = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4))
+        sort_value, row_id = json.loads(raw)
+        if isinstance(sort_value, dict):
+            sort_value = datetime.fromisoformat(sort_value["dt"])
+        return sort_value, int(row_id)
+    except Exception:
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+
+def apply_keyset(query, sort_column, id_column, cursor: Optional[str]):
+    """Order newest first by (sort, id) and skip everything up to the cursor"""
+    if cursor:
+        sort_value, row_id = decode_cursor(cursor)
+        if sort_value is None:
+            query = query.filter(and_(sort_column == None, id_column < row_id))
+        else:
+            query = query.filter(or_(
+                sort_column < sort_value,
+                and_(sort_column == sort_value, id_column < row_id)
+            ))
+    return query.order_by(sort_column.desc(), id_column.desc())
+
+def combine_sources(statements: List, sort_key: str = "created_at", id_key: str = "id"):
+    """One statement over select()s with the same columns, plus its (sort, id) columns
+    
+    A single statement is returned as is; several are combined with UNION ALL.
+    """
+    if len(statements) == 1:
+        statement = statements[0]
+        return statement, statement.selected_columns[sort_key], statement.selected_columns[id_key]
+    combined = union_all(*statements).subquery()
+    return select(combined), combined.c[sort_key], combined.c[id_key]
+
+def empty_page(page: int, page_size: int, cursor: Optional[str]) -> dict:
+    """Response for a filter that matches nothing"""
+    if cursor is not None:
+        return {"items": [], "page_size": page_size, "next_cursor": None}
+    return {"items": [], "total": 0, "page": page, "page_size": page_size, "total_pages": 0, "next_cursor": None}
+
+def _keyset_page(rows, page_size: int, serialize, cursor_key) -> dict:
+    has_more = len(rows) > page_size
+    rows = rows[:page_size]
+    return {
+        "items": [serialize(row) for row in rows],
+        "page_size": page_size,
+        "next_cursor": encode_cursor(*cursor_key(rows[-1])) if has_more else None
+    }
+
+def _offset_page(rows, total_count: int, page: int, page_size: int, serialize, cursor_key) -> dict:
+    has_more = (page - 1) * page_size + len(rows) < total_count
+    return {
+        "items": [serialize(row) for row in rows],
+        "total": total_count,
+        "page": page,
+        "page_size": page_size,
+        "total_pages": (total_count + page_size - 1) // page_size,
+        # Lets offset clients switch to keyset mode for the following pages
+        "next_cursor": encode_cursor(*cursor_key(rows[-1])) if rows and has_more else None
+    }
+
+def page_from_rows(
+    rows,
+    page: int,
+    page_size: int,
+    cursor: Optional[str],
+    serialize: Callable[[Any], dict],
+    cursor_key: Callable[[Any], Tuple[Any, int]],
+    total_count: int = 0
+) -> dict:
+    """Response for rows fetched from a non-SQL source (page_size + 1 rows in keyset mode)"""
+    if cursor is not None:
+        return _keyset_page(rows, page_size, serialize, cursor_key)
+    return _offset_page(rows, total_count, page, page_size, serialize, cursor_key)
+
+def paginate(
+    query,
+    sort_column,
+    id_column,
+    page: int,
+    page_size: int,
+    cursor: Optional[str],
+    serialize: Callable[[Any], dict],
+    cursor_key: Callable[[Any], Tuple[Any, int]]
+) -> dict:
+    """Run a list query in keyset mode (cursor given) or offset mode"""
+    if cursor is not None:
+        # Fetch one extra row to know whether there is a next page
+        rows = apply_keyset(query, sort_column, id_column, cursor).limit(page_size + 1).all()
+        return _keyset_page(rows, page_size, serialize, cursor_key)
+
+    total_count = query.count()
+    offset = (page - 1) * page_size
+    rows = apply_keyset(query, sort_column, id_column, None).offset(offset).limit(page_size).all()
+    return _offset_page(rows, total_count, page, page_size, serialize, cursor_key)
+
+async def paginate_async(
+    db,
+    statement,
+    sort_column,
+    id_column,
+    page: int,
+    page_size: int,
+    cursor: Optional[str],
+    serialize: Callable[[Any], dict],
+    cursor_key: Callable[[Any], Tuple[Any, int]]
+) -> dict:
+    """paginate() for a select() statement on an async session (see get_async_db)"""
+    if cursor is not None:
+        result = await db.execute(apply_keyset(statement, sort_column, id_column, cursor).limit(page_size + 1))
+        return _keyset_page(result.all(), page_size, serialize, cursor_key)
+
+    total_count = await db.scalar(select(func.count()).select_from(statement.order_by(None).subquery()))
+    offset = (page - 1) * page_size
+    result = await db.execute(apply_keyset(statement, sort_column, id_column, None).offset(offset).limit(page_size))
+    return _offset_page(result.all(), total_count, page, page_size, serialize, cursor_key)
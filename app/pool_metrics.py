@@ -0,0 +1,162 @@
+"""
+Connection-pool instrumentation.
+
+Every engine's pool is registered here under a name ("primary",
+"replica-1", "async-primary", ...). Pool events count connections opened,
+checkouts/checkins and invalidations and track how many connections are in
+use. Checkout wait time - how long a request waited for a connection,
+including opening a new one and the pre-ping - has no pool event, so the
+engine is given a pool subclass that times connect() into a histogram and
+counts QueuePool timeouts.
+
+GET /metrics/db-pool exposes the snapshot, so pool_size/max_overflow can be
+tuned from real numbers: sustained waits or timeouts mean the pool is too
+small, a peak well below pool_size means it can shrink.
+"""
+import bisect
+import threading
+import time
+from typing import Dict, List, Optional
+
+from sqlalchemy import event, exc
+
+# Upper bounds (ms) of the checkout wait histogram buckets; the last bucket is open-ended
+WAIT_BUCKETS_MS = [1, 5, 10, 25, 50, 100, 250, 500, 1000, 2500, 5000]
+
+class PoolStats:
+    """Counters, gauges and the checkout wait histogram for one pool"""
+
+    def __init__(self, name: str):
+        self.name = name
+        self.pool_class = None
+        self.pool = None
+        self._lock = threading.Lock()
+        self.connects = 0
+        self.checkouts = 0
+        self.checkins = 0
+        self.invalidations = 0
+        self.timeouts = 0
+        self.in_use = 0
+        self.peak_in_use = 0
+        self.wait_buckets = [0] * (len(WAIT_BUCKETS_MS) + 1)
+        self.wait_total_ms = 0.0
+        self.wait_max_ms = 0.0
+
+    def record_wait(self, elapsed_ms: float, timed_out: bool = False):
+        with self._lock:
+            self.wait_buckets[bisect.bisect_left(WAIT_BUCKETS_MS, elapsed_ms)] += 1
+            self.wait_total_ms += elapsed_ms
+            self.wait_max_ms = max(self.wait_max_ms, elapsed_ms)
+            if timed_out:
+                self.timeouts += 1
+
+    def on_connect(self, dbapi_conn, connection_record):
+        with self._lock:
+            self.connects += 1
+
+    def on_checkout(self, dbapi_conn, connection_record, connection_proxy):
+        with self._lock:
+            self.checkouts += 1
+            self.in_use += 1
+            self.peak_in_use = max(self.peak_in_use, self.in_use)
+
+    def on_checkin(self, dbapi_conn, connection_record):
+        with self._lock:
+            self.checkins += 1
+            self.in_use = max(self.in_use - 1, 0)
+
+    def on_invalidate(self, dbapi_conn, connection_record, exception):
+        with self._lock:
+            self.invalidations += 1
+
+    def snapshot(self) -> dict:
+        with self._lock:
+            waits = sum(self.wait_buckets)
+            labels = [f"<={bound}ms" for bound in WAIT_BUCKETS_MS] + [f">{WAIT_BUCKETS_MS[-1]}ms"]
+            data = {
+                "pool_class": self.pool_class,
+                "in_use": self.in_use,
+                "peak_in_use": self.peak_in_use,
+                "connects": self.connects,
+                "checkouts": self.checkouts,
+                "checkins": self.checkins,
+                "invalidations": self.invalidations,
+                "timeouts": self.timeouts,
+                "checkout_wait_ms": {
+                    "count": waits,
+                    "mean": round(self.wait_total_ms / waits, 3) if waits else 0.0,
+                    "max": round(self.wait_max_ms, 3),
+                    "histogram": dict(zip(labels, self.wait_buckets))
+                }
+            }
+        # QueuePool gauges (NullPool/StaticPool have no fixed size)
+        pool = self.pool
+        if pool is not None and hasattr(pool, "overflow"):
+            data.update({
+                "size": pool.size(),
+                "checked_in": pool.checkedin(),
+                "checked_out": pool.checkedout(),
+                "overflow": max(pool.overflow(), 0),
+                "timeout_seconds": pool.timeout()
+            })
+        return data
+
+class TimedPoolMixin:
+    """Times connect() (the checkout as seen by the engine) into `stats`"""
+
+    stats: PoolStats = None
+
+    def connect(self):
+        start = time.perf_counter()
+        timed_out = False
+        try:
+            return super().connect()
+        except exc.TimeoutError:
+            timed_out = True
+            raise
+        finally:
+            self.stats.record_wait((time.perf_counter() - start) * 1000, timed_out)
+
+class PoolMonitor:
+    """Registry of instrumented pools"""
+
+    def __init__(self):
+        self._pools: Dict[str, PoolStats] = {}
+        self._lock = threading.Lock()
+
+    def pool_class(self, name: str, base):
+        """Timed subclass of `base` for a pool registered as `name`
+
+        The stats live on the class so they survive pool.recreate(), which
+        rebuilds the pool from self.__class__.
+        """
+        stats = PoolStats(name)
+        stats.pool_class = base.__name__
+        with self._lock:
+            self._pools[name] = stats
+        return type(f"Timed{base.__name__}", (TimedPoolMixin, base), {"stats": stats})
+
+    def attach(self, engine):
+        """Register pool event listeners on an engine created with a pool_class() pool"""
+        stats = engine.pool.stats
+        stats.pool = engine.pool
+        event.listen(engine, "connect", stats.on_connect)
+        event.listen(engine, "checkout", stats.on_checkout)
+        event.listen(engine, "checkin", stats.on_checkin)
+        event.listen(engine, "invalidate", stats.on_invalidate)
+        # Keep the gauges pointed at the live pool after engine.dispose()
+        event.listen(engine, "engine_disposed", lambda e: setattr(stats, "pool", e.pool))
+        return engine
+
+    def names(self) -> List[str]:
+        return list(self._pools)
+
+    def snapshot(self, name: Optional[str] = None) -> dict:
+        with self._lock:
+            pools = dict(self._pools)
+        if name is not None:
+            return {name: pools[name].snapshot()} if name in pools else {}
+        return {pool_name: stats.snapshot() for pool_name, stats in pools.items()}
+
+# Create singleton instance
+pool_monitor = PoolMonitor()
@@ -0,0 +1,244 @@
+"""
+Per-request query accounting and N+1 detection.
+
+Listeners on every Engine's before/after_cursor_execute events record each
+statement into the QueryStats of the current request (a contextvar set by
+the middleware in app/main.py): query count, total DB time and a count per
+statement fingerprint (SQL with literals and IN-lists collapsed). The same
+fingerprint running QUERY_NPLUS1_THRESHOLD or more times in one request is
+the signature of an N+1 loop and is logged as a warning. Totals are returned
+as X-DB-Query-Count / X-DB-Time-Ms / X-DB-Repeated-Queries headers.
+
+capture_queries() / assert_max_queries() collect statements process-wide
+instead, so they also see queries run by a TestClient in another thread:
+
+    with assert_max_queries(3):
+        client.get("/api/broadcasts/")
+
+Statements slower than SLOW_QUERY_MS go to the "app.slow_queries" logger
+with their fingerprint, the types (never the values - they carry patient
+data) of their bound parameters, where they came from (the request, or the
+scheduler job via query_origin()/attributed()) and, with SLOW_QUERY_EXPLAIN
+set, the query plan of slow SELECTs at most once per
+SLOW_QUERY_EXPLAIN_INTERVAL per statement.
+"""
+import functools
+import logging
+import re
+import threading
+import time
+from collections import Counter
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Iterator, List, Optional, Tuple
+
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+from app.config import config
+
+slow_query_logger = logging.getLogger("app.slow_queries")
+
+_IN_LIST = re.compile(r"\(\s*(?:\?|%\(\w+\)s|%s|\$\d+|:\w+)(?:\s*,\s*(?:\?|%\(\w+\)s|%s|\$\d+|:\w+))+\s*\)")
+_LITERAL = re.compile(r"'(?:[^']|'')*'|\b\d+(?:\.\d+)?\b")
+_WHITESPACE = re.compile(r"\s+")
+
+def fingerprint(statement: str) -> str:
+    """Statement shape: literals become ?, IN (?, ?, ...) becomes IN (?)"""
+    statement = _WHITESPACE.sub(" ", statement).strip()
+    statement = _IN_LIST.sub("(?)", statement)
+    return _LITERAL.sub("?", statement)
+
+class QueryStats:
+    """Queries recorded for one request (or one capture_queries block)"""
+
+    def __init__(self):
+        self.count = 0
+        self.total_ms = 0.0
+        self.fingerprints = Counter()
+        self._lock = threading.Lock()
+
+    def record(self, statement: str, elapsed_ms: float):
+        shape = fingerprint(statement)
+        with self._lock:
+            self.count += 1
+            self.total_ms += elapsed_ms
+            self.fingerprints[shape] += 1
+
+    def repeated(self, threshold: int = 2) -> List[Tuple[str, int]]:
+        """Fingerprints run at least `threshold` times, most frequent first"""
+        return [(shape, n) for shape, n in self.fingerprints.most_common() if n >= threshold]
+
+    @property
+    def max_repeats(self) -> int:
+        return max(self.fingerprints.values(), default=0)
+
+_current: ContextVar[Optional[QueryStats]] = ContextVar("query_stats", default=None)
+_origin: ContextVar[Optional[str]] = ContextVar("query_origin", default=None)
+_captures: List[QueryStats] = []
+_captures_lock = threading.Lock()
+
+def start_tracking(origin: Optional[str] = None):
+    """Start recording queries for the current request; returns a token for stop_tracking"""
+    stats = QueryStats()
+    return stats, (_current.set(stats), _origin.set(origin))
+
+def stop_tracking(token):
+    stats_token, origin_token = token
+    _current.reset(stats_token)
+    _origin.reset(origin_token)
+
+@contextmanager
+def query_origin(name: str):
+    """Attribute the queries run inside the block to `name` (e.g. "job:relay_outbox")"""
+    token = _origin.set(name)
+    try:
+        yield
+    finally:
+        _origin.reset(token)
+
+def attributed(name: str, func):
+    """Wrap a scheduler job so its queries are attributed to `name`"""
+    @functools.wraps(func)
+    def wrapper(*args, **kwargs):
+        with query_origin(name):
+            return func(*args, **kwargs)
+    return wrapper
+
+def current_stats() -> Optional[QueryStats]:
+    return _current.get()
+
+@contextmanager
+def capture_queries() -> Iterator[QueryStats]:
+    """Record every query run anywhere in the process while the block is active"""
+    stats = QueryStats()
+    with _captures_lock:
+        _captures.append(stats)
+    try:
+        yield stats
+    finally:
+        with _captures_lock:
+            _captures.remove(stats)
+
+@contextmanager
+def assert_max_queries(limit: int, max_repeats: Optional[int] = None) -> Iterator[QueryStats]:
+    """Fail if the block runs more than `limit` queries (or repeats one more than `max_repeats` times)"""
+    with capture_queries() as stats:
+        yield stats
+    problems = []
+    if stats.count > limit:
+        problems.append(f"{stats.count} queries (budget {limit})")
+    if max_repeats is not None and stats.max_repeats > max_repeats:
+        problems.append(f"a statement ran {stats.max_repeats} times (budget {max_repeats})")
+    if problems:
+        statements = "\n".join(f"  {n}x {shape}" for shape, n in stats.fingerprints.most_common())
+        raise AssertionError(f"Query budget exceeded: {', '.join(problems)}\n{statements}")
+
+def parameter_shape(parameters, executemany: bool = False) -> str:
+    """Types of the bound parameters, e.g. (int, str, datetime) or 50 x {id: int}"""
+    if executemany and parameters:
+        return f"{len(parameters)} x {parameter_shape(parameters[0])}"
+    if isinstance(parameters, dict):
+        return "{" + ", ".join(f"{key}: {type(value).__name__}" for key, value in parameters.items()) + "}"
+    if isinstance(parameters, (list, tuple)):
+        return "(" + ", ".join(type(value).__name__ for value in parameters) + ")"
+    return type(parameters).__name__
+
+# EXPLAIN prefixes per dialect; "analyze" falls back to the plain plan where unsupported
+EXPLAIN_PREFIXES = {"sqlite": "EXPLAIN QUERY PLAN ", "postgresql": "EXPLAIN ", "mysql": "EXPLAIN "}
+EXPLAIN_ANALYZE_PREFIXES = {"postgresql": "EXPLAIN (ANALYZE, BUFFERS) ", "mysql": "EXPLAIN ANALYZE "}
+
+_explained_at = {}
+_explained_lock = threading.Lock()
+
+def _should_explain(shape: str, statement: str, executemany: bool) -> bool:
+    if config.SLOW_QUERY_EXPLAIN not in ("plan", "analyze") or executemany:
+        return False
+    if not statement.lstrip().upper().startswith(("SELECT", "WITH")):
+        return False
+    now = time.monotonic()
+    with _explained_lock:
+        if now - _explained_at.get(shape, -config.SLOW_QUERY_EXPLAIN_INTERVAL) < config.SLOW_QUERY_EXPLAIN_INTERVAL:
+            return False
+        _explained_at[shape] = now
+    return True
+
+def _explain(conn, statement: str, parameters) -> Optional[str]:
+    """Query plan for a statement, run on the raw DBAPI connection (bypasses these listeners)"""
+    dialect = conn.dialect.name
+    prefix = EXPLAIN_PREFIXES.get(dialect)
+    if config.SLOW_QUERY_EXPLAIN == "analyze":
+        prefix = EXPLAIN_ANALYZE_PREFIXES.get(dialect, prefix)
+    if prefix is None:
+        return None
+
+    cursor = conn.connection.cursor()
+    # A failed EXPLAIN would abort the caller's PostgreSQL transaction; isolate it in a savepoint
+    savepoint = dialect == "postgresql"
+    try:
+        if savepoint:
+            cursor.execute("SAVEPOINT slow_query_explain")
+        cursor.execute(prefix + statement, parameters)
+        plan = "\n".join(" | ".join(str(column) for column in row) for row in cursor.fetchall())
+        if savepoint:
+            cursor.execute("RELEASE SAVEPOINT slow_query_explain")
+        return plan
+    except Exception as e:
+        if savepoint:
+            cursor.execute("ROLLBACK TO SAVEPOINT slow_query_explain")
+        return f"(EXPLAIN failed: {str(e)})"
+    finally:
+        cursor.close()
+
+def _log_slow_query(conn, statement: str, parameters, executemany: bool, elapsed_ms: float, error: Optional[Exception] = None):
+    shape = fingerprint(statement)
+    origin = _origin.get() or threading.current_thread().name
+    params = parameter_shape(parameters, executemany)
+    # No EXPLAIN for a failed statement (e.g. a statement timeout): its transaction may be aborted
+    plan = None
+    if error is None and _should_explain(shape, statement, executemany):
+        plan = _explain(conn, statement, parameters)
+    outcome = f"failed after {elapsed_ms:.1f} ms: {str(error).splitlines()[0]}" if error else f"{elapsed_ms:.1f} ms"
+    slow_query_logger.warning(
+        f"Slow query ({outcome}) from {origin}: {shape} params={params}" + (f"\nPlan:\n{plan}" if plan else ""),
+        extra={"db_time_ms": round(elapsed_ms, 1), "query_origin": origin, "query_fingerprint": shape}
+    )
+
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    conn.info.setdefault("query_start_times", []).append(time.perf_counter())
+
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    start_times = conn.info.get("query_start_times")
+    if not start_times:
+        return
+    elapsed_ms = (time.perf_counter() - start_times.pop()) * 1000
+    if config.SLOW_QUERY_MS and elapsed_ms >= config.SLOW_QUERY_MS:
+        _log_slow_query(conn, statement, parameters, executemany, elapsed_ms)
+
+    stats = _current.get()
+    if stats is not None:
+        stats.record(statement, elapsed_ms)
+    if _captures:
+        with _captures_lock:
+            captures = list(_captures)
+        for capture in captures:
+            capture.record(statement, elapsed_ms)
+
+def _handle_error(exception_context):
+    # A statement that raised never reaches after_cursor_execute; slow ones (timeouts) are still logged
+    conn = exception_context.connection
+    if conn is None or not conn.info.get("query_start_times"):
+        return
+    elapsed_ms = (time.perf_counter() - conn.info["query_start_times"].pop()) * 1000
+    if exception_context.statement and config.SLOW_QUERY_MS and elapsed_ms >= config.SLOW_QUERY_MS:
+        _log_slow_query(
+            conn, exception_context.statement, exception_context.parameters,
+            bool(exception_context.execution_context and exception_context.execution_context.executemany),
+            elapsed_ms, exception_context.original_exception
+        )
+
+if config.QUERY_TRACKING_ENABLED or config.SLOW_QUERY_MS:
+    # Engine class: covers the primary, async and replica engines alike
+    event.listen(Engine, "before_cursor_execute", _before_cursor_execute)
+    event.listen(Engine, "after_cursor_execute", _after_cursor_execute)
+    event.listen(Engine, "handle_error", _handle_error)
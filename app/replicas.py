@@ -0,0 +1,161 @@
+"""
+Read-replica routing.
+
+DATABASE_READ_URLS lists replicas of DATABASE_URL. Read-only dependencies
+(get_read_db / get_async_read_db) get a session on one of them, round-robin;
+writes and everything else stay on the primary. A monitor thread measures
+each replica's replication lag every DB_REPLICA_CHECK_INTERVAL seconds;
+replicas that are unreachable or more than DB_REPLICA_MAX_LAG_SECONDS behind
+are skipped until they catch up, and with none usable reads fall back to
+the primary.
+
+Read-your-writes: after a successful write the API sets a short-lived
+cookie (READ_PRIMARY_COOKIE), and requests carrying it - or the
+X-Read-Consistency: primary header - read from the primary. Other clients
+may briefly see (and cache) data up to DB_REPLICA_MAX_LAG_SECONDS old.
+"""
+import itertools
+import logging
+import threading
+import time
+from collections import Counter
+from typing import List, Optional
+
+from sqlalchemy import text
+from sqlalchemy.orm import sessionmaker
+
+logger = logging.getLogger(__name__)
+
+READ_PRIMARY_COOKIE = "read_primary_until"
+READ_CONSISTENCY_HEADER = "x-read-consistency"
+
+# Replication lag in seconds per dialect; 0 once everything received has been
+# replayed, so an idle primary doesn't make a caught-up replica look stale.
+# Dialects without a query only get a reachability check.
+LAG_QUERIES = {
+    "postgresql": """
+        SELECT CASE
+            WHEN NOT pg_is_in_recovery() THEN 0
+            WHEN pg_last_wal_receive_lsn() = pg_last_wal_replay_lsn() THEN 0
+            ELSE COALESCE(EXTRACT(EPOCH FROM now() - pg_last_xact_replay_timestamp()), 0)
+        END
+    """,
+}
+
+class Replica:
+    """One read replica: its engines, session factories and last health check"""
+    
+    def __init__(self, engine, async_engine=None, async_session_factory=None):
+        self.engine = engine
+        self.async_engine = async_engine
+        self.name = engine.url.render_as_string(hide_password=True)
+        self.session_factory = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+        self.async_session_factory = async_session_factory
+        self.healthy = True  # Until the first check says otherwise
+        self.lag: Optional[float] = None
+        self.error: Optional[str] = None
+        self.checked_at: Optional[float] = None
+    
+    def check(self, max_lag: float):
+        """Measure replication lag and update healthy"""
+        try:
+            with self.engine.connect() as conn:
+                query = LAG_QUERIES.get(self.engine.dialect.name, "SELECT 0")
+                self.lag = float(conn.execute(text(query)).scalar() or 0)
+            self.error = None
+        except Exception as e:
+            self.lag = None
+            self.error = str(e)
+        
+        was_healthy = self.healthy
+        self.healthy = self.error is None and self.lag <= max_lag
+        self.checked_at = time.time()
+        if was_healthy and not self.healthy:
+            reason = self.error or f"{self.lag:.1f}s behind"
+            logger.warning(f"Read replica {self.name} taken out of rotation: {reason}")
+        elif self.healthy and not was_healthy:
+            logger.info(f"Read replica {self.name} back in rotation (lag {self.lag:.1f}s)")
+    
+    def snapshot(self) -> dict:
+        return {
+            "name": self.name,
+            "healthy": self.healthy,
+            "lag_seconds": self.lag,
+            "error": self.error,
+            "checked_at": self.checked_at
+        }
+
+class ReplicaRouter:
+    """Round-robin over healthy replicas; None means use the primary"""
+    
+    def __init__(self, replicas: List[Replica], max_lag: float, check_interval: int):
+        self.replicas = replicas
+        self.max_lag = max_lag
+        self.check_interval = check_interval
+        self._cycle = itertools.count()
+        self._counts = Counter()
+        self._counts_lock = threading.Lock()
+        self._stop = threading.Event()
+        self._monitor_thread = None
+    
+    @property
+    def enabled(self) -> bool:
+        return bool(self.replicas)
+    
+    def route(self, prefer_primary: bool = False) -> Optional[Replica]:
+        """Pick the replica for a read (None: read from the primary)"""
+        if not self.replicas:
+            return None
+        if prefer_primary:
+            self._count("primary_pinned")
+            return None
+        healthy = [replica for replica in self.replicas if replica.healthy]
+        if not healthy:
+            self._count("primary_fallback")
+            return None
+        self._count("replica")
+        return healthy[next(self._cycle) % len(healthy)]
+    
+    def start(self):
+        """Start the lag monitor (no-op without replicas)"""
+        if not self.replicas or (self._monitor_thread and self._monitor_thread.is_alive()):
+            return
+        self._stop.clear()
+        self._monitor_thread = threading.Thread(target=self._monitor_loop, daemon=True)
+        self._monitor_thread.start()
+        logger.info(f"Routing reads across {len(self.replicas)} replica(s)")
+    
+    def stop(self):
+        self._stop.set()
+    
+    def check_all(self):
+        for replica in self.replicas:
+            replica.check(self.max_lag)
+    
+    def _monitor_loop(self):
+        while not self._stop.is_set():
+            self.check_all()
+            self._stop.wait(self.check_interval)
+    
+    def _count(self, outcome: str):
+        with self._counts_lock:
+            self._counts[outcome] += 1
+    
+    def snapshot(self) -> dict:
+        with self._counts_lock:
+            reads = dict(self._counts)
+        return {
+            "enabled": self.enabled,
+            "max_lag_seconds": self.max_lag,
+            "replicas": [replica.snapshot() for replica in self.replicas],
+            "reads": reads
+        }
+
+def prefers_primary(request) -> bool:
+    """Whether this request asked for (or recently earned) primary reads"""
+    if request.headers.get(READ_CONSISTENCY_HEADER, "").lower() == "primary":
+        return True
+    try:
+        return float(request.cookies.get(READ_PRIMARY_COOKIE, 0)) > time.time()
+    except ValueError:
+        return False
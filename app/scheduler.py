@@ -1,14 +1,19 @@
 from apscheduler.schedulers.background import BackgroundScheduler
 from apscheduler.triggers.cron import CronTrigger
+from apscheduler.triggers.interval import IntervalTrigger
 from datetime import datetime, timedelta
 import logging
 from sqlalchemy.orm import Session
 
-from app.database import SessionLocal
+from app.database import DispatchSessionLocal, engine, sqlite_maintenance
 from app.models import Appointment, Message, MessageType, MessageStatus, MessageTemplate, ReminderStage, Broadcast
-from app.services.messaging import MessagingService
+from app.services.messaging import messaging_service
 from app.services.broadcast import broadcast_service
+from app.services.outbox import outbox_service
+from app.services.message_status import message_status_service
+from app.services.retention import retention_service
 from app.config import config
+from app.query_metrics import attributed
 
 # Set up logging
 logging.basicConfig(level=logging.INFO)
@@ -17,31 +22,71 @@ logger = logging.getLogger(__name__)
 class AppointmentScheduler:
     def __init__(self):
         self.scheduler = BackgroundScheduler()
-        self.messaging_service = MessagingService()
+        self.messaging_service = messaging_service
         
     def start(self):
         """Start the scheduler"""
-        # Schedule jobs
+        # Schedule jobs (queries attributed to job:<id> in the slow-query log)
         self.scheduler.add_job(
-            self.process_pending_messages,
+            attributed("job:process_pending_messages", self.process_pending_messages),
             CronTrigger(minute='*/1'),  # Run every 15 minutes
             id='process_pending_messages'
         )
         
         self.scheduler.add_job(
-            self.create_recall_reminders,
+            attributed("job:create_recall_reminders", self.create_recall_reminders),
             CronTrigger(hour=9, minute=0),  # Run daily at 9 AM
             id='create_recall_reminders'
         )
         
         self.scheduler.add_job(
-            self.process_scheduled_broadcasts,
+            attributed("job:process_scheduled_broadcasts", self.process_scheduled_broadcasts),
             CronTrigger(minute='*/30'),  # Run every 30 minutes
             id='process_scheduled_broadcasts'
         )
         
+        self.scheduler.add_job(
+            attributed("job:release_stale_claims", self.release_stale_claims),
+            CronTrigger(minute='*/5'),  # Run every 5 minutes
+            id='release_stale_claims'
+        )
+        
+        self.scheduler.add_job(
+            attributed("job:relay_outbox", self.relay_outbox),
+            IntervalTrigger(seconds=config.OUTBOX_RELAY_INTERVAL_SECONDS),
+            id='relay_outbox',
+            max_instances=1,
+            coalesce=True
+        )
+        
+        self.scheduler.add_job(
+            attributed("job:purge_outbox", self.purge_outbox),
+            CronTrigger(hour=3, minute=0),  # Run daily at 3 AM
+            id='purge_outbox'
+        )
+        
+        self.scheduler.add_job(
+            attributed("job:archive_expired_rows", self.archive_expired_rows),
+            CronTrigger(hour=2, minute=30),  # Run daily at 2:30 AM
+            id='archive_expired_rows',
+            max_instances=1,
+            coalesce=True
+        )
+        
+        if engine.dialect.name == "sqlite" and config.SQLITE_MAINTENANCE_INTERVAL_MINUTES:
+            self.scheduler.add_job(
+                attributed("job:sqlite_maintenance", self.sqlite_maintenance),
+                IntervalTrigger(minutes=config.SQLITE_MAINTENANCE_INTERVAL_MINUTES),
+                id='sqlite_maintenance',
+                max_instances=1,
+                coalesce=True
+            )
+        
         # Start the scheduler
         self.scheduler.start()
+        
+        # Let API handlers wake the relay right after they commit
+        outbox_service.set_wakeup(self.wake_outbox_relay)
         logger.info("Scheduler started")
     
     def process_pending_messages(self, force_immediate=False):
@@ -50,7 +95,7 @@ class AppointmentScheduler:
         Args:
             force_immediate: If True, process all pending messages regardless of scheduled_for date
         """
-        db = SessionLocal()
+        db = DispatchSessionLocal()
         try:
             count = self.messaging_service.process_pending_messages(db, force_immediate=force_immediate)
             logger.info(f"Processed {count} pending messages")
@@ -59,6 +104,65 @@ class AppointmentScheduler:
         finally:
             db.close()
     
+    def release_stale_claims(self):
+        """Return messages stuck in sending (worker died mid-send) to pending"""
+        db = DispatchSessionLocal()
+        try:
+            message_status_service.release_stale_claims(db, config.MESSAGE_CLAIM_TIMEOUT_MINUTES)
+        except Exception as e:
+            logger.error(f"Error releasing stale message claims: {str(e)}")
+        finally:
+            db.close()
+    
+    def relay_outbox(self):
+        """Dispatch messages committed to the transactional outbox"""
+        db = DispatchSessionLocal()
+        try:
+            outbox_service.relay(db)
+        except Exception as e:
+            logger.error(f"Error relaying outbox: {str(e)}")
+        finally:
+            db.close()
+    
+    def wake_outbox_relay(self):
+        """Run the outbox relay now instead of at its next interval"""
+        job = self.scheduler.get_job('relay_outbox')
+        if job:
+            job.modify(next_run_time=datetime.now())
+    
+    def purge_outbox(self):
+        """Delete processed outbox events and unmatched status callbacks past their retention windows"""
+        db = DispatchSessionLocal()
+        try:
+            count = outbox_service.purge_processed(db)
+            logger.info(f"Purged {count} processed outbox events")
+            count = message_status_service.purge_pending_callbacks(db, config.PENDING_CALLBACK_RETENTION_HOURS)
+            if count:
+                logger.info(f"Purged {count} status callbacks that never matched a message")
+        except Exception as e:
+            logger.error(f"Error purging outbox: {str(e)}")
+        finally:
+            db.close()
+    
+    def archive_expired_rows(self):
+        """Move messages and audit logs past their retention window to the archive tables"""
+        db = DispatchSessionLocal()
+        try:
+            result = retention_service.run(db)
+            logger.info(f"Retention: archived {result.get('messages', 0)} messages, "
+                        f"{result.get('audit_logs', 0)} audit logs; purged {result.get('purged', 0)} archived rows")
+        except Exception as e:
+            logger.error(f"Error archiving expired rows: {str(e)}")
+        finally:
+            db.close()
+    
+    def sqlite_maintenance(self):
+        """Checkpoint the SQLite WAL and run PRAGMA optimize"""
+        try:
+            sqlite_maintenance()
+        except Exception as e:
+            logger.error(f"Error running SQLite maintenance: {str(e)}")
+    
     def create_appointment_reminders(self, appointment: Appointment, db: Session):
         """Create staged reminders for a new appointment"""
         try:
@@ -138,7 +242,7 @@ class AppointmentScheduler:
     
     def create_recall_reminders(self):
         """Create recall reminders for patients due for follow-up"""
-        db = SessionLocal()
+        db = DispatchSessionLocal()
         try:
             # Find appointments that need recall reminders
             today = datetime.now().date()
@@ -228,7 +332,7 @@ class AppointmentScheduler:
     
     def process_scheduled_broadcasts(self):
         """Process scheduled broadcasts that are due"""
-        db = SessionLocal()
+        db = DispatchSessionLocal()
         try:
             # Find broadcasts that are scheduled and due
             now = datetime.now()
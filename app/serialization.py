@@ -0,0 +1,352 @@
+"""
+Serialization helpers: binary codecs for cached payloads, plus the fast JSON
+response path for list endpoints.
+
+A codec turns a response payload into bytes and back. Datetimes, dates,
+enums and Decimals are encoded the same way FastAPI would render them (ISO
+strings / values), so a cached response is byte-for-byte what the handler
+would have returned. Payloads above a size threshold are optionally
+compressed.
+
+Every encoded value starts with a two-byte header (codec id, compression
+id), so values written by a worker with a different CACHE_CODEC setting are
+still readable during a rolling config change.
+
+List endpoints select plain column tuples (no ORM objects), turn them into
+dicts with a RowSerializer whose keys are computed once, and return them
+through FastJSONResponse, skipping FastAPI's response_model validation and
+jsonable_encoder pass. orjson renders datetimes and enums natively.
+shape_serializer() narrows a RowSerializer to a fields= subset and embeds
+expand= relations selected through outer joins in the same query.
+"""
+import enum
+import functools
+import inspect
+import json
+import logging
+import zlib
+from datetime import date, datetime, time
+from decimal import Decimal
+from typing import Any, Dict, Iterable, List, Optional
+
+from fastapi import HTTPException
+from fastapi.responses import JSONResponse, Response
+
+from app.config import config
+
+logger = logging.getLogger(__name__)
+
+# Optional faster codecs / compressors
+try:
+    import orjson
+    ORJSON_AVAILABLE = True
+except ImportError:
+    ORJSON_AVAILABLE = False
+
+try:
+    import msgpack
+    MSGPACK_AVAILABLE = True
+except ImportError:
+    MSGPACK_AVAILABLE = False
+
+try:
+    import zstandard
+    ZSTD_AVAILABLE = True
+except ImportError:
+    ZSTD_AVAILABLE = False
+
+try:
+    import lz4.frame
+    LZ4_AVAILABLE = True
+except ImportError:
+    LZ4_AVAILABLE = False
+
+def encode_default(value: Any) -> Any:
+    """Fallback encoder for types the codecs don't handle natively"""
+    if isinstance(value, (datetime, date, time)):
+        return value.isoformat()
+    if isinstance(value, enum.Enum):
+        return value.value
+    if isinstance(value, Decimal):
+        return float(value)
+    if isinstance(value, (set, frozenset)):
+        return list(value)
+    raise TypeError(f"Object of type {type(value).__name__} is not serializable")
+
+class JsonCodec:
+    name = "json"
+    code = b"j"
+
+    def dumps(self, value: Any) -> bytes:
+        return json.dumps(value, default=encode_default, separators=(",", ":")).encode()
+
+    def loads(self, data: bytes) -> Any:
+        return json.loads(data)
+
+class OrjsonCodec:
+    """orjson: handles datetimes, dates and enums natively"""
+    name = "orjson"
+    code = b"o"
+
+    def dumps(self, value: Any) -> bytes:
+        return orjson.dumps(value, default=encode_default, option=orjson.OPT_NON_STR_KEYS)
+
+    def loads(self, data: bytes) -> Any:
+        return orjson.loads(data)
+
+class MsgpackCodec:
+    name = "msgpack"
+    code = b"m"
+
+    def dumps(self, value: Any) -> bytes:
+        return msgpack.packb(value, default=encode_default, use_bin_type=True)
+
+    def loads(self, data: bytes) -> Any:
+        return msgpack.unpackb(data, raw=False, strict_map_key=False)
+
+class ZlibCompressor:
+    name = "zlib"
+    code = b"z"
+
+    def compress(self, data: bytes) -> bytes:
+        return zlib.compress(data, 1)
+
+    def decompress(self, data: bytes) -> bytes:
+        return zlib.decompress(data)
+
+class ZstdCompressor:
+    name = "zstd"
+    code = b"s"
+
+    def __init__(self):
+        self._compressor = zstandard.ZstdCompressor(level=3)
+        self._decompressor = zstandard.ZstdDecompressor()
+
+    def compress(self, data: bytes) -> bytes:
+        return self._compressor.compress(data)
+
+    def decompress(self, data: bytes) -> bytes:
+        return self._decompressor.decompress(data)
+
+class Lz4Compressor:
+    name = "lz4"
+    code = b"4"
+
+    def compress(self, data: bytes) -> bytes:
+        return lz4.frame.compress(data)
+
+    def decompress(self, data: bytes) -> bytes:
+        return lz4.frame.decompress(data)
+
+def available_codecs() -> Dict[str, Any]:
+    """Codecs usable in this environment, fastest first"""
+    codecs = {}
+    if ORJSON_AVAILABLE:
+        codecs["orjson"] = OrjsonCodec()
+    if MSGPACK_AVAILABLE:
+        codecs["msgpack"] = MsgpackCodec()
+    codecs["json"] = JsonCodec()
+    return codecs
+
+def available_compressors() -> Dict[str, Any]:
+    """Compressors usable in this environment, preferred first"""
+    compressors = {}
+    if ZSTD_AVAILABLE:
+        compressors["zstd"] = ZstdCompressor()
+    if LZ4_AVAILABLE:
+        compressors["lz4"] = Lz4Compressor()
+    compressors["zlib"] = ZlibCompressor()
+    return compressors
+
+UNCOMPRESSED = b"-"
+
+class PayloadSerializer:
+    """Codec + optional compression with a self-describing header"""
+
+    def __init__(self, codec: str = "auto", compression: str = "auto", min_compress_bytes: int = 4096):
+        codecs = available_codecs()
+        compressors = available_compressors()
+
+        if codec == "auto":
+            codec = next(iter(codecs))
+        elif codec not in codecs:
+            logger.warning(f"Cache codec '{codec}' not available, using {next(iter(codecs))}")
+            codec = next(iter(codecs))
+        self.codec = codecs[codec]
+
+        if compression == "none":
+            self.compressor = None
+        elif compression == "auto":
+            self.compressor = next(iter(compressors.values()))
+        elif compression in compressors:
+            self.compressor = compressors[compression]
+        else:
+            logger.warning(f"Cache compression '{compression}' not available, using zlib")
+            self.compressor = compressors["zlib"]
+        self.min_compress_bytes = min_compress_bytes
+
+        # Readers for every codec/compressor present, keyed by header byte
+        self._codecs = {c.code: c for c in codecs.values()}
+        self._compressors = {c.code: c for c in compressors.values()}
+
+    def dumps(self, value: Any) -> bytes:
+        data = self.codec.dumps(value)
+        if self.compressor and len(data) >= self.min_compress_bytes:
+            return self.codec.code + self.compressor.code + self.compressor.compress(data)
+        return self.codec.code + UNCOMPRESSED + data
+
+    def loads(self, data: bytes) -> Any:
+        codec_code, compression_code, body = data[:1], data[1:2], data[2:]
+        if compression_code != UNCOMPRESSED:
+            body = self._compressors[compression_code].decompress(body)
+        return self._codecs[codec_code].loads(body)
+
+    def describe(self) -> dict:
+        return {
+            "codec": self.codec.name,
+            "compression": self.compressor.name if self.compressor else None,
+            "min_compress_bytes": self.min_compress_bytes
+        }
+
+def create_cache_serializer() -> PayloadSerializer:
+    """Serializer configured from CACHE_CODEC / CACHE_COMPRESSION"""
+    return PayloadSerializer(
+        config.CACHE_CODEC,
+        config.CACHE_COMPRESSION,
+        config.CACHE_COMPRESSION_MIN_BYTES
+    )
+
+class FastJSONResponse(JSONResponse):
+    """JSON response rendered with orjson (stdlib json if it isn't installed)"""
+
+    def render(self, content: Any) -> bytes:
+        if ORJSON_AVAILABLE:
+            return orjson.dumps(content, default=encode_default, option=orjson.OPT_NON_STR_KEYS)
+        return json.dumps(
+            content, default=encode_default, ensure_ascii=False, separators=(",", ":")
+        ).encode("utf-8")
+
+def json_response(func):
+    """Return a handler's payload as FastJSONResponse
+
+    FastAPI passes Response objects through untouched, so the payload skips
+    response_model validation and jsonable_encoder. Goes between the route
+    decorator and @cached, so cache hits take the fast path too.
+    """
+    if inspect.iscoroutinefunction(func):
+        @functools.wraps(func)
+        async def async_wrapper(*args, **kwargs):
+            result = await func(*args, **kwargs)
+            return result if isinstance(result, Response) else FastJSONResponse(result)
+        return async_wrapper
+
+    @functools.wraps(func)
+    def wrapper(*args, **kwargs):
+        result = func(*args, **kwargs)
+        return result if isinstance(result, Response) else FastJSONResponse(result)
+    return wrapper
+
+class RowSerializer:
+    """Turns Core rows into dicts; the selected columns and keys are fixed up front
+
+    Pass the instance's `columns` to db.query()/select() and the instance
+    itself as the row serializer.
+    """
+
+    def __init__(self, *columns):
+        self.columns = columns
+        self.keys = tuple(column.key for column in columns)
+
+    def __call__(self, row) -> dict:
+        return dict(zip(self.keys, row))
+
+def model_serializer(model, fields: Optional[Iterable[str]] = None, **expressions) -> RowSerializer:
+    """RowSerializer for a model's columns (all of them, or `fields` in order)
+
+    Extra keyword arguments add labelled SQL expressions, e.g.
+    message_count=func.coalesce(PatientStats.message_count, 0).
+    """
+    names = list(fields) if fields is not None else [column.key for column in model.__table__.columns]
+    columns = [getattr(model, name) for name in names]
+    columns += [expression.label(key) for key, expression in expressions.items()]
+    return RowSerializer(*columns)
+
+class Expansion:
+    """A related row that can be embedded with expand=, joined on `onclause`"""
+
+    def __init__(self, target, onclause, serializer: RowSerializer):
+        self.target = target
+        self.onclause = onclause
+        self.serializer = serializer
+
+class ShapedSerializer:
+    """RowSerializer restricted to some fields, with expanded relations nested in"""
+
+    def __init__(self, columns: List, keys: List[str], nested: List[tuple], joins: List[Expansion]):
+        self.columns = columns
+        self.keys = tuple(keys)
+        self.nested = nested
+        self.joins = joins
+
+    def apply_joins(self, query):
+        """Outer-join the expanded relations onto a query over `columns`"""
+        for expansion in self.joins:
+            query = query.outerjoin(expansion.target, expansion.onclause)
+        return query
+
+    def __call__(self, row) -> dict:
+        item = dict(zip(self.keys, row))
+        for name, start, keys in self.nested:
+            values = row[start:start + len(keys)]
+            # Outer join without a match: every column is NULL
+            item[name] = dict(zip(keys, values)) if any(v is not None for v in values) else None
+        return item
+
+def parse_list_param(value: Optional[str]) -> Optional[List[str]]:
+    """Split a comma-separated query parameter (None if not given)"""
+    if value is None:
+        return None
+    return [part.strip() for part in value.split(",") if part.strip()]
+
+def shape_serializer(
+    base: RowSerializer,
+    fields: Optional[str] = None,
+    expand: Optional[str] = None,
+    expansions: Optional[Dict[str, Expansion]] = None,
+    required: Iterable[str] = ("id",)
+) -> ShapedSerializer:
+    """Build a serializer for ?fields=a,b&expand=patient,template
+
+    Columns in `required` (e.g. the keyset sort columns) are always selected
+    so pagination keeps working, but only requested fields are returned.
+    Unknown names are a 400.
+    """
+    expansions = expansions or {}
+    requested = parse_list_param(fields)
+    expanded = parse_list_param(expand) or []
+
+    if requested is not None:
+        unknown = [name for name in requested if name not in base.keys]
+        if unknown:
+            raise HTTPException(status_code=400, detail=f"Unknown fields: {', '.join(unknown)}")
+    unknown = [name for name in expanded if name not in expansions]
+    if unknown:
+        raise HTTPException(
+            status_code=400,
+            detail=f"Cannot expand: {', '.join(unknown)} (available: {', '.join(expansions) or 'none'})"
+        )
+
+    by_key = dict(zip(base.keys, base.columns))
+    output_keys = [key for key in base.keys if requested is None or key in requested]
+    hidden_keys = [key for key in required if key not in output_keys]
+    columns = [by_key[key] for key in output_keys + hidden_keys]
+
+    nested = []
+    joins = []
+    for name in dict.fromkeys(expanded):
+        expansion = expansions[name]
+        nested.append((name, len(columns), expansion.serializer.keys))
+        columns += [column.label(f"{name}__{key}") for key, column in zip(expansion.serializer.keys, expansion.serializer.columns)]
+        joins.append(expansion)
+
+    return ShapedSerializer(columns, output_keys, nested, joins)
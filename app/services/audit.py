@@ -0,0 +1,221 @@
+"""
+Buffered audit log writer.
+
+record() puts an audit event on a bounded in-process queue and returns. A
+writer thread bulk-inserts the queued events into audit_logs once
+AUDIT_BATCH_SIZE have accumulated or AUDIT_FLUSH_INTERVAL_SECONDS after the
+first one arrived, so an opt-out or a broadcast creation no longer pays for
+a second commit. created_at is taken when the event is recorded, not when it
+is written.
+
+With AUDIT_BACKEND=jsonl the events go to the append-only segment store in
+app/audit_store.py instead of the audit_logs table.
+
+Events are written synchronously instead when:
+- the action is listed in AUDIT_DURABLE_ACTIONS, or record() gets durable=True
+- the queue is full (backpressure rather than dropping events)
+- the writer isn't running (scripts, AUDIT_BUFFER_ENABLED=false)
+
+stop() (application shutdown) flushes whatever is still queued. Buffered
+events are lost if the process is killed before a flush; actions that must
+survive that belong in AUDIT_DURABLE_ACTIONS.
+"""
+import json
+import logging
+import queue
+import threading
+import time
+from datetime import datetime
+from typing import Iterable, List, Optional
+
+from sqlalchemy import insert
+
+from app.audit_store import audit_store
+from app.config import config
+from app.models import AuditLog
+
+logger = logging.getLogger(__name__)
+
+class AuditSink:
+    def __init__(self, max_queue: int, batch_size: int, flush_interval: float, durable_actions: Iterable[str] = ()):
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.durable_actions = set(durable_actions)
+        self.max_attempts = 3  # per batch before its events are dropped
+        self._queue = queue.Queue(maxsize=max_queue)
+        self._stop = threading.Event()
+        self._writer_thread = None
+        self._flush_lock = threading.Lock()  # One bulk insert at a time (writer thread vs flush())
+        self._stats_lock = threading.Lock()
+        self._stats = {
+            "recorded": 0,
+            "written": 0,
+            "durable_writes": 0,
+            "overflow_writes": 0,
+            "flushes": 0,
+            "failed_flushes": 0,
+            "dropped": 0,
+        }
+
+    @property
+    def running(self) -> bool:
+        return self._writer_thread is not None and self._writer_thread.is_alive()
+
+    def start(self):
+        """Start the writer thread (events are written synchronously until then)"""
+        if not config.AUDIT_BUFFER_ENABLED or self.running:
+            return
+        self._stop.clear()
+        self._writer_thread = threading.Thread(target=self._writer_loop, name="audit-writer", daemon=True)
+        self._writer_thread.start()
+        logger.info(f"Audit writer started (batch {self.batch_size}, every {self.flush_interval}s)")
+
+    def stop(self, timeout: float = 10.0):
+        """Stop the writer thread and flush everything still queued"""
+        self._stop.set()
+        if self._writer_thread is not None:
+            self._writer_thread.join(timeout)
+            self._writer_thread = None
+        self.flush()
+
+    def record(
+        self,
+        action: str,
+        entity_type: Optional[str] = None,
+        entity_id: Optional[int] = None,
+        details: Optional[dict] = None,
+        durable: bool = False
+    ):
+        """Log an audit event; returns once it is queued (or written, for durable actions)"""
+        event = {
+            "action": action,
+            "entity_type": entity_type,
+            "entity_id": entity_id,
+            "details": json.dumps(details, default=str) if details is not None else None,
+            "created_at": datetime.now()
+        }
+        self._count("recorded")
+
+        if durable or action in self.durable_actions:
+            self._write_now([event], "durable_writes")
+        elif not self.running:
+            self._write_now([event])
+        else:
+            try:
+                self._queue.put_nowait(event)
+            except queue.Full:
+                self._write_now([event], "overflow_writes")
+
+    def flush(self) -> int:
+        """Write every queued event now; returns how many were written"""
+        events = self._drain()
+        written = 0
+        for start in range(0, len(events), self.batch_size):
+            batch = events[start:start + self.batch_size]
+            if self._flush_batch(batch):
+                written += len(batch)
+        return written
+
+    def snapshot(self) -> dict:
+        with self._stats_lock:
+            data = dict(self._stats)
+        data.update({
+            "backend": config.AUDIT_BACKEND,
+            "running": self.running,
+            "queued": self._queue.qsize(),
+            "queue_size": self._queue.maxsize,
+            "batch_size": self.batch_size,
+            "flush_interval_seconds": self.flush_interval,
+            "durable_actions": sorted(self.durable_actions),
+        })
+        if config.AUDIT_BACKEND == "jsonl":
+            data["store"] = audit_store.snapshot()
+        return data
+
+    def _count(self, name: str, amount: int = 1):
+        with self._stats_lock:
+            self._stats[name] += amount
+
+    def _drain(self, limit: Optional[int] = None) -> List[dict]:
+        events = []
+        while limit is None or len(events) < limit:
+            try:
+                events.append(self._queue.get_nowait())
+            except queue.Empty:
+                break
+        return events
+
+    def _writer_loop(self):
+        batch = []
+        deadline = None
+        while not self._stop.is_set():
+            # An unexpected error must not kill the writer; the batch stays queued for the next pass
+            try:
+                timeout = self.flush_interval if deadline is None else max(deadline - time.monotonic(), 0)
+                try:
+                    batch.append(self._queue.get(timeout=timeout))
+                except queue.Empty:
+                    pass
+                batch += self._drain(self.batch_size - len(batch))
+                if batch and deadline is None:
+                    deadline = time.monotonic() + self.flush_interval
+
+                if batch and (len(batch) >= self.batch_size or time.monotonic() >= deadline):
+                    self._flush_batch(batch, retry=True)
+                    batch = []
+                    deadline = None
+            except Exception as e:
+                logger.error(f"Audit writer error ({len(batch)} events pending): {str(e)}")
+                self._stop.wait(0.5)
+
+        if batch:
+            self._flush_batch(batch)
+
+    def _flush_batch(self, events: List[dict], retry: bool = False) -> bool:
+        """Bulk-insert a batch (retried with backoff on the writer thread); False if dropped"""
+        attempts = self.max_attempts if retry else 1
+        for attempt in range(1, attempts + 1):
+            try:
+                with self._flush_lock:
+                    self._insert(events)
+                self._count("flushes")
+                self._count("written", len(events))
+                return True
+            except Exception as e:
+                self._count("failed_flushes")
+                logger.error(f"Error writing {len(events)} audit events (attempt {attempt}/{attempts}): {str(e)}")
+                if attempt < attempts:
+                    self._stop.wait(0.5 * attempt)
+        self._count("dropped", len(events))
+        logger.error(f"Dropped {len(events)} audit events: {', '.join(sorted({e['action'] for e in events}))}")
+        return False
+
+    def _write_now(self, events: List[dict], counter: Optional[str] = None):
+        try:
+            self._insert(events)
+            self._count("written", len(events))
+            if counter:
+                self._count(counter, len(events))
+        except Exception as e:
+            self._count("dropped", len(events))
+            logger.error(f"Error logging audit: {str(e)}")
+
+    def _insert(self, events: List[dict]):
+        if config.AUDIT_BACKEND == "jsonl":
+            audit_store.append(events)
+            return
+        from app.database import SessionLocal
+        db = SessionLocal()
+        try:
+            db.execute(insert(AuditLog), events)
+            db.commit()
+        finally:
+            db.close()
+
+# Create singleton instance
+audit_sink = AuditSink(
+    config.AUDIT_QUEUE_SIZE,
+    config.AUDIT_BATCH_SIZE,
+    config.AUDIT_FLUSH_INTERVAL_SECONDS,
+    config.AUDIT_DURABLE_ACTIONS
+)
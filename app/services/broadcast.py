@@ -4,14 +4,15 @@ from datetime import datetime, timedelta
 from sqlalchemy.orm import Session
 from typing import Dict, Optional
 
-from app.models import Broadcast, Patient, Message, MessageTemplate, MessageType, MessageStatus, AuditLog
-from app.services.messaging import MessagingService
+from app.models import Broadcast, Patient, Message, MessageTemplate, MessageType, MessageStatus
+from app.services.audit import audit_sink
+from app.services.messaging import messaging_service
 
 logger = logging.getLogger(__name__)
 
 class BroadcastService:
     def __init__(self):
-        self.messaging_service = MessagingService()
+        self.messaging_service = messaging_service
         self.max_retries = 3
         self.batch_size = 50  # Send messages in batches to respect rate limits
     
@@ -44,7 +45,7 @@ class BroadcastService:
             db.refresh(broadcast)
             
             # Log audit
-            self._log_audit(db, "broadcast_created", "broadcast", broadcast.id, {"name": name})
+            audit_sink.record("broadcast_created", "broadcast", broadcast.id, {"name": name})
             
             logger.info(f"Broadcast {broadcast.id} created: {name}")
             return broadcast
@@ -57,8 +58,8 @@ class BroadcastService:
     def process_broadcast(self, broadcast_id: int, db: Session = None):
         """Process a broadcast campaign by sending messages to all matching patients"""
         if db is None:
-            from app.database import SessionLocal
-            db = SessionLocal()
+            from app.database import DispatchSessionLocal
+            db = DispatchSessionLocal()
             should_close = True
         else:
             should_close = False
@@ -162,7 +163,9 @@ class BroadcastService:
                                 logger.error(f"Error processing message for patient {patient.id} ({patient.first_name} {patient.last_name}): {str(e)}")
                                 failed_count += 1
                 
-                # Small delay between batches to respect rate limits
+                # Small delay between batches to respect rate limits; end the
+                # read transaction first so other dispatch jobs get the connection
+                db.commit()
                 import time
                 time.sleep(1)
             
@@ -213,20 +216,6 @@ class BroadcastService:
             query = query.filter(Patient.id.in_(subquery))
         
         return query.all()
-    
-    def _log_audit(self, db: Session, action: str, entity_type: str, entity_id: int, details: Dict):
-        """Log an audit event"""
-        try:
-            audit_log = AuditLog(
-                action=action,
-                entity_type=entity_type,
-                entity_id=entity_id,
-                details=json.dumps(details)
-            )
-            db.add(audit_log)
-            db.commit()
-        except Exception as e:
-            logger.error(f"Error logging audit: {str(e)}")
 
 # Create singleton instance
 broadcast_service = BroadcastService()
@@ -0,0 +1,151 @@
+"""
+Coalescing stage for the message dispatcher.
+
+Groups due messages per patient and merges compatible types into a single
+rendered body so a busy patient gets one text (and one provider call) instead
+of several within a few minutes.
+"""
+import logging
+from datetime import datetime, timedelta
+from typing import Dict, List, Optional
+
+from sqlalchemy.orm import Session
+
+from app.config import config
+from app.models import Message, MessageStatus, MessageType
+from app.services.message_status import message_status_service
+
+logger = logging.getLogger(__name__)
+
+# Order in which merged parts appear in the combined body
+TYPE_PRIORITY = {
+    MessageType.APPOINTMENT_REMINDER: 0,
+    MessageType.POST_VISIT: 1,
+    MessageType.RECALL: 2,
+    MessageType.BROADCAST: 3,
+}
+
+class MessageCoalescer:
+    def __init__(self):
+        self.enabled = config.MESSAGE_COALESCING_ENABLED
+        self.window = timedelta(minutes=config.MESSAGE_COALESCE_WINDOW_MINUTES)
+        self.max_length = config.MESSAGE_COALESCE_MAX_LENGTH
+        self.message_types = {MessageType(t) for t in config.MESSAGE_COALESCE_TYPES}
+        self.separator = "\n\n"
+
+    def coalesce(self, db: Session, messages: List[Message], now: Optional[datetime] = None) -> List[Message]:
+        """Merge compatible messages per patient and return the messages to dispatch
+
+        Pending messages for the same patients that become due within the window
+        are pulled forward so they can ride along with the current send.
+        """
+        if not self.enabled or not messages:
+            return messages
+
+        now = now or datetime.now()
+        candidates: Dict[int, List[Message]] = {}
+        for message in messages:
+            if self._is_compatible(message):
+                candidates.setdefault(message.patient_id, []).append(message)
+
+        if not candidates:
+            return messages
+
+        # Look ahead for messages to the same patients that are due soon
+        upcoming = db.query(Message).filter(
+            Message.status == MessageStatus.PENDING,
+            Message.coalesced_into_id == None,
+            Message.patient_id.in_(list(candidates.keys())),
+            Message.message_type.in_(list(self.message_types)),
+            Message.scheduled_for > now,
+            Message.scheduled_for <= now + self.window
+        ).all()
+        # In force_immediate mode the batch already holds future messages; never add one twice
+        batch_ids = {message.id for message in messages}
+        for message in upcoming:
+            if message.content and message.id not in batch_ids:
+                candidates[message.patient_id].append(message)
+
+        merged_away = set()
+        merged_count = 0
+        for patient_id, patient_messages in candidates.items():
+            if len(patient_messages) < 2:
+                continue
+            for group in self._group(patient_messages):
+                if len(group) < 2:
+                    continue
+                # Prefer a message from this batch, so the merged send goes out now
+                primary = next((m for m in group if m.id in batch_ids), group[0])
+                ordered = sorted(group, key=lambda m: (TYPE_PRIORITY.get(m.message_type, 99), self._due_at(m)))
+                primary.content = self.separator.join(m.content for m in ordered)
+                for message in group:
+                    if message is primary:
+                        continue
+                    message.coalesced_into_id = primary.id
+                    merged_away.add(message.id)
+                merged_count += len(group) - 1
+                logger.info(f"Coalesced {len(group)} messages for patient {patient_id} into message {primary.id}")
+
+        if merged_count:
+            db.commit()
+            logger.info(f"Coalescing saved {merged_count} provider sends")
+
+        return [m for m in messages if m.id not in merged_away]
+
+    def finalize(self, db: Session, primary: Message):
+        """Copy the outcome of a coalesced send onto the messages merged into it"""
+        if not self.enabled:
+            return 0
+
+        db.refresh(primary)
+        if primary.status not in (MessageStatus.SENT, MessageStatus.DELIVERED, MessageStatus.FAILED):
+            # Not sent yet (e.g. DND) - merged messages stay attached for the next run
+            return 0
+
+        # Merged messages are still PENDING, so a delivered primary is replayed as SENT first
+        outcome = MessageStatus.SENT if primary.status == MessageStatus.DELIVERED else primary.status
+        updated = message_status_service.transition_coalesced(
+            db, primary.id, outcome,
+            provider_message_id=primary.provider_message_id,
+            sent_at=primary.sent_at,
+            error_message=primary.error_message
+        )
+        if primary.status == MessageStatus.DELIVERED:
+            message_status_service.transition_coalesced(
+                db, primary.id, MessageStatus.DELIVERED,
+                delivered_at=primary.delivered_at
+            )
+        return updated
+
+    def _is_compatible(self, message: Message) -> bool:
+        return bool(message.content) and message.message_type in self.message_types
+
+    def _due_at(self, message: Message) -> datetime:
+        return message.scheduled_for or message.created_at or datetime.min
+
+    def _group(self, messages: List[Message]) -> List[List[Message]]:
+        """Split a patient's messages into groups that fit the window and body limit"""
+        groups = []
+        current: List[Message] = []
+        current_length = 0
+        for message in sorted(messages, key=self._due_at):
+            length = len(message.content)
+            fits = (
+                current
+                and self._due_at(message) - self._due_at(current[0]) <= self.window
+                and current_length + len(self.separator) + length <= self.max_length
+            )
+            if fits:
+                current.append(message)
+                current_length += len(self.separator) + length
+            else:
+                if current:
+                    groups.append(current)
+                current = [message]
+                current_length = length
+        if current:
+            groups.append(current)
+        return groups
+
+# Create singleton instance
+message_coalescer = MessageCoalescer()
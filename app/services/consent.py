@@ -2,7 +2,9 @@ import logging
 from datetime import datetime
 from sqlalchemy.orm import Session
 
-from app.models import Patient, AuditLog
+from app.models import Patient
+from app.cache import cache_service
+from app.services.audit import audit_sink
 
 logger = logging.getLogger(__name__)
 
@@ -22,9 +24,10 @@ class ConsentService:
             patient.consent_date = datetime.now()
             patient.consent_source = "sms_opt_out"
             db.commit()
+            cache_service.clear_patient_cache(patient.id)
             
             # Log audit
-            self._log_audit(db, "opt_out", "patient", patient.id, {
+            audit_sink.record("opt_out", "patient", patient.id, {
                 "phone_number": phone_number,
                 "method": "sms"
             })
@@ -52,9 +55,10 @@ class ConsentService:
             patient.consent_date = datetime.now()
             patient.consent_source = "sms_opt_in"
             db.commit()
+            cache_service.clear_patient_cache(patient.id)
             
             # Log audit
-            self._log_audit(db, "opt_in", "patient", patient.id, {
+            audit_sink.record("opt_in", "patient", patient.id, {
                 "phone_number": phone_number,
                 "method": "sms"
             })
@@ -66,22 +70,6 @@ class ConsentService:
             logger.error(f"Error processing opt-in for {phone_number}: {str(e)}")
             db.rollback()
             return False
-    
-    def _log_audit(self, db: Session, action: str, entity_type: str, entity_id: int, details: dict):
-        """Log an audit event"""
-        try:
-            import json
-            audit_log = AuditLog(
-                action=action,
-                entity_type=entity_type,
-                entity_id=entity_id,
-                details=json.dumps(details)
-            )
-            db.add(audit_log)
-            db.commit()
-        except Exception as e:
-            logger.error(f"Error logging audit: {str(e)}")
 
 # Create singleton instance
 consent_service = ConsentService()
-
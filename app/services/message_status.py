@@ -0,0 +1,171 @@
+"""
+Compare-and-set state machine for Message.status.
+
+PENDING -> SENDING -> SENT -> DELIVERED / FAILED
+
+Every transition is a conditional UPDATE ... WHERE status = <allowed source>, so
+the sender, concurrent dispatch workers and provider webhooks never overwrite
+each other and no row has to be read or locked first. There is one UPDATE
+per source status, so the per-status counters know exactly what moved.
+
+The provider SID is only stored by the SENT transition, after the provider
+call returns, so a fast "delivered"/"failed" callback can arrive before any
+row carries it. apply_callback() keeps such callbacks in
+pending_status_callbacks and the SENT transition replays them once it has
+committed.
+
+With AUDIT_MESSAGE_EVENTS set, sends, failures and deliveries are also
+recorded as audit events (message_sent / message_failed / message_delivered,
+never the message content).
+"""
+import logging
+from datetime import datetime, timedelta
+from typing import Dict, List, Optional
+
+from sqlalchemy import delete, update
+from sqlalchemy.orm import Session
+
+from app.config import config
+from app.models import Message, MessageStatus, PendingStatusCallback
+from app.services.audit import audit_sink
+from app.services.stat_counters import stat_counter_service
+
+logger = logging.getLogger(__name__)
+
+# Target status -> statuses it may be entered from, most likely source first
+ALLOWED_TRANSITIONS: Dict[MessageStatus, List[MessageStatus]] = {
+    MessageStatus.SENDING: [MessageStatus.PENDING],  # Claimed by a dispatcher
+    MessageStatus.PENDING: [MessageStatus.SENDING],  # Claim released (stale worker)
+    MessageStatus.SENT: [MessageStatus.SENDING, MessageStatus.PENDING],
+    MessageStatus.DELIVERED: [MessageStatus.SENT],  # Early callbacks wait in pending_status_callbacks
+    MessageStatus.FAILED: [MessageStatus.SENDING, MessageStatus.SENT, MessageStatus.PENDING],
+}
+
+# Transitions recorded as audit events with AUDIT_MESSAGE_EVENTS, and the values they keep
+AUDITED_STATUSES = (MessageStatus.SENT, MessageStatus.FAILED, MessageStatus.DELIVERED)
+AUDITED_VALUES = ("provider_message_id", "error_message")
+
+class MessageStatusService:
+    def transition(self, db: Session, message_id: int, to_status: MessageStatus, where=(), **values) -> bool:
+        """Move one message to to_status if its current status allows it (and `where` holds)
+
+        Returns False if another worker or webhook got there first.
+        """
+        changed = self._transition_where(db, [Message.id == message_id, *where], to_status, values, single=True)
+        if not changed:
+            logger.info(f"Message {message_id}: transition to {to_status.value} rejected by current status")
+        else:
+            self._audit(to_status, message_id, {key: values[key] for key in AUDITED_VALUES if key in values})
+            if to_status == MessageStatus.SENT and values.get("provider_message_id"):
+                self._replay_callbacks(db, values["provider_message_id"])
+        return changed == 1
+
+    def transition_by_provider_id(self, db: Session, provider_message_id: str, to_status: MessageStatus, **values) -> int:
+        """Move every message sent under a provider SID (coalesced messages share one)"""
+        updated = self._transition_where(db, [Message.provider_message_id == provider_message_id], to_status, values)
+        if updated:
+            self._audit(to_status, None, {"provider_message_id": provider_message_id, "updated": updated})
+        return updated
+
+    def apply_callback(self, db: Session, provider_message_id: str, to_status: MessageStatus, **values) -> Optional[int]:
+        """Apply a provider status callback; keep it for the SENT transition if no message has the SID yet
+
+        Returns the number of messages updated (0 for a repeated or outdated
+        callback), or None while the callback waits for its SID.
+        """
+        updated = self.transition_by_provider_id(db, provider_message_id, to_status, **values)
+        if updated or self._sid_known(db, provider_message_id):
+            return updated
+
+        callback = db.query(PendingStatusCallback).filter(
+            PendingStatusCallback.provider_message_id == provider_message_id,
+            PendingStatusCallback.status == to_status
+        ).first()
+        if callback is None:
+            callback = PendingStatusCallback(
+                provider_message_id=provider_message_id,
+                status=to_status,
+                error_message=values.get("error_message")
+            )
+            db.add(callback)
+            db.commit()
+            logger.info(f"Status callback for unknown SID {provider_message_id} ({to_status.value}) kept for replay")
+
+        # The SENT transition may have committed (and found nothing to replay) in the meantime
+        updated = self.transition_by_provider_id(db, provider_message_id, to_status, **values)
+        if updated or self._sid_known(db, provider_message_id):
+            db.execute(delete(PendingStatusCallback).where(PendingStatusCallback.id == callback.id))
+            db.commit()
+            return updated
+        return None
+
+    def _sid_known(self, db: Session, provider_message_id: str) -> bool:
+        return db.query(Message.id).filter(Message.provider_message_id == provider_message_id).first() is not None
+
+    def purge_pending_callbacks(self, db: Session, older_than_hours: int) -> int:
+        """Drop kept callbacks whose SID never showed up"""
+        cutoff = datetime.now() - timedelta(hours=older_than_hours)
+        deleted = db.execute(
+            delete(PendingStatusCallback).where(PendingStatusCallback.received_at < cutoff)
+        ).rowcount
+        db.commit()
+        return deleted
+
+    def _replay_callbacks(self, db: Session, provider_message_id: str):
+        callbacks = db.query(PendingStatusCallback).filter(
+            PendingStatusCallback.provider_message_id == provider_message_id
+        ).order_by(PendingStatusCallback.id).all()
+        for callback in callbacks:
+            if callback.status == MessageStatus.DELIVERED:
+                values = {"delivered_at": callback.received_at}
+            else:
+                values = {"error_message": callback.error_message}
+            self.transition_by_provider_id(db, provider_message_id, callback.status, **values)
+            logger.info(f"Replayed early {callback.status.value} callback for SID {provider_message_id}")
+        if callbacks:
+            db.execute(delete(PendingStatusCallback).where(
+                PendingStatusCallback.id.in_([callback.id for callback in callbacks])
+            ))
+            db.commit()
+
+    def transition_coalesced(self, db: Session, primary_id: int, to_status: MessageStatus, **values) -> int:
+        """Move the messages merged into a coalesced send"""
+        return self._transition_where(db, [Message.coalesced_into_id == primary_id], to_status, values)
+
+    def release_stale_claims(self, db: Session, timeout_minutes: int) -> int:
+        """Return messages stuck in SENDING (e.g. the worker died) to PENDING"""
+        cutoff = datetime.now() - timedelta(minutes=timeout_minutes)
+        released = self._transition_where(
+            db, [Message.claimed_at < cutoff], MessageStatus.PENDING, {"claimed_at": None}
+        )
+        if released:
+            logger.warning(f"Released {released} messages stuck in sending since before {cutoff}")
+        return released
+
+    def _audit(self, to_status: MessageStatus, message_id, details: dict):
+        if config.AUDIT_MESSAGE_EVENTS and to_status in AUDITED_STATUSES:
+            audit_sink.record(f"message_{to_status.value}", "message", message_id, details or None)
+
+    def _transition_where(self, db: Session, criteria, to_status: MessageStatus, values: dict, single: bool = False) -> int:
+        moves = {}
+        for from_status in ALLOWED_TRANSITIONS[to_status]:
+            stmt = (
+                update(Message)
+                .where(*criteria, Message.status == from_status)
+                .values(status=to_status, **values)
+                .execution_options(synchronize_session=False)
+            )
+            moved = db.execute(stmt).rowcount
+            if moved:
+                moves[from_status] = moved
+                # A single row can only have matched one source status
+                if single:
+                    break
+        if moves:
+            stat_counter_service.apply_status_moves(db, moves, to_status)
+        # Committing also expires in-session Message objects so they reload the new status
+        db.commit()
+        return sum(moves.values())
+
+# Create singleton instance
+message_status_service = MessageStatusService()
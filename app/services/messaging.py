@@ -1,49 +1,31 @@
 import logging
 from datetime import datetime, time
 from sqlalchemy.orm import Session
-import jinja2
 
 from app.config import config
 from app.models import Message, MessageStatus, Patient
+from app.services.coalescing import message_coalescer
+from app.services.message_status import message_status_service
+from app.services.provider import provider_registry
 
 logger = logging.getLogger(__name__)
 
-# Twilio SMS
-try:
-    from twilio.rest import Client as TwilioClient
-    TWILIO_AVAILABLE = True
-except ImportError:
-    TWILIO_AVAILABLE = False
-    logger.warning("twilio not installed. Install with: pip install twilio")
-
 class MessagingService:
     def __init__(self):
-        # Initialize Twilio client
-        self.twilio_client = None
-        if TWILIO_AVAILABLE:
-            try:
-                if config.TWILIO_ACCOUNT_SID and config.TWILIO_AUTH_TOKEN:
-                    self.twilio_client = TwilioClient(
-                        config.TWILIO_ACCOUNT_SID,
-                        config.TWILIO_AUTH_TOKEN
-                    )
-                    logger.info("Twilio client initialized successfully")
-                    # Log configuration for debugging
-                    logger.info(f"Twilio Config - Account SID: {config.TWILIO_ACCOUNT_SID[:10]}..., Phone: {config.TWILIO_PHONE_NUMBER}, WhatsApp: {config.TWILIO_WHATSAPP_NUMBER}, Channel: {config.MESSAGE_CHANNEL}")
-                else:
-                    logger.warning("Twilio credentials not found in config. SMS sending will be disabled.")
-            except Exception as e:
-                logger.error(f"Twilio: Failed to initialize client: {str(e)}")
-        else:
-            logger.warning("Twilio: twilio library not installed. SMS sending will be disabled.")
-        
+        # Provider client and template engine are shared process-wide and
+        # created lazily on first use (see app/services/provider.py)
         self.dnd_start = time(config.DND_START_HOUR)
         self.dnd_end = time(config.DND_END_HOUR)
-        
-        # Initialize template engine
-        self.template_env = jinja2.Environment(
-            autoescape=True
-        )
+    
+    @property
+    def twilio_client(self):
+        """Shared, pooled Twilio client (None if not configured)"""
+        return provider_registry.get_twilio_client()
+    
+    @property
+    def template_env(self):
+        """Shared Jinja environment"""
+        return provider_registry.get_template_env()
     
     def is_dnd_hours(self, current_time=None):
         """Check if current time is within Do Not Disturb hours"""
@@ -78,13 +60,30 @@ class MessagingService:
     
     def send_sms(self, to_number: str, message_content: str, db_message: Message = None, db: Session = None, use_whatsapp: bool = False):
         """Send SMS or WhatsApp message via Twilio with automatic fallback to SMS if WhatsApp fails"""
-        if not self.twilio_client:
+        message_sid, error_message = self._deliver(to_number, message_content, use_whatsapp)
+        
+        # Update database record if provided
+        if db_message and db:
+            if message_sid:
+                message_status_service.transition(
+                    db, db_message.id, MessageStatus.SENT,
+                    provider_message_id=message_sid,
+                    sent_at=datetime.now()
+                )
+            else:
+                message_status_service.transition(
+                    db, db_message.id, MessageStatus.FAILED,
+                    error_message=error_message
+                )
+        
+        return message_sid
+    
+    def _deliver(self, to_number: str, message_content: str, use_whatsapp: bool = False):
+        """Hand a message to Twilio; returns (message_sid, error_message) without touching the database"""
+        twilio_client = self.twilio_client
+        if not twilio_client:
             logger.error("Twilio client not initialized. Cannot send message.")
-            if db_message and db:
-                db_message.status = MessageStatus.FAILED
-                db_message.error_message = "Twilio not configured"
-                db.commit()
-            return None
+            return None, "Twilio not configured"
         
         # Determine preferred channel
         prefer_whatsapp = use_whatsapp or config.MESSAGE_CHANNEL in ["whatsapp", "both"]
@@ -108,24 +107,14 @@ class MessagingService:
                 logger.info(f"  To (Patient Number): {to_number_formatted}")
                 
                 # Send message via Twilio WhatsApp
-                message = self.twilio_client.messages.create(
+                message = twilio_client.messages.create(
                     body=message_content,
                     from_=from_number,
                     to=to_number_formatted
                 )
                 
-                message_sid = message.sid
-                
-                # Update database record if provided
-                if db_message and db:
-                    db_message.provider_message_id = message_sid
-                    db_message.status = MessageStatus.SENT
-                    db_message.sent_at = datetime.now()
-                    db.commit()
-                    db.refresh(db_message)
-                
-                logger.info(f"Twilio: WhatsApp message sent successfully to {to_number}, SID: {message_sid}")
-                return message_sid
+                logger.info(f"Twilio: WhatsApp message sent successfully to {to_number}, SID: {message.sid}")
+                return message.sid, None
                 
             except Exception as e:
                 error_message = str(e)
@@ -138,12 +127,7 @@ class MessagingService:
                 else:
                     logger.error(f"Twilio WhatsApp failed: {error_message}")
                     # Other WhatsApp errors - don't fallback, just fail
-                    if db_message and db:
-                        db_message.status = MessageStatus.FAILED
-                        db_message.error_message = f"WhatsApp error: {error_message}"
-                        db.commit()
-                        db.refresh(db_message)
-                    return None
+                    return None, f"WhatsApp error: {error_message}"
         
         # SMS messaging (either preferred or fallback from WhatsApp)
         if not prefer_whatsapp or whatsapp_failed_with_channel_error or not config.TWILIO_WHATSAPP_NUMBER:
@@ -151,11 +135,7 @@ class MessagingService:
                 from_number = config.TWILIO_PHONE_NUMBER
                 if not from_number:
                     logger.error(f"TWILIO_PHONE_NUMBER is not set in config. Current value: '{from_number}'")
-                    if db_message and db:
-                        db_message.status = MessageStatus.FAILED
-                        db_message.error_message = "Twilio phone number not configured"
-                        db.commit()
-                    return None
+                    return None, "Twilio phone number not configured"
                 
                 to_number_formatted = to_number
                 
@@ -165,46 +145,23 @@ class MessagingService:
                 logger.info(f"  To (Patient Number): {to_number_formatted}")
                 
                 # Send message via Twilio SMS
-                message = self.twilio_client.messages.create(
+                message = twilio_client.messages.create(
                     body=message_content,
                     from_=from_number,
                     to=to_number_formatted
                 )
                 
-                message_sid = message.sid
-                
-                # Update database record if provided
-                if db_message and db:
-                    db_message.provider_message_id = message_sid
-                    db_message.status = MessageStatus.SENT
-                    db_message.sent_at = datetime.now()
-                    db.commit()
-                    db.refresh(db_message)
-                
-                logger.info(f"Twilio: SMS message sent successfully to {to_number}, SID: {message_sid}")
-                return message_sid
+                logger.info(f"Twilio: SMS message sent successfully to {to_number}, SID: {message.sid}")
+                return message.sid, None
                 
             except Exception as e:
                 error_message = str(e)
                 logger.error(f"Twilio SMS failed to send to {to_number}: {error_message}")
-                
-                # Update database record if provided
-                if db_message and db:
-                    db_message.status = MessageStatus.FAILED
-                    db_message.error_message = f"SMS error: {error_message}"
-                    db.commit()
-                    db.refresh(db_message)
-                
-                return None
+                return None, f"SMS error: {error_message}"
         
         # If we reach here, neither WhatsApp nor SMS worked
         logger.error("Failed to send message via both WhatsApp and SMS")
-        if db_message and db:
-            db_message.status = MessageStatus.FAILED
-            db_message.error_message = "Both WhatsApp and SMS failed"
-            db.commit()
-            db.refresh(db_message)
-        return None
+        return None, "Both WhatsApp and SMS failed"
     
     def send_whatsapp(self, to_number: str, message_content: str, db_message: Message = None, db: Session = None):
         """Send WhatsApp message via Twilio (wrapper for send_sms with WhatsApp flag)"""
@@ -213,12 +170,13 @@ class MessagingService:
     def process_message(self, message_id: int, custom_variables: dict = None, db: Session = None):
         """Process a message from the database by ID"""
         if db is None:
-            from app.database import SessionLocal
-            db = SessionLocal()
+            from app.database import DispatchSessionLocal
+            db = DispatchSessionLocal()
             should_close = True
         else:
             should_close = False
         
+        message = None
         try:
             # Query message with explicit patient join to ensure fresh data
             message = db.query(Message).filter(Message.id == message_id).first()
@@ -226,6 +184,15 @@ class MessagingService:
                 logger.error(f"Message {message_id} not found")
                 return
             
+            # Dispatch can be requested more than once (outbox relay, scheduler) - only send pending messages
+            if message.status != MessageStatus.PENDING:
+                logger.info(f"Message {message_id} is already {message.status.value}, skipping")
+                return
+            # Merged into another message's send (e.g. before its outbox event was relayed)
+            if message.coalesced_into_id is not None:
+                logger.info(f"Message {message_id} was coalesced into message {message.coalesced_into_id}, skipping")
+                return
+            
             # Explicitly reload patient from database to avoid cached data
             db.refresh(message, ['patient'])
             
@@ -233,9 +200,10 @@ class MessagingService:
             patient = db.query(Patient).filter(Patient.id == message.patient_id).first()
             if not patient:
                 logger.error(f"Patient {message.patient_id} not found for message {message_id}")
-                message.status = MessageStatus.FAILED
-                message.error_message = f"Patient {message.patient_id} not found"
-                db.commit()
+                message_status_service.transition(
+                    db, message_id, MessageStatus.FAILED,
+                    error_message=f"Patient {message.patient_id} not found"
+                )
                 return
             
             # Update message.patient reference to use fresh patient data
@@ -246,10 +214,11 @@ class MessagingService:
             
             # Check if patient has consent
             if not message.patient.consent_sms:
-                message.status = MessageStatus.FAILED
-                message.error_message = "Patient has not consented to SMS"
-                db.commit()
-                logger.info(f"Message {message.id} not sent - no consent")
+                message_status_service.transition(
+                    db, message_id, MessageStatus.FAILED,
+                    error_message="Patient has not consented to SMS"
+                )
+                logger.info(f"Message {message_id} not sent - no consent")
                 return
             
             # Check DND hours (only if enabled)
@@ -287,53 +256,64 @@ class MessagingService:
             # Get patient phone number - use fresh patient data
             patient_phone = patient.phone_number
             if not patient_phone:
-                logger.error(f"Message {message.id}: Patient {message.patient_id} has no phone number")
-                message.status = MessageStatus.FAILED
-                message.error_message = "Patient phone number not found"
-                db.commit()
+                logger.error(f"Message {message_id}: Patient {message.patient_id} has no phone number")
+                message_status_service.transition(
+                    db, message_id, MessageStatus.FAILED,
+                    error_message="Patient phone number not found"
+                )
                 return
             
             # Log patient details for debugging (use fresh patient data)
-            logger.info(f"Message {message.id}: Sending to patient ID {patient.id} - Name: {patient.first_name} {patient.last_name}, Phone: {patient_phone}, Email: {patient.email}")
+            logger.info(f"Message {message_id}: Sending to patient ID {patient.id} - Name: {patient.first_name} {patient.last_name}, Phone: {patient_phone}, Email: {patient.email}")
+            
+            message_content = message.content
             
+            # Claim the message (PENDING -> SENDING); if this fails another worker owns it,
+            # or it was coalesced into another send since it was loaded
+            if not message_status_service.transition(
+                db, message_id, MessageStatus.SENDING,
+                where=[Message.coalesced_into_id == None], claimed_at=datetime.now()
+            ):
+                logger.info(f"Message {message_id} was claimed by another worker, skipping")
+                return
+            
+            # The claim committed, so no transaction (and on the dispatch engine, no
+            # connection) is held across the provider calls and retry sleeps below
             # Determine if we should use WhatsApp based on config
             use_whatsapp = config.MESSAGE_CHANNEL in ["whatsapp", "both"]
             
             # Send the message with retry logic
             max_retries = 3
-            message_sid = None
             
             for attempt in range(max_retries):
-                message_sid = self.send_sms(
-                    patient_phone, 
-                    message.content, 
-                    message, 
-                    db,
-                    use_whatsapp=use_whatsapp
-                )
+                message_sid, error_message = self._deliver(patient_phone, message_content, use_whatsapp=use_whatsapp)
                 
                 if message_sid:
-                    message.retry_count = attempt
-                    logger.info(f"Message {message.id} sent successfully on attempt {attempt + 1}")
+                    message_status_service.transition(
+                        db, message_id, MessageStatus.SENT,
+                        provider_message_id=message_sid,
+                        sent_at=datetime.now(),
+                        retry_count=attempt
+                    )
+                    logger.info(f"Message {message_id} sent successfully on attempt {attempt + 1}")
                     break
+                elif attempt < max_retries - 1:
+                    logger.warning(f"Message {message_id} failed on attempt {attempt + 1}, will retry")
+                    import time
+                    time.sleep(2 ** attempt)  # Exponential backoff
                 else:
-                    message.retry_count = attempt + 1
-                    if attempt < max_retries - 1:
-                        logger.warning(f"Message {message.id} failed on attempt {attempt + 1}, will retry")
-                        import time
-                        time.sleep(2 ** attempt)  # Exponential backoff
-                    else:
-                        message.status = MessageStatus.FAILED
-                        message.error_message = "Failed after max retries"
-                        db.commit()
-                        logger.error(f"Message {message.id} failed after {max_retries} attempts")
+                    message_status_service.transition(
+                        db, message_id, MessageStatus.FAILED,
+                        error_message=f"Failed after max retries: {error_message}",
+                        retry_count=attempt + 1
+                    )
+                    logger.error(f"Message {message_id} failed after {max_retries} attempts")
             
         except Exception as e:
             logger.error(f"Error processing message {message_id}: {str(e)}")
             if message:
-                message.status = MessageStatus.FAILED
-                message.error_message = str(e)
-                db.commit()
+                db.rollback()
+                message_status_service.transition(db, message_id, MessageStatus.FAILED, error_message=str(e))
         finally:
             if should_close:
                 db.close()
@@ -348,8 +328,10 @@ class MessagingService:
         now = datetime.now()
         
         # First, get all pending messages for logging
+        # Messages merged into another send are finalized with their primary
         all_pending = db.query(Message).filter(
-            Message.status == MessageStatus.PENDING
+            Message.status == MessageStatus.PENDING,
+            Message.coalesced_into_id == None
         ).all()
         
         if all_pending:
@@ -371,13 +353,18 @@ class MessagingService:
         else:
             pending_messages = db.query(Message).filter(
                 (Message.status == MessageStatus.PENDING) & 
+                (Message.coalesced_into_id == None) &
                 ((Message.scheduled_for == None) | (Message.scheduled_for <= now))
             ).all()
             logger.info(f"Found {len(pending_messages)} messages due to be sent now (out of {len(all_pending)} total pending)")
         
+        # Optionally merge several due messages to the same patient into one send
+        pending_messages = message_coalescer.coalesce(db, pending_messages, now)
+        
         for message in pending_messages:
             logger.info(f"Processing message {message.id} for patient {message.patient_id}")
             self.process_message(message.id, None, db)
+            message_coalescer.finalize(db, message)
         
         return len(pending_messages)
     
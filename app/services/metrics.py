@@ -1,4 +1,5 @@
 import logging
+from collections import Counter
 from datetime import datetime, timedelta
 from sqlalchemy.orm import Session
 from sqlalchemy import func, and_
@@ -6,7 +7,7 @@ from typing import Optional, Dict
 
 from app.models import (
     Message, MessageStatus, Patient, Appointment, 
-    Broadcast, MessageType
+    Broadcast, MessageType, ArchivedMessage
 )
 
 logger = logging.getLogger(__name__)
@@ -77,9 +78,9 @@ class MetricsService:
                 Message.message_type == MessageType.RECALL,
                 Message.created_at >= cutoff_date,
                 Message.status == MessageStatus.SENT
-            ).all()
+            )
             
-            total_recalls = len(recall_messages)
+            total_recalls = recall_messages.count()
             
             if total_recalls == 0:
                 return {
@@ -88,18 +89,14 @@ class MetricsService:
                     "effectiveness_rate": 0.0
                 }
             
-            # Check how many led to appointments within days_window
-            appointments_booked = 0
-            for message in recall_messages:
-                # Check if patient booked an appointment after the recall
-                appointment = db.query(Appointment).filter(
-                    Appointment.patient_id == message.patient_id,
-                    Appointment.created_at >= message.sent_at or message.created_at,
-                    Appointment.status.in_(["scheduled", "completed"])
-                ).first()
-                
-                if appointment:
-                    appointments_booked += 1
+            # Check how many led to appointments within days_window:
+            # one correlated EXISTS instead of an appointment lookup per message
+            booked_after_recall = db.query(Appointment.id).filter(
+                Appointment.patient_id == Message.patient_id,
+                Appointment.created_at >= func.coalesce(Message.sent_at, Message.created_at),
+                Appointment.status.in_(["scheduled", "completed"])
+            ).exists()
+            appointments_booked = recall_messages.filter(booked_after_recall).count()
             
             effectiveness_rate = (appointments_booked / total_recalls) * 100.0 if total_recalls > 0 else 0.0
             
@@ -121,39 +118,49 @@ class MetricsService:
         self,
         db: Session,
         start_date: Optional[datetime] = None,
-        end_date: Optional[datetime] = None
+        end_date: Optional[datetime] = None,
+        include_archived: bool = False
     ) -> Dict:
-        """Get comprehensive message metrics"""
+        """Get comprehensive message metrics (archived messages too if include_archived)"""
         try:
-            query = db.query(Message)
-            
-            if start_date:
-                query = query.filter(Message.created_at >= start_date)
-            if end_date:
-                query = query.filter(Message.created_at <= end_date)
-            
-            total = query.count()
-            sent = query.filter(Message.status == MessageStatus.SENT).count()
-            delivered = query.filter(Message.status == MessageStatus.DELIVERED).count()
-            failed = query.filter(Message.status == MessageStatus.FAILED).count()
-            pending = query.filter(Message.status == MessageStatus.PENDING).count()
+            status_counts = Counter()
+            post_visit_times = []
+            for model in (Message, ArchivedMessage) if include_archived else (Message,):
+                query = db.query(model)
+                
+                if start_date:
+                    query = query.filter(model.created_at >= start_date)
+                if end_date:
+                    query = query.filter(model.created_at <= end_date)
+                
+                # One GROUP BY instead of a COUNT per status
+                status_counts.update(dict(
+                    query.with_entities(model.status, func.count(model.id)).group_by(model.status).all()
+                ))
+                
+                # Calculate average time from appointment completion to post-visit SMS
+                # Appointment dates are joined in rather than lazy-loaded per message
+                post_visit_times += query.join(
+                    Appointment, model.appointment_id == Appointment.id
+                ).filter(
+                    model.message_type == MessageType.POST_VISIT,
+                    model.status == MessageStatus.SENT,
+                    model.sent_at != None
+                ).with_entities(model.sent_at, Appointment.appointment_date).all()
             
-            # Calculate average time from appointment completion to post-visit SMS
-            post_visit_messages = query.filter(
-                Message.message_type == MessageType.POST_VISIT,
-                Message.status == MessageStatus.SENT
-            ).all()
+            total = sum(status_counts.values())
+            sent = status_counts.get(MessageStatus.SENT, 0)
+            delivered = status_counts.get(MessageStatus.DELIVERED, 0)
+            failed = status_counts.get(MessageStatus.FAILED, 0)
+            pending = status_counts.get(MessageStatus.PENDING, 0)
             
             avg_time_to_send = None
-            if post_visit_messages:
-                times = []
-                for msg in post_visit_messages:
-                    if msg.appointment and msg.sent_at:
-                        time_diff = (msg.sent_at - msg.appointment.appointment_date).total_seconds() / 60  # minutes
-                        times.append(time_diff)
-                
-                if times:
-                    avg_time_to_send = sum(times) / len(times)
+            times = [
+                (sent_at - appointment_date).total_seconds() / 60  # minutes
+                for sent_at, appointment_date in post_visit_times
+            ]
+            if times:
+                avg_time_to_send = sum(times) / len(times)
             
             return {
                 "total": total,
@@ -0,0 +1,127 @@
+"""
+Transactional outbox for message dispatch.
+
+API handlers write an OutboxEvent in the same transaction as the Message it
+refers to and return as soon as that commit finishes. The relay, run by the
+scheduler, streams unprocessed events to the dispatcher in insertion order.
+Delivery is at-least-once: an event is only marked processed after dispatch,
+and the dispatcher skips messages that are no longer pending.
+"""
+import json
+import logging
+import threading
+from datetime import datetime, timedelta
+from typing import Callable, Optional
+
+from sqlalchemy.orm import Session
+
+from app.config import config
+from app.models import Message, OutboxEvent
+from app.services.messaging import messaging_service
+
+logger = logging.getLogger(__name__)
+
+class OutboxService:
+    def __init__(self):
+        self.batch_size = config.OUTBOX_RELAY_BATCH_SIZE
+        self.max_attempts = config.OUTBOX_MAX_ATTEMPTS
+        self._relay_lock = threading.Lock()  # One relay pass at a time per process
+        self._wakeup: Optional[Callable[[], None]] = None
+
+    def enqueue(self, db: Session, message: Message, payload: Optional[dict] = None) -> OutboxEvent:
+        """Add a dispatch event for a message to the caller's transaction (does not commit)"""
+        event = OutboxEvent(
+            message=message,
+            event_type="dispatch",
+            payload=json.dumps(payload, default=str) if payload else None
+        )
+        db.add(event)
+        return event
+
+    def set_wakeup(self, callback: Callable[[], None]):
+        """Register a callback that runs the relay as soon as possible"""
+        self._wakeup = callback
+
+    def notify(self):
+        """Ask the relay to run now instead of waiting for its next interval"""
+        if self._wakeup:
+            try:
+                self._wakeup()
+            except Exception as e:
+                logger.warning(f"Outbox: Failed to wake relay: {str(e)}")
+
+    def relay(self, db: Session = None) -> int:
+        """Dispatch unprocessed outbox events in order until the outbox is drained"""
+        if not self._relay_lock.acquire(blocking=False):
+            logger.debug("Outbox relay already running")
+            return 0
+
+        if db is None:
+            from app.database import DispatchSessionLocal
+            db = DispatchSessionLocal()
+            should_close = True
+        else:
+            should_close = False
+
+        dispatched = 0
+        try:
+            last_id = 0
+            while True:
+                events = db.query(OutboxEvent).filter(
+                    OutboxEvent.processed_at == None,
+                    OutboxEvent.attempts < self.max_attempts,
+                    OutboxEvent.id > last_id
+                ).order_by(OutboxEvent.id).limit(self.batch_size).all()
+
+                if not events:
+                    break
+
+                for event in events:
+                    last_id = event.id
+                    if self._dispatch(db, event):
+                        dispatched += 1
+
+            if dispatched:
+                logger.info(f"Outbox relay dispatched {dispatched} events")
+            return dispatched
+        except Exception as e:
+            logger.error(f"Error relaying outbox: {str(e)}")
+            db.rollback()
+            return dispatched
+        finally:
+            self._relay_lock.release()
+            if should_close:
+                db.close()
+
+    def purge_processed(self, db: Session, older_than_hours: Optional[int] = None) -> int:
+        """Delete processed events older than the retention window"""
+        hours = older_than_hours if older_than_hours is not None else config.OUTBOX_RETENTION_HOURS
+        cutoff = datetime.now() - timedelta(hours=hours)
+        deleted = db.query(OutboxEvent).filter(
+            OutboxEvent.processed_at != None,
+            OutboxEvent.processed_at < cutoff
+        ).delete(synchronize_session=False)
+        db.commit()
+        return deleted
+
+    def _dispatch(self, db: Session, event: OutboxEvent) -> bool:
+        # Count the attempt before dispatching so a crash loop stops at max_attempts
+        event.attempts = (event.attempts or 0) + 1
+        db.commit()
+
+        try:
+            payload = json.loads(event.payload) if event.payload else None
+            messaging_service.process_message(event.message_id, payload, db)
+            event.processed_at = datetime.now()
+            event.last_error = None
+            db.commit()
+            return True
+        except Exception as e:
+            db.rollback()
+            logger.error(f"Outbox event {event.id} for message {event.message_id} failed: {str(e)}")
+            event.last_error = str(e)
+            db.commit()
+            return False
+
+# Create singleton instance
+outbox_service = OutboxService()
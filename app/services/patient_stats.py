@@ -0,0 +1,183 @@
+"""
+Incrementally maintained per-patient stats (patient_stats table).
+
+The patient list reads appointment/message counts and the last appointment
+from this table instead of outer-joining appointments and messages onto
+patients and grouping. A session after_flush hook keeps it current:
+
+- new patients get a zeroed row
+- new/deleted messages adjust message_count in place
+- new/changed/deleted appointments recompute that patient's row from the
+  per-patient indexes
+
+Bulk Query.delete()/update() calls bypass the hook; callers refresh the
+affected patients (or report deleted messages) explicitly, and rebuild()
+recomputes everything. message_count includes messages moved to
+messages_archive (see app/services/retention.py) until they are purged.
+"""
+import logging
+from collections import Counter
+from datetime import datetime
+from typing import Dict, Iterable
+
+from sqlalchemy import delete, event, func, inspect, insert, select, update
+from sqlalchemy.orm import Session
+
+from app.models import Appointment, ArchivedMessage, Message, Patient, PatientStats
+
+logger = logging.getLogger(__name__)
+
+class PatientStatsService:
+    def refresh_patients(self, db: Session, patient_ids: Iterable[int]):
+        """Recompute stats rows for the given patients from the source tables"""
+        self._refresh(db.connection(), patient_ids)
+
+    def record_deleted_messages(self, db: Session, counts: Dict[int, int]):
+        """Adjust message_count after a bulk delete of messages (patient_id -> deleted)"""
+        conn = db.connection()
+        now = datetime.now()
+        for patient_id, count in counts.items():
+            if count:
+                conn.execute(
+                    update(PatientStats)
+                    .where(PatientStats.patient_id == patient_id)
+                    .values(message_count=PatientStats.message_count - count, updated_at=now)
+                )
+
+    def rebuild(self, db: Session) -> int:
+        """Recompute the whole table (two independent GROUP BYs, no cartesian product)"""
+        conn = db.connection()
+        conn.execute(delete(PatientStats))
+
+        appointment_counts = dict(conn.execute(
+            select(Appointment.patient_id, func.count(Appointment.id)).group_by(Appointment.patient_id)
+        ).all())
+        message_counts = Counter()
+        for model in (Message, ArchivedMessage):
+            message_counts.update(dict(conn.execute(
+                select(model.patient_id, func.count(model.id)).group_by(model.patient_id)
+            ).all()))
+
+        # Latest appointment per patient, walking the index newest first
+        last_appointments = {}
+        for patient_id, appointment_date, status in conn.execute(
+            select(Appointment.patient_id, Appointment.appointment_date, Appointment.status)
+            .order_by(Appointment.patient_id, Appointment.appointment_date.desc(), Appointment.id.desc())
+        ):
+            last_appointments.setdefault(patient_id, (appointment_date, status))
+
+        now = datetime.now()
+        rows = []
+        for (patient_id,) in conn.execute(select(Patient.id)):
+            last_date, last_status = last_appointments.get(patient_id, (None, None))
+            rows.append({
+                "patient_id": patient_id,
+                "appointment_count": appointment_counts.get(patient_id, 0),
+                "message_count": message_counts.get(patient_id, 0),
+                "last_appointment_date": last_date,
+                "last_appointment_status": last_status,
+                "updated_at": now
+            })
+
+        if rows:
+            conn.execute(insert(PatientStats), rows)
+        db.commit()
+        logger.info(f"Rebuilt patient stats for {len(rows)} patients")
+        return len(rows)
+
+    def ensure_built(self, db: Session):
+        """Build the table once for databases that predate it"""
+        has_stats = db.execute(select(PatientStats.patient_id).limit(1)).first()
+        has_patients = db.execute(select(Patient.id).limit(1)).first()
+        if has_patients and not has_stats:
+            logger.info("patient_stats is empty, building it from existing data")
+            self.rebuild(db)
+
+    def after_flush(self, session: Session, flush_context):
+        """Apply the effect of the flushed changes to patient_stats"""
+        new_patients = []
+        message_deltas = Counter()
+        appointment_patients = set()
+
+        for obj in session.new:
+            if isinstance(obj, Patient):
+                new_patients.append(obj.id)
+            elif isinstance(obj, Message):
+                message_deltas[obj.patient_id] += 1
+            elif isinstance(obj, Appointment):
+                appointment_patients.add(obj.patient_id)
+
+        for obj in session.deleted:
+            if isinstance(obj, Message):
+                message_deltas[obj.patient_id] -= 1
+            elif isinstance(obj, Appointment):
+                appointment_patients.add(obj.patient_id)
+
+        for obj in session.dirty:
+            if isinstance(obj, Appointment) and session.is_modified(obj):
+                state = inspect(obj)
+                for attr in ("patient_id", "appointment_date", "status"):
+                    history = state.attrs[attr].history
+                    if history.has_changes():
+                        appointment_patients.add(obj.patient_id)
+                        # Moved to another patient: the old one needs a refresh too
+                        if attr == "patient_id":
+                            appointment_patients.update(p for p in history.deleted if p)
+
+        if not (new_patients or message_deltas or appointment_patients):
+            return
+
+        conn = session.connection()
+        now = datetime.now()
+        if new_patients:
+            conn.execute(insert(PatientStats), [
+                {"patient_id": patient_id, "appointment_count": 0, "message_count": 0, "updated_at": now}
+                for patient_id in new_patients
+            ])
+
+        missing = set()
+        for patient_id, delta in message_deltas.items():
+            if not delta:
+                continue
+            result = conn.execute(
+                update(PatientStats)
+                .where(PatientStats.patient_id == patient_id)
+                .values(message_count=PatientStats.message_count + delta, updated_at=now)
+            )
+            if result.rowcount == 0:
+                missing.add(patient_id)
+
+        self._refresh(conn, appointment_patients | missing)
+
+    def _refresh(self, conn, patient_ids: Iterable[int]):
+        now = datetime.now()
+        for patient_id in set(patient_ids):
+            last = conn.execute(
+                select(Appointment.appointment_date, Appointment.status)
+                .where(Appointment.patient_id == patient_id)
+                .order_by(Appointment.appointment_date.desc(), Appointment.id.desc())
+                .limit(1)
+            ).first()
+            values = {
+                "appointment_count": conn.execute(
+                    select(func.count(Appointment.id)).where(Appointment.patient_id == patient_id)
+                ).scalar(),
+                "message_count": sum(conn.execute(
+                    select(func.count(model.id)).where(model.patient_id == patient_id)
+                ).scalar() for model in (Message, ArchivedMessage)),
+                "last_appointment_date": last.appointment_date if last else None,
+                "last_appointment_status": last.status if last else None,
+                "updated_at": now
+            }
+
+            result = conn.execute(
+                update(PatientStats).where(PatientStats.patient_id == patient_id).values(**values)
+            )
+            if result.rowcount == 0:
+                conn.execute(insert(PatientStats).values(patient_id=patient_id, **values))
+
+# Create singleton instance
+patient_stats_service = PatientStatsService()
+
+# Maintain the read model for every ORM session in the process
+event.listen(Session, "after_flush", patient_stats_service.after_flush)
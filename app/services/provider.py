@@ -0,0 +1,98 @@
+"""
+Process-wide registry for messaging provider clients.
+
+A single Twilio client (and its keep-alive HTTP connection pool) plus a single
+Jinja environment are shared by every MessagingService user - the API, the
+scheduler and the broadcast service. Both are built lazily on first use so
+importing a module never opens connections.
+"""
+import logging
+import threading
+
+import jinja2
+
+from app.config import config
+
+logger = logging.getLogger(__name__)
+
+# Twilio SMS
+try:
+    from twilio.rest import Client as TwilioClient
+    from twilio.http.http_client import TwilioHttpClient
+    from requests.adapters import HTTPAdapter
+    TWILIO_AVAILABLE = True
+except ImportError:
+    TWILIO_AVAILABLE = False
+    logger.warning("twilio not installed. Install with: pip install twilio")
+
+class ProviderClientRegistry:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._twilio_client = None
+        self._twilio_initialized = False
+        self._template_env = None
+
+    def get_twilio_client(self):
+        """Get the shared Twilio client, creating it on first use"""
+        if not self._twilio_initialized:
+            with self._lock:
+                if not self._twilio_initialized:
+                    self._twilio_client = self._create_twilio_client()
+                    self._twilio_initialized = True
+        return self._twilio_client
+
+    def get_template_env(self) -> jinja2.Environment:
+        """Get the shared Jinja environment, creating it on first use"""
+        if self._template_env is None:
+            with self._lock:
+                if self._template_env is None:
+                    self._template_env = jinja2.Environment(autoescape=True)
+        return self._template_env
+
+    def reset(self):
+        """Drop the cached clients so the next send picks up new credentials"""
+        with self._lock:
+            if self._twilio_client is not None:
+                try:
+                    self._twilio_client.http_client.session.close()
+                except Exception as e:
+                    logger.warning(f"Twilio: Failed to close HTTP session: {str(e)}")
+            self._twilio_client = None
+            self._twilio_initialized = False
+
+    def _create_twilio_client(self):
+        if not TWILIO_AVAILABLE:
+            logger.warning("Twilio: twilio library not installed. SMS sending will be disabled.")
+            return None
+
+        if not (config.TWILIO_ACCOUNT_SID and config.TWILIO_AUTH_TOKEN):
+            logger.warning("Twilio credentials not found in config. SMS sending will be disabled.")
+            return None
+
+        try:
+            # Keep-alive session shared across threads; requests' pool is thread-safe
+            http_client = TwilioHttpClient(
+                pool_connections=True,
+                timeout=config.TWILIO_HTTP_TIMEOUT
+            )
+            adapter = HTTPAdapter(
+                pool_connections=1,  # Only api.twilio.com is ever contacted
+                pool_maxsize=config.TWILIO_HTTP_POOL_SIZE,
+                max_retries=config.TWILIO_HTTP_MAX_RETRIES  # Connection errors only; POSTs are not replayed
+            )
+            http_client.session.mount("https://", adapter)
+
+            client = TwilioClient(
+                config.TWILIO_ACCOUNT_SID,
+                config.TWILIO_AUTH_TOKEN,
+                http_client=http_client
+            )
+            logger.info("Twilio client initialized successfully")
+            logger.info(f"Twilio Config - Account SID: {config.TWILIO_ACCOUNT_SID[:10]}..., Phone: {config.TWILIO_PHONE_NUMBER}, WhatsApp: {config.TWILIO_WHATSAPP_NUMBER}, Channel: {config.MESSAGE_CHANNEL}, Pool size: {config.TWILIO_HTTP_POOL_SIZE}, Timeout: {config.TWILIO_HTTP_TIMEOUT}s")
+            return client
+        except Exception as e:
+            logger.error(f"Twilio: Failed to initialize client: {str(e)}")
+            return None
+
+# Create singleton instance
+provider_registry = ProviderClientRegistry()
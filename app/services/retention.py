@@ -0,0 +1,260 @@
+"""
+Hot/cold retention for messages and audit_logs.
+
+Rows past their retention window move from the hot tables into
+messages_archive / audit_logs_archive in batches of RETENTION_BATCH_SIZE,
+each an INSERT ... SELECT plus a DELETE in its own short transaction. The
+hot tables (and their indexes) then only hold recent history and stay in
+cache; list and metric endpoints reach the archive with include_archived.
+
+A message only moves once it is final (sent, delivered or failed) and no
+outbox event still references it. Messages coalesced into it must be
+movable too, and move in the same batch.
+
+Archived ids must never be handed out again, or (created_at, id) would no
+longer be unique across the hot and archive tables. messages and audit_logs
+use AUTOINCREMENT on SQLite; on databases created before that, the row with
+the highest id is never archived, which keeps SQLite from reusing ids.
+
+On PostgreSQL the archive tables are range-partitioned by month: each batch
+creates the month partitions it is about to fill, and compaction drops whole
+partitions older than ARCHIVE_RETENTION_MONTHS. Elsewhere compaction deletes
+archived rows in batches. With AUDIT_BACKEND=jsonl it also deletes sealed
+audit segments past ARCHIVE_RETENTION_MONTHS.
+
+patient_stats and stat_counters count hot and archived rows alike, so moving
+rows leaves them untouched; their rebuilds read both tables. Purging
+archived messages subtracts them in the same transaction.
+"""
+import calendar
+import logging
+import re
+import threading
+from collections import Counter
+from datetime import datetime
+from typing import Dict, List
+
+from sqlalchemy import DateTime, delete, exists, func, insert, literal, or_, select, text
+from sqlalchemy.orm import Session, aliased
+
+from app.audit_store import audit_store
+from app.cache import cache_service
+from app.config import config
+from app.models import (
+    ArchivedAuditLog, ArchivedMessage, AuditLog, Message, MessageStatus, OutboxEvent
+)
+from app.services.patient_stats import patient_stats_service
+from app.services.stat_counters import stat_counter_service
+
+logger = logging.getLogger(__name__)
+
+FINAL_STATUSES = (MessageStatus.SENT, MessageStatus.DELIVERED, MessageStatus.FAILED)
+
+# Month partitions are named <table>_<YYYY>_<MM>
+PARTITION_SUFFIX = re.compile(r"_(\d{4})_(\d{2})$")
+
+def add_months(value: datetime, months: int) -> datetime:
+    """Same day `months` later (or earlier), clamped to the end of shorter months"""
+    month_index = value.month - 1 + months
+    year, month = value.year + month_index // 12, month_index % 12 + 1
+    return value.replace(year=year, month=month, day=min(value.day, calendar.monthrange(year, month)[1]))
+
+def month_start(value: datetime) -> datetime:
+    return datetime(value.year, value.month, 1)
+
+class RetentionService:
+    def __init__(self, batch_size: int = 1000):
+        self.batch_size = batch_size
+        self._lock = threading.Lock()
+
+    def run(self, db: Session) -> Dict[str, int]:
+        """Archive expired messages and audit logs, then compact the archive"""
+        if not self._lock.acquire(blocking=False):
+            logger.debug("Retention already running")
+            return {}
+        try:
+            now = datetime.now()
+            result = {"messages": 0, "audit_logs": 0, "purged": 0}
+            if config.MESSAGE_RETENTION_MONTHS:
+                result["messages"] = self.archive_messages(db, add_months(now, -config.MESSAGE_RETENTION_MONTHS))
+            if config.AUDIT_LOG_RETENTION_MONTHS:
+                result["audit_logs"] = self.archive_audit_logs(db, add_months(now, -config.AUDIT_LOG_RETENTION_MONTHS))
+            if config.ARCHIVE_RETENTION_MONTHS:
+                result["purged"] = self.purge_archive(db, add_months(now, -config.ARCHIVE_RETENTION_MONTHS))
+            return result
+        finally:
+            self._lock.release()
+
+    def archive_messages(self, db: Session, before: datetime) -> int:
+        """Move final messages created before `before` to messages_archive"""
+        coalesced = aliased(Message)
+        # A message stays while something coalesced into it can't move yet
+        blocked = exists().where(
+            coalesced.coalesced_into_id == Message.id,
+            or_(
+                coalesced.created_at == None,
+                coalesced.created_at >= before,
+                coalesced.status.notin_(FINAL_STATUSES),
+                exists().where(OutboxEvent.message_id == coalesced.id)
+            )
+        )
+        candidates = select(Message.id).where(
+            Message.created_at < before,
+            Message.status.in_(FINAL_STATUSES),
+            ~exists().where(OutboxEvent.message_id == Message.id),
+            ~blocked,
+            *self._id_guard(db, Message)
+        ).order_by(Message.id)
+
+        moved = 0
+        while True:
+            ids = list(db.execute(candidates.limit(self.batch_size)).scalars())
+            if not ids:
+                break
+            ids += db.execute(
+                select(Message.id).where(Message.coalesced_into_id.in_(ids), Message.id.notin_(ids))
+            ).scalars().all()
+            patient_ids = set(db.execute(select(Message.patient_id).where(Message.id.in_(ids)).distinct()).scalars())
+
+            self._move(db, Message, ArchivedMessage, ids)
+            moved += len(ids)
+            # Cached message lists of these patients still show the moved rows
+            cache_service.invalidate(*(f"patient_messages:{patient_id}" for patient_id in patient_ids))
+
+        if moved:
+            logger.info(f"Archived {moved} messages created before {before:%Y-%m-%d}")
+        return moved
+
+    def archive_audit_logs(self, db: Session, before: datetime) -> int:
+        """Move audit logs created before `before` to audit_logs_archive"""
+        candidates = select(AuditLog.id).where(
+            AuditLog.created_at < before, *self._id_guard(db, AuditLog)
+        ).order_by(AuditLog.id)
+
+        moved = 0
+        while True:
+            ids = list(db.execute(candidates.limit(self.batch_size)).scalars())
+            if not ids:
+                break
+            self._move(db, AuditLog, ArchivedAuditLog, ids)
+            moved += len(ids)
+
+        if moved:
+            logger.info(f"Archived {moved} audit logs created before {before:%Y-%m-%d}")
+        return moved
+
+    def _id_guard(self, db: Session, model) -> list:
+        """Keep the highest id in a SQLite table without AUTOINCREMENT (it would be reused)"""
+        conn = db.connection()
+        if conn.dialect.name != "sqlite":
+            return []
+        table = model.__tablename__
+        ddl = conn.execute(
+            text("SELECT sql FROM sqlite_master WHERE type = 'table' AND name = :table"), {"table": table}
+        ).scalar() or ""
+        if "AUTOINCREMENT" in ddl.upper():
+            return []
+        highest = conn.execute(select(func.max(model.id))).scalar()
+        return [model.id < highest] if highest is not None else []
+
+    def _move(self, db: Session, model, archive, ids: List[int]):
+        """Copy rows to the archive and delete them from the hot table in one transaction"""
+        try:
+            conn = db.connection()
+            columns = list(model.__table__.columns)
+            months = {month_start(created_at) for created_at in conn.execute(
+                select(model.created_at).where(model.id.in_(ids))
+            ).scalars()}
+            self._ensure_partitions(conn, archive, months)
+
+            conn.execute(insert(archive).from_select(
+                [column.name for column in columns] + ["archived_at"],
+                select(*columns, literal(datetime.now(), DateTime)).where(model.id.in_(ids))
+            ))
+            conn.execute(delete(model).where(model.id.in_(ids)))
+            db.commit()
+        except Exception:
+            db.rollback()
+            raise
+
+    def _ensure_partitions(self, conn, archive, months):
+        """Create the PostgreSQL month partitions rows are about to be archived into"""
+        if conn.dialect.name != "postgresql":
+            return
+        table = archive.__tablename__
+        for month in sorted(months):
+            conn.execute(text(
+                f'CREATE TABLE IF NOT EXISTS "{table}_{month:%Y_%m}" PARTITION OF "{table}" '
+                f"FOR VALUES FROM ('{month:%Y-%m-%d}') TO ('{add_months(month, 1):%Y-%m-%d}')"
+            ))
+
+    def purge_archive(self, db: Session, before: datetime) -> int:
+        """Delete archived rows created before `before`"""
+        purged = 0
+        for archive in (ArchivedMessage, ArchivedAuditLog):
+            if db.get_bind().dialect.name == "postgresql":
+                purged += self._drop_partitions(db, archive, before)
+                continue
+            candidates = select(archive.id).where(archive.created_at < before).limit(self.batch_size)
+            while True:
+                ids = list(db.execute(candidates).scalars())
+                if not ids:
+                    break
+                batch = (archive.created_at < before, archive.id.in_(ids))
+                if archive is ArchivedMessage:
+                    self._forget_messages(db, *batch)
+                db.execute(delete(archive).where(*batch))
+                db.commit()
+                purged += len(ids)
+        if config.AUDIT_BACKEND == "jsonl":
+            purged += audit_store.purge(before)
+        if purged:
+            logger.info(f"Purged {purged} archived rows created before {before:%Y-%m-%d}")
+        return purged
+
+    def _forget_messages(self, db: Session, *criteria):
+        """Subtract archived messages about to be purged from patient_stats and stat_counters"""
+        per_patient, per_status = Counter(), Counter()
+        for patient_id, status, count in db.execute(
+            select(ArchivedMessage.patient_id, ArchivedMessage.status, func.count())
+            .where(*criteria)
+            .group_by(ArchivedMessage.patient_id, ArchivedMessage.status)
+        ):
+            per_patient[patient_id] += count
+            per_status[status] += count
+        patient_stats_service.record_deleted_messages(db, per_patient)
+        for status, count in per_status.items():
+            if status is None:
+                stat_counter_service.increment(db.connection(), {"messages.total": -count})
+            else:
+                stat_counter_service.record_deleted_messages(db, status, count)
+
+    def _drop_partitions(self, db: Session, archive, before: datetime) -> int:
+        """Drop month partitions that end before `before` (partly expired months stay)"""
+        table = archive.__tablename__
+        partitions = db.execute(text(
+            "SELECT child.relname FROM pg_inherits "
+            "JOIN pg_class parent ON parent.oid = pg_inherits.inhparent "
+            "JOIN pg_class child ON child.oid = pg_inherits.inhrelid "
+            "WHERE parent.relname = :table"
+        ), {"table": table}).scalars().all()
+
+        dropped = 0
+        for name in partitions:
+            match = PARTITION_SUFFIX.search(name)
+            if not match:
+                continue
+            month = datetime(int(match.group(1)), int(match.group(2)), 1)
+            if add_months(month, 1) > before:
+                continue
+            dropped += db.execute(text(f'SELECT count(*) FROM "{name}"')).scalar()
+            if archive is ArchivedMessage:
+                # Pruned to this partition by the range
+                self._forget_messages(db, archive.created_at >= month, archive.created_at < add_months(month, 1))
+            db.execute(text(f'DROP TABLE "{name}"'))
+            db.commit()
+            logger.info(f"Dropped archive partition {name}")
+        return dropped
+
+# Create singleton instance
+retention_service = RetentionService(config.RETENTION_BATCH_SIZE)
@@ -0,0 +1,218 @@
+"""
+Incrementally maintained counters for the dashboard summary (stat_counters).
+
+Counters:
+- patients.total, patients.consented
+- appointments.total, appointments.date.<YYYY-MM-DD> (non-cancelled
+  appointments per day, so "today" and "next N days" are a handful of
+  primary-key lookups)
+- messages.total, messages.status.<status>
+
+A session after_flush hook applies ORM inserts/deletes/changes, and
+message_status_service reports its conditional UPDATEs through
+apply_status_moves(). Bulk Query.delete()/update() calls bypass both;
+callers adjust the counters explicitly, and rebuild() recomputes everything.
+Message counters include messages moved to messages_archive (see
+app/services/retention.py) until they are purged.
+"""
+import logging
+from collections import Counter
+from datetime import date, datetime, timedelta
+from typing import Dict, Optional
+
+from sqlalchemy import delete, event, func, insert, inspect, select, update
+from sqlalchemy.orm import Session
+
+from app.config import config
+from app.models import Appointment, ArchivedMessage, Message, MessageStatus, Patient, StatCounter
+
+logger = logging.getLogger(__name__)
+
+CANCELLED = "cancelled"
+
+def appointment_day_key(day) -> str:
+    if isinstance(day, datetime):
+        day = day.date()
+    return f"appointments.date.{day.isoformat()}"
+
+def message_status_key(status) -> str:
+    return f"messages.status.{MessageStatus(status).value}"
+
+class StatCounterService:
+    def increment(self, conn, deltas: Dict[str, int]):
+        """Add deltas to counters in the current transaction (creating missing ones)"""
+        now = datetime.now()
+        for name, delta in deltas.items():
+            if not delta:
+                continue
+            result = conn.execute(
+                update(StatCounter)
+                .where(StatCounter.name == name)
+                .values(value=StatCounter.value + delta, updated_at=now)
+            )
+            if result.rowcount == 0:
+                self._insert_or_add(conn, name, delta, now)
+
+    def _insert_or_add(self, conn, name: str, delta: int, now: datetime):
+        # Upsert so two transactions creating the same day's counter don't collide
+        dialect = conn.dialect.name
+        if dialect in ("sqlite", "postgresql"):
+            if dialect == "sqlite":
+                from sqlalchemy.dialects.sqlite import insert as dialect_insert
+            else:
+                from sqlalchemy.dialects.postgresql import insert as dialect_insert
+            stmt = dialect_insert(StatCounter).values(name=name, value=delta, updated_at=now)
+            conn.execute(stmt.on_conflict_do_update(
+                index_elements=[StatCounter.name],
+                set_={"value": StatCounter.value + delta, "updated_at": now}
+            ))
+        else:
+            conn.execute(insert(StatCounter).values(name=name, value=delta, updated_at=now))
+
+    def apply_status_moves(self, db: Session, moves: Dict[MessageStatus, int], to_status: MessageStatus):
+        """Record messages moved from each status in `moves` to to_status"""
+        deltas = Counter()
+        for from_status, count in moves.items():
+            deltas[message_status_key(from_status)] -= count
+            deltas[message_status_key(to_status)] += count
+        self.increment(db.connection(), deltas)
+
+    def record_deleted_messages(self, db: Session, status: MessageStatus, count: int):
+        """Adjust counters after a bulk delete of messages in one status"""
+        if count:
+            self.increment(db.connection(), {"messages.total": -count, message_status_key(status): -count})
+
+    def summary(self, db: Session, today: Optional[date] = None) -> dict:
+        """Dashboard tile values from a fixed set of counter rows"""
+        today = today or date.today()
+        upcoming_days = [today + timedelta(days=i) for i in range(1, config.DASHBOARD_UPCOMING_DAYS + 1)]
+        names = ["patients.total", "patients.consented", "appointments.total", "messages.total"]
+        names += [message_status_key(status) for status in MessageStatus]
+        names += [appointment_day_key(today)] + [appointment_day_key(day) for day in upcoming_days]
+
+        values = dict(db.execute(
+            select(StatCounter.name, StatCounter.value).where(StatCounter.name.in_(names))
+        ).all())
+        messages_by_status = {status.value: values.get(message_status_key(status), 0) for status in MessageStatus}
+        handed_off = sum(messages_by_status[s.value] for s in (MessageStatus.SENT, MessageStatus.DELIVERED, MessageStatus.FAILED))
+
+        return {
+            "patients": {
+                "total": values.get("patients.total", 0),
+                "consented": values.get("patients.consented", 0),
+            },
+            "appointments": {
+                "total": values.get("appointments.total", 0),
+                "today": values.get(appointment_day_key(today), 0),
+                "upcoming": sum(values.get(appointment_day_key(day), 0) for day in upcoming_days),
+                "upcoming_days": config.DASHBOARD_UPCOMING_DAYS,
+            },
+            "messages": {
+                "total": values.get("messages.total", 0),
+                "by_status": messages_by_status,
+                "delivery_rate": (messages_by_status[MessageStatus.DELIVERED.value] / handed_off * 100.0) if handed_off else 0.0,
+            },
+            "generated_at": datetime.now().isoformat(),
+        }
+
+    def rebuild(self, db: Session) -> int:
+        """Recompute every counter from the source tables"""
+        conn = db.connection()
+        conn.execute(delete(StatCounter))
+
+        counters = {
+            "patients.total": conn.execute(select(func.count(Patient.id))).scalar(),
+            "patients.consented": conn.execute(
+                select(func.count(Patient.id)).where(Patient.consent_sms == True)
+            ).scalar(),
+            "appointments.total": conn.execute(select(func.count(Appointment.id))).scalar(),
+            "messages.total": 0,
+        }
+        for model in (Message, ArchivedMessage):
+            for status, count in conn.execute(select(model.status, func.count(model.id)).group_by(model.status)):
+                counters["messages.total"] += count
+                if status is not None:
+                    key = message_status_key(status)
+                    counters[key] = counters.get(key, 0) + count
+
+        per_day = Counter()
+        for (appointment_date,) in conn.execute(
+            select(Appointment.appointment_date).where(Appointment.status != CANCELLED)
+        ):
+            if appointment_date:
+                per_day[appointment_day_key(appointment_date)] += 1
+        counters.update(per_day)
+
+        now = datetime.now()
+        conn.execute(insert(StatCounter), [
+            {"name": name, "value": value or 0, "updated_at": now} for name, value in counters.items()
+        ])
+        db.commit()
+        logger.info(f"Rebuilt {len(counters)} stat counters")
+        return len(counters)
+
+    def ensure_built(self, db: Session):
+        """Build the counters once for databases that predate them"""
+        if not db.execute(select(StatCounter.name).limit(1)).first():
+            logger.info("stat_counters is empty, building it from existing data")
+            self.rebuild(db)
+
+    def after_flush(self, session: Session, flush_context):
+        """Apply the effect of the flushed changes to the counters"""
+        deltas = Counter()
+
+        for obj in session.new:
+            if isinstance(obj, Patient):
+                deltas["patients.total"] += 1
+                deltas["patients.consented"] += 1 if obj.consent_sms else 0
+            elif isinstance(obj, Message):
+                deltas["messages.total"] += 1
+                deltas[message_status_key(obj.status or MessageStatus.PENDING)] += 1
+            elif isinstance(obj, Appointment):
+                deltas["appointments.total"] += 1
+                if obj.appointment_date and obj.status != CANCELLED:
+                    deltas[appointment_day_key(obj.appointment_date)] += 1
+
+        for obj in session.deleted:
+            if isinstance(obj, Patient):
+                deltas["patients.total"] -= 1
+                deltas["patients.consented"] -= 1 if obj.consent_sms else 0
+            elif isinstance(obj, Message):
+                deltas["messages.total"] -= 1
+                deltas[message_status_key(obj.status)] -= 1
+            elif isinstance(obj, Appointment):
+                deltas["appointments.total"] -= 1
+                if obj.appointment_date and obj.status != CANCELLED:
+                    deltas[appointment_day_key(obj.appointment_date)] -= 1
+
+        for obj in session.dirty:
+            if isinstance(obj, Patient):
+                history = inspect(obj).attrs.consent_sms.history
+                if history.has_changes():
+                    before = bool(history.deleted and history.deleted[0])
+                    deltas["patients.consented"] += int(bool(obj.consent_sms)) - int(before)
+            elif isinstance(obj, Message):
+                history = inspect(obj).attrs.status.history
+                if history.has_changes() and history.deleted and history.deleted[0]:
+                    deltas[message_status_key(history.deleted[0])] -= 1
+                    deltas[message_status_key(obj.status)] += 1
+            elif isinstance(obj, Appointment):
+                state = inspect(obj)
+                date_history = state.attrs.appointment_date.history
+                status_history = state.attrs.status.history
+                if date_history.has_changes() or status_history.has_changes():
+                    old_date = date_history.deleted[0] if date_history.deleted else obj.appointment_date
+                    old_status = status_history.deleted[0] if status_history.deleted else obj.status
+                    if old_date and old_status != CANCELLED:
+                        deltas[appointment_day_key(old_date)] -= 1
+                    if obj.appointment_date and obj.status != CANCELLED:
+                        deltas[appointment_day_key(obj.appointment_date)] += 1
+
+        if any(deltas.values()):
+            self.increment(session.connection(), deltas)
+
+# Create singleton instance
+stat_counter_service = StatCounterService()
+
+# Maintain the counters for every ORM session in the process
+event.listen(Session, "after_flush", stat_counter_service.after_flush)
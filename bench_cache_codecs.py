@@ -0,0 +1,77 @@
+"""
+Benchmark cache codecs and compression on realistic /messages/ pages
+Compares every codec/compressor installed here (orjson, msgpack, json x
+none/zstd/lz4/zlib) on encoded size and encode/decode time.
+
+Usage: python bench_cache_codecs.py [page_size ...]
+"""
+import random
+import sys
+import timeit
+from datetime import datetime, timedelta
+
+from app.models import MessageStatus, MessageType
+from app.serialization import PayloadSerializer, available_codecs, available_compressors
+
+SAMPLE_CONTENT = [
+    "Hi {name}, this is a reminder of your dental appointment on {date} at 10:30 AM. Reply STOP to opt out.",
+    "Hi {name}, thank you for visiting us today! How was your experience? We'd love your feedback.",
+    "Hi {name}, it's been 6 months since your last cleaning. Call us or book online to schedule your recall visit.",
+    "Hi {name}, our clinic will be closed on {date} for maintenance. We apologize for any inconvenience.",
+]
+FIRST_NAMES = ["Ava", "Liam", "Noah", "Emma", "Mia", "Lucas", "Sofia", "Ethan", "Isla", "Omar"]
+
+def build_page(page_size: int) -> dict:
+    """A /messages/ response page with raw datetimes/enums, as handed to the codec"""
+    rng = random.Random(page_size)
+    now = datetime(2026, 10, 19, 9, 0, 0)
+    items = []
+    for i in range(page_size):
+        created_at = now - timedelta(minutes=7 * i, seconds=rng.randint(0, 59))
+        sent_at = created_at + timedelta(seconds=rng.randint(1, 90)) if rng.random() < 0.85 else None
+        content = rng.choice(SAMPLE_CONTENT).format(
+            name=rng.choice(FIRST_NAMES),
+            date=(created_at + timedelta(days=rng.randint(1, 14))).strftime("%B %d, %Y")
+        )
+        item = {
+            "id": 100000 - i,
+            "patient_id": rng.randint(1, 5000),
+            "message_type": rng.choice(list(MessageType)),
+            "status": rng.choice(list(MessageStatus)),
+            "content": content,
+            "sent_at": sent_at,
+            "created_at": created_at,
+        }
+        items.append(item)
+    return {"items": items, "page_size": page_size, "next_cursor": "WyIyMDI2LTEwLTE5VDA5OjAwOjAwIiwxMDBd"}
+
+def bench(serializer: PayloadSerializer, payload: dict, number: int):
+    encoded = serializer.dumps(payload)
+    encode_us = timeit.timeit(lambda: serializer.dumps(payload), number=number) / number * 1e6
+    decode_us = timeit.timeit(lambda: serializer.loads(encoded), number=number) / number * 1e6
+    return len(encoded), encode_us, decode_us
+
+def main():
+    page_sizes = [int(arg) for arg in sys.argv[1:]] or [50, 200, 1000]
+    codecs = list(available_codecs())
+    compressions = ["none"] + list(available_compressors())
+
+    print("=" * 72)
+    print("Cache codec benchmark (/messages/ pages)")
+    print("=" * 72)
+    print(f"Codecs: {', '.join(codecs)}    Compression: {', '.join(compressions)}")
+
+    for page_size in page_sizes:
+        payload = build_page(page_size)
+        number = max(20, 20000 // page_size)
+        print(f"\nPage size {page_size} ({number} iterations)")
+        print(f"  {'codec':<10}{'compression':<14}{'bytes':>10}{'encode us':>14}{'decode us':>14}")
+        for codec in codecs:
+            for compression in compressions:
+                serializer = PayloadSerializer(codec, compression, min_compress_bytes=0)
+                size, encode_us, decode_us = bench(serializer, payload, number)
+                print(f"  {codec:<10}{compression:<14}{size:>10}{encode_us:>14.1f}{decode_us:>14.1f}")
+    print()
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,94 @@
+"""
+Benchmark the /messages/ list serialization paths
+Compares the old path (ORM objects -> hand-built dicts -> FastAPI's
+jsonable_encoder -> json.dumps) with the new one (Core rows ->
+RowSerializer -> FastJSONResponse) on an in-memory SQLite database.
+
+Usage: python bench_serialization.py [page_size ...]
+"""
+import json
+import sys
+import timeit
+from datetime import datetime, timedelta
+
+from fastapi.encoders import jsonable_encoder
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+
+from app.models import Base, Patient, Message, MessageStatus, MessageType
+from app.serialization import ORJSON_AVAILABLE, FastJSONResponse, model_serializer
+
+message_list_serializer = model_serializer(
+    Message,
+    ["id", "patient_id", "message_type", "status", "content", "sent_at", "created_at"]
+)
+
+def seed(db, count: int):
+    patient = Patient(first_name="Bench", last_name="Patient", phone_number="+15550000000", consent_sms=True)
+    db.add(patient)
+    db.flush()
+    now = datetime(2026, 10, 19, 9, 0, 0)
+    db.bulk_insert_mappings(Message, [
+        {
+            "patient_id": patient.id,
+            "message_type": list(MessageType)[i % len(MessageType)],
+            "status": list(MessageStatus)[i % len(MessageStatus)],
+            "content": f"Hi Bench, this is a reminder of your dental appointment #{i} on October 30 at 10:30 AM.",
+            "sent_at": now - timedelta(minutes=i) if i % 7 else None,
+            "created_at": now - timedelta(minutes=i, seconds=5),
+        }
+        for i in range(count)
+    ])
+    db.commit()
+
+def orm_path(db, page_size: int) -> bytes:
+    messages = db.query(Message).order_by(Message.created_at.desc(), Message.id.desc()).limit(page_size).all()
+    payload = {
+        "items": [
+            {
+                "id": m.id,
+                "patient_id": m.patient_id,
+                "message_type": m.message_type.value if hasattr(m.message_type, 'value') else str(m.message_type),
+                "status": m.status.value if hasattr(m.status, 'value') else str(m.status),
+                "content": m.content,
+                "sent_at": m.sent_at.isoformat() if m.sent_at else None,
+                "created_at": m.created_at.isoformat() if m.created_at else None
+            }
+            for m in messages
+        ],
+        "page_size": page_size
+    }
+    # What FastAPI does with response_model=dict + JSONResponse
+    return json.dumps(jsonable_encoder(payload), ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+
+def row_path(db, page_size: int) -> bytes:
+    rows = db.query(*message_list_serializer.columns).order_by(
+        Message.created_at.desc(), Message.id.desc()
+    ).limit(page_size).all()
+    payload = {"items": [message_list_serializer(row) for row in rows], "page_size": page_size}
+    return FastJSONResponse(payload).body
+
+def main():
+    page_sizes = [int(arg) for arg in sys.argv[1:]] or [50, 200, 1000]
+    engine = create_engine("sqlite://")
+    Base.metadata.create_all(bind=engine)
+    Session = sessionmaker(bind=engine)
+    db = Session()
+    seed(db, max(page_sizes))
+
+    print("=" * 64)
+    print(f"/messages/ serialization benchmark (orjson: {'yes' if ORJSON_AVAILABLE else 'no'})")
+    print("=" * 64)
+    print(f"  {'page size':>10}{'orm + encoder ms':>20}{'rows + fast ms':>18}{'speedup':>10}")
+    for page_size in page_sizes:
+        assert json.loads(orm_path(db, page_size)) == json.loads(row_path(db, page_size))
+        number = max(5, 2000 // page_size)
+        # expunge_all keeps the identity map from turning later ORM runs into cache hits
+        orm_ms = timeit.timeit(lambda: (orm_path(db, page_size), db.expunge_all()), number=number) / number * 1000
+        row_ms = timeit.timeit(lambda: row_path(db, page_size), number=number) / number * 1000
+        print(f"  {page_size:>10}{orm_ms:>20.2f}{row_ms:>18.2f}{orm_ms / row_ms:>9.1f}x")
+    print()
+    db.close()
+
+if __name__ == "__main__":
+    main()
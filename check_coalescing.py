@@ -0,0 +1,95 @@
+"""
+Check message coalescing
+Seeds a throwaway SQLite database with two compatible messages to one
+patient and runs the coalescing stage the way process_pending_messages()
+does, in the scheduled mode (due messages only) and in force_immediate mode
+(every pending message, including future ones). Fails unless exactly one
+send remains, carrying both bodies once, with the other message merged into
+it. No messages are sent.
+
+Usage: python check_coalescing.py
+"""
+import os
+import sys
+import tempfile
+from datetime import datetime, timedelta
+
+DB_PATH = os.path.join(tempfile.mkdtemp(), "coalescing.db")
+os.environ["DATABASE_URL"] = f"sqlite:///{DB_PATH}"
+os.environ["DATABASE_READ_URLS"] = ""
+os.environ["MESSAGE_COALESCING_ENABLED"] = "true"
+
+from app.config import config
+from app.database import SessionLocal, create_tables
+from app.models import Message, MessageStatus, MessageType, Patient
+from app.services.coalescing import message_coalescer
+
+# (scenario, offsets of the two messages from now in minutes, force_immediate)
+SCENARIOS = [
+    ("due + upcoming", (-1, 1), False),
+    ("force_immediate, both upcoming", (1, 2), True),
+    ("force_immediate, due + upcoming", (-1, 1), True),
+]
+
+def run(db, number: int, offsets, force_immediate: bool) -> list:
+    now = datetime.now()
+    patient = Patient(first_name="Coalesce", last_name="Check", phone_number=f"+1555{number:07d}", consent_sms=True)
+    db.add(patient)
+    db.flush()
+    bodies = ["A", "B"]
+    for body, minutes in zip(bodies, offsets):
+        db.add(Message(
+            patient_id=patient.id, message_type=MessageType.RECALL, content=body,
+            status=MessageStatus.PENDING, scheduled_for=now + timedelta(minutes=minutes)
+        ))
+    db.commit()
+
+    # Same selection as process_pending_messages()
+    query = db.query(Message).filter(
+        Message.patient_id == patient.id,
+        Message.status == MessageStatus.PENDING,
+        Message.coalesced_into_id == None
+    )
+    if not force_immediate:
+        query = query.filter((Message.scheduled_for == None) | (Message.scheduled_for <= now))
+    to_send = message_coalescer.coalesce(db, query.all(), now)
+
+    problems = []
+    if len(to_send) != 1:
+        return [f"{len(to_send)} sends instead of 1"]
+    primary = to_send[0]
+    if primary.coalesced_into_id is not None:
+        problems.append(f"message {primary.id} is merged into {primary.coalesced_into_id}")
+    if sorted(primary.content.split(message_coalescer.separator)) != bodies:
+        problems.append(f"merged body is {primary.content!r}")
+    others = db.query(Message).filter(Message.patient_id == patient.id, Message.id != primary.id).all()
+    if [m.coalesced_into_id for m in others] != [primary.id]:
+        problems.append(f"other message points at {[m.coalesced_into_id for m in others]}")
+    return problems
+
+def main():
+    if config.DATABASE_URL != os.environ["DATABASE_URL"]:
+        # .env overrides the environment; never run against a real database
+        print(f"DATABASE_URL is overridden to {config.DATABASE_URL} (.env?); aborting")
+        sys.exit(2)
+
+    create_tables()
+    db = SessionLocal()
+
+    print("=" * 72)
+    print("Message coalescing")
+    print("=" * 72)
+    failures = []
+    for number, (name, offsets, force_immediate) in enumerate(SCENARIOS):
+        problems = run(db, number, offsets, force_immediate)
+        print(f"  {name:<54}{'ok' if not problems else 'FAIL'}")
+        failures += [f"{name}: {problem}" for problem in problems]
+    db.close()
+
+    print()
+    for failure in failures:
+        print(failure)
+    sys.exit(1 if failures else 0)
+
+if __name__ == "__main__":
+    main()
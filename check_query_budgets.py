@@ -0,0 +1,119 @@
+"""
+Check per-endpoint query budgets
+Seeds a throwaway SQLite database, calls the read endpoints through FastAPI's
+TestClient and fails if one runs more queries than its budget or repeats a
+statement more often than allowed (an N+1 loop). See app/query_metrics.py.
+
+Usage: python check_query_budgets.py
+"""
+import asyncio
+import os
+import sys
+import tempfile
+from datetime import datetime, timedelta
+
+DB_PATH = os.path.join(tempfile.mkdtemp(), "query_budgets.db")
+os.environ["DATABASE_URL"] = f"sqlite:///{DB_PATH}"
+os.environ["DATABASE_READ_URLS"] = ""
+os.environ["ENABLE_CACHING"] = "false"  # Count the queries, not cache hits
+
+from fastapi.testclient import TestClient
+
+from app.config import config
+from app.database import SessionLocal, create_tables, dispose_async_engine
+from app.main import app
+from app.models import (
+    Appointment, Broadcast, Message, MessageStatus, MessageTemplate, MessageType, Patient
+)
+from app.query_metrics import assert_max_queries
+from app.services.patient_stats import patient_stats_service
+from app.templates.default_templates import create_default_templates
+
+# (path, max queries, max times one statement may repeat)
+BUDGETS = [
+    ("/api/patients/", 2, 1),
+    ("/api/patients/?cursor=", 1, 1),
+    ("/api/patients/1", 1, 1),
+    ("/api/appointments/?expand=patient", 2, 1),
+    ("/api/appointments/?patient_email=patient1@example.com", 3, 1),
+    ("/api/messages/?expand=patient,template", 2, 1),
+    ("/api/messages/?cursor=&status=sent", 1, 1),
+    ("/api/templates/", 1, 1),
+    ("/api/broadcasts/", 2, 1),
+    ("/api/audit-logs/", 2, 1),
+    ("/api/metrics/messages", 2, 1),
+    ("/api/metrics/opt-out-rate", 2, 1),
+    ("/api/metrics/recall-effectiveness", 2, 1),
+    ("/api/dashboard/summary", 1, 1),
+]
+
+def seed(db, patients: int = 20):
+    create_default_templates(db)
+    templates = {t.message_type: t for t in db.query(MessageTemplate).all()}
+    now = datetime.now()
+    for i in range(patients):
+        patient = Patient(
+            first_name=f"Patient{i}", last_name="Budget", phone_number=f"+1555{i:07d}",
+            email=f"patient{i}@example.com", consent_sms=i % 5 != 0
+        )
+        db.add(patient)
+        db.flush()
+        for days in (-30, -2, 14):
+            appointment = Appointment(patient_id=patient.id, appointment_date=now + timedelta(days=days), status="scheduled")
+            db.add(appointment)
+            db.flush()
+            db.add(Message(
+                patient_id=patient.id, appointment_id=appointment.id, message_type=MessageType.POST_VISIT,
+                template_id=templates[MessageType.POST_VISIT].id, content="Thanks for visiting",
+                status=MessageStatus.SENT, sent_at=appointment.appointment_date + timedelta(hours=2)
+            ))
+        db.add(Message(
+            patient_id=patient.id, message_type=MessageType.RECALL, template_id=templates[MessageType.RECALL].id,
+            content="Time for your recall visit", status=MessageStatus.SENT, sent_at=now - timedelta(days=5)
+        ))
+    for i in range(3):
+        db.add(Broadcast(
+            name=f"Broadcast {i}", template_id=templates[MessageType.BROADCAST].id,
+            filter_criteria="{}", scheduled_at=now
+        ))
+    db.commit()
+    patient_stats_service.rebuild(db)
+
+def main():
+    if config.DATABASE_URL != os.environ["DATABASE_URL"]:
+        # .env overrides the environment; never run against a real database
+        print(f"DATABASE_URL is overridden to {config.DATABASE_URL} (.env?); aborting")
+        sys.exit(2)
+
+    create_tables()
+    db = SessionLocal()
+    seed(db)
+    db.close()
+
+    print("=" * 72)
+    print("Query budgets")
+    print("=" * 72)
+    print(f"  {'endpoint':<54}{'queries':>9}{'budget':>8}")
+    failures = []
+    client = TestClient(app)
+    for path, limit, max_repeats in BUDGETS:
+        try:
+            with assert_max_queries(limit, max_repeats) as stats:
+                response = client.get(path)
+            status = "ok" if response.status_code == 200 else f"HTTP {response.status_code}"
+        except AssertionError as e:
+            status = "OVER"
+            failures.append(f"{path}: {e}")
+        print(f"  {path:<54}{stats.count:>9}{limit:>8}  {status}")
+
+    # Pooled aiosqlite connections keep their worker threads (and the process) alive
+    asyncio.run(dispose_async_engine())
+
+    print()
+    for failure in failures:
+        print(failure)
+        print()
+    sys.exit(1 if failures else 0)
+
+if __name__ == "__main__":
+    main()
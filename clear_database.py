@@ -13,8 +13,10 @@ sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
 from app.database import SessionLocal, engine
 from app.models import (
     Patient, Appointment, Message, MessageTemplate, Broadcast, 
-    AuditLog, User
+    AuditLog, User, OutboxEvent, PatientStats, ArchivedMessage, ArchivedAuditLog, PendingStatusCallback
 )
+from app.services.patient_stats import patient_stats_service
+from app.services.stat_counters import stat_counter_service
 from sqlalchemy import text
 import logging
 
@@ -49,8 +51,14 @@ def clear_all_data():
         # Delete in correct order (respecting foreign keys)
         logger.info("Deleting data...")
         
-        # Delete messages first (has foreign keys)
+        # Delete outbox events first (they reference messages)
+        deleted_outbox = db.query(OutboxEvent).delete()
+        logger.info(f"Deleted {deleted_outbox} outbox events")
+        db.query(PendingStatusCallback).delete()
+        
+        # Delete messages (has foreign keys)
         deleted_messages = db.query(Message).delete()
+        deleted_messages += db.query(ArchivedMessage).delete()
         logger.info(f"Deleted {deleted_messages} messages")
         
         # Delete appointments
@@ -61,6 +69,9 @@ def clear_all_data():
         deleted_broadcasts = db.query(Broadcast).delete()
         logger.info(f"Deleted {deleted_broadcasts} broadcasts")
         
+        # Delete patient stats (they reference patients)
+        db.query(PatientStats).delete()
+        
         # Delete patients
         deleted_patients = db.query(Patient).delete()
         logger.info(f"Deleted {deleted_patients} patients")
@@ -71,8 +82,12 @@ def clear_all_data():
         
         # Delete audit logs
         deleted_audit_logs = db.query(AuditLog).delete()
+        deleted_audit_logs += db.query(ArchivedAuditLog).delete()
         logger.info(f"Deleted {deleted_audit_logs} audit logs")
         
+        # Bulk deletes bypass incremental maintenance; recompute the dashboard counters
+        stat_counter_service.rebuild(db)
+        
         # Commit all deletions
         db.commit()
         
@@ -94,14 +109,23 @@ def clear_appointments_only():
     """Clear only appointments (keep patients and other data)"""
     db = SessionLocal()
     try:
+        # Delete outbox events for the messages being removed
+        appointment_message_ids = db.query(Message.id).filter(Message.appointment_id != None)
+        db.query(OutboxEvent).filter(OutboxEvent.message_id.in_(appointment_message_ids)).delete(synchronize_session=False)
+        
         # Delete messages related to appointments
         deleted_messages = db.query(Message).filter(Message.appointment_id != None).delete()
+        deleted_messages += db.query(ArchivedMessage).filter(ArchivedMessage.appointment_id != None).delete()
         logger.info(f"Deleted {deleted_messages} appointment-related messages")
         
         # Delete appointments
         deleted_appointments = db.query(Appointment).delete()
         logger.info(f"Deleted {deleted_appointments} appointments")
         
+        # Bulk deletes bypass incremental maintenance; recompute patient stats and counters
+        patient_stats_service.rebuild(db)
+        stat_counter_service.rebuild(db)
+        
         db.commit()
         logger.info("Appointments cleared successfully!")
         
@@ -116,18 +140,28 @@ def clear_patients_only():
     """Clear only patients and their related data"""
     db = SessionLocal()
     try:
+        # Delete outbox events (they reference messages)
+        db.query(OutboxEvent).delete()
+        
         # Delete messages
         deleted_messages = db.query(Message).delete()
+        deleted_messages += db.query(ArchivedMessage).delete()
         logger.info(f"Deleted {deleted_messages} messages")
         
         # Delete appointments
         deleted_appointments = db.query(Appointment).delete()
         logger.info(f"Deleted {deleted_appointments} appointments")
         
+        # Delete patient stats (they reference patients)
+        db.query(PatientStats).delete()
+        
         # Delete patients
         deleted_patients = db.query(Patient).delete()
         logger.info(f"Deleted {deleted_patients} patients")
         
+        # Bulk deletes bypass incremental maintenance; recompute the dashboard counters
+        stat_counter_service.rebuild(db)
+        
         db.commit()
         logger.info("Patients and related data cleared successfully!")
         
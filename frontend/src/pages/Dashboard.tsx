@@ -36,20 +36,14 @@ export default function Dashboard() {
 
   const fetchStats = async () => {
     try {
-      const [patientsRes, appointmentsRes, metricsRes] = await Promise.all([
-        api.get('/patients/'),
-        api.get('/appointments/'),
-        api.get('/metrics/messages'),
-      ])
-
-      const patients = patientsRes.data && patientsRes.data.length > 0 ? patientsRes.data : []
-      const appointments = appointmentsRes.data && appointmentsRes.data.length > 0 ? appointmentsRes.data : []
+      // One request; the backend keeps these counts incrementally
+      const { data } = await api.get('/dashboard/summary')
 
       setStats({
-        patients: patients.length,
-        appointments: appointments.length,
-        messages: metricsRes.data?.total || 0,
-        deliveryRate: metricsRes.data?.delivery_rate || 0,
+        patients: data?.patients?.total || 0,
+        appointments: data?.appointments?.total || 0,
+        messages: data?.messages?.total || 0,
+        deliveryRate: data?.messages?.delivery_rate || 0,
       })
     } catch (error: any) {
       console.error('Error fetching stats:', error)
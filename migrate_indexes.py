@@ -0,0 +1,37 @@
+"""
+Migration script to create indexes declared in app/models.py
+create_tables() only creates indexes for new tables, so run this once to add
+indexes introduced later (e.g. the composite keyset-pagination indexes) to an
+existing database. Already existing indexes are skipped.
+"""
+from app.database import engine
+from app.models import Base
+import logging
+
+logger = logging.getLogger(__name__)
+
+def migrate_indexes():
+    """Create any missing indexes on existing tables"""
+    try:
+        for table in Base.metadata.sorted_tables:
+            for index in sorted(table.indexes, key=lambda i: i.name):
+                index.create(bind=engine, checkfirst=True)
+                logger.info(f"✓ {table.name}.{index.name}")
+
+        print("\n" + "="*50)
+        print("Migration completed successfully!")
+        print("="*50)
+        print("Restart the server to apply changes.\n")
+
+    except Exception as e:
+        logger.error(f"Migration failed: {str(e)}")
+        print(f"\n❌ Error: {str(e)}")
+        raise
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
+    print("="*50)
+    print("Index Migration")
+    print("="*50)
+    print()
+    migrate_indexes()
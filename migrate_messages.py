@@ -0,0 +1,71 @@
+"""
+Migration script to add new columns to the messages table
+Run this once to bring an existing database up to date with app/models.py
+"""
+from sqlalchemy import text
+from app.database import engine
+import logging
+
+logger = logging.getLogger(__name__)
+
+# Columns added to messages after the initial schema: name -> DDL type
+MESSAGE_COLUMNS = {
+    "coalesced_into_id": "INTEGER REFERENCES messages(id)",
+    "claimed_at": "TIMESTAMP",
+}
+
+def migrate_messages():
+    """Add any missing columns to the messages table"""
+    try:
+        with engine.connect() as conn:
+            if engine.url.drivername == 'sqlite':
+                result = conn.execute(text("PRAGMA table_info(messages)"))
+                existing_columns = [row[1] for row in result]
+            else:
+                result = conn.execute(text("""
+                    SELECT column_name
+                    FROM information_schema.columns
+                    WHERE table_name = 'messages'
+                """))
+                existing_columns = [row[0] for row in result]
+
+            for column, ddl in MESSAGE_COLUMNS.items():
+                if column not in existing_columns:
+                    logger.info(f"Adding {column} column to messages table...")
+                    conn.execute(text(f"ALTER TABLE messages ADD COLUMN {column} {ddl}"))
+                    conn.commit()
+                    logger.info(f"✓ {column} column added successfully")
+                else:
+                    logger.info(f"{column} column already exists")
+
+            # PostgreSQL stores MessageStatus as a native enum type
+            if engine.url.get_backend_name() == 'postgresql':
+                conn.execute(text("ALTER TYPE messagestatus ADD VALUE IF NOT EXISTS 'SENDING'"))
+                conn.commit()
+
+            # Index used by the coalescing stage to find merged messages
+            conn.execute(text(
+                "CREATE INDEX IF NOT EXISTS ix_messages_coalesced_into_id ON messages (coalesced_into_id)"
+            ))
+            # Index used by the dispatcher and admission control to find due messages
+            conn.execute(text(
+                "CREATE INDEX IF NOT EXISTS ix_messages_status_scheduled_for ON messages (status, scheduled_for)"
+            ))
+            conn.commit()
+
+        print("\n" + "="*50)
+        print("Migration completed successfully!")
+        print("="*50)
+        print("Restart the server to apply changes.\n")
+
+    except Exception as e:
+        logger.error(f"Migration failed: {str(e)}")
+        print(f"\n❌ Error: {str(e)}")
+        raise
+
+if __name__ == "__main__":
+    print("="*50)
+    print("Messages Table Migration")
+    print("="*50)
+    print()
+    migrate_messages()
@@ -0,0 +1,28 @@
+"""
+Script to rebuild the patient_stats and stat_counters read models from scratch
+Normally both tables are maintained incrementally; run this after bulk imports,
+manual SQL edits or anything else that bypasses the ORM.
+"""
+from app.database import SessionLocal, create_tables
+from app.services.patient_stats import patient_stats_service
+from app.services.stat_counters import stat_counter_service
+import logging
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+if __name__ == "__main__":
+    print("Rebuilding patient stats...")
+    create_tables()
+    db = SessionLocal()
+    try:
+        count = patient_stats_service.rebuild(db)
+        print(f"Patient stats rebuilt for {count} patients.")
+        count = stat_counter_service.rebuild(db)
+        print(f"Dashboard counters rebuilt ({count} counters).")
+    except Exception as e:
+        logger.error(f"Error rebuilding patient stats: {str(e)}")
+        db.rollback()
+        raise
+    finally:
+        db.close()